@@ -49,7 +49,7 @@ sensor = CGMSensor.withName("Dexcom")
 pump = InsulinPump.withName("Insulet")
 patient = T1DPatient.withName("adolescent#001")
 scenario = RandomScenario(start_time=datetime.datetime.now(), seed=42)
-env = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario)
+env = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario, info_level="none")
 state = env.reset()
 
 custom_basal = 0.5
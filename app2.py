@@ -92,7 +92,7 @@ patient = T1DPatient.withName(base_name, init_state=init_state)
 scenario = RandomScenario(start_time=datetime.datetime.now(), seed=42)
 
 # 사용자 제어 시뮬레이션
-env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario)
+env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario, info_level="none")
 env_user.reset()
 bg_user, ins_user = [], []
 
@@ -15,6 +15,7 @@ from simglucose.patient.t1dpatient import T1DPatient
 from simglucose.sensor.cgm import CGMSensor
 from simglucose.actuator.pump import InsulinPump
 from simglucose.controller.base import Action
+from simglucose.analysis.risk import time_in_range
 
 # 세션 상태 초기화
 if "step" not in st.session_state:
@@ -225,12 +226,9 @@ elif st.session_state.step == 2:
 
     # 사용자 시뮬레이션 함수 정의
     def simulate_user_response(env_user, dose_bolus, dose_basal):
-        bg_user, ins_user, ins_ba = [], [], []
-        for bolus in dose_bolus:
-            obs, _, _, _ = env_user.step(Action(basal=dose_basal, bolus=bolus))
-            bg_user.append(obs[0])
-            ins_user.append(bolus)
-            ins_ba.append(dose_basal)
+        bg_user = env_user.run(dose_basal, dose_bolus).CGM.tolist()
+        ins_user = list(dose_bolus)
+        ins_ba = [dose_basal] * len(ins_user)
         return bg_user, ins_user, ins_ba
 
     df = st.session_df
@@ -395,9 +393,13 @@ elif st.session_state.step == 2:
     # 사용자 시뮬레이션 환경 구성
     sensor = CGMSensor.withName("Dexcom")
     pump = InsulinPump.withName("Insulet")
-    patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg)
+    try:
+        patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg)
+    except ValueError:
+        # 이 혈당을 유지하는 기저 인슐린이 없음: 기저 0에서 시작 (혈당이 서서히 내려감)
+        patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg, init_basal=0)
     scenario = RandomScenario(start_time=datetime.datetime.now(), seed=42)
-    env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario)
+    env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario, info_level="none")
     env_user.reset()
 
     # 사용자 시뮬레이션 실행
@@ -505,8 +507,7 @@ elif st.session_state.step == 3:
 
     # 3. TIR 계산 및 막대 시각화
     def compute_tir(bg_series):
-        in_range = np.logical_and(np.array(bg_series) >= 70, np.array(bg_series) <= 180)
-        return 100 * np.sum(in_range) / len(bg_series)
+        return time_in_range(bg_series)
 
     tir_ai = compute_tir(st.session_state.bg_ai)
     tir_user = compute_tir(st.session_state.bg_user)
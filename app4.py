@@ -5,7 +5,6 @@ import numpy as np
 import datetime
 import sys
 import plotly.graph_objects as go
-import copy
 from plotly.subplots import make_subplots
 
 # 사용자 정의 simglucose 경로 설정
@@ -17,6 +16,7 @@ from simglucose.patient.t1dpatient import T1DPatient
 from simglucose.sensor.cgm import CGMSensor
 from simglucose.actuator.pump import InsulinPump
 from simglucose.controller.base import Action
+from simglucose.analysis.risk import time_in_range, range_counts
 
 components.html("""
     <script>
@@ -221,8 +221,9 @@ def summarize_today(basal_list, bolus_list, meal_total, bg_series):
         summary.append("🥗 적절한 식사량이 유지되었습니다.")
 
     # 3. 혈당 패턴 평가
-    hypo = sum(bg < 70 for bg in bg_series)
-    hyper = sum(bg > 180 for bg in bg_series)
+    counts = range_counts(bg_series)
+    hypo = counts["BG<70"]
+    hyper = counts["BG>180"]
 
     if hypo > 5:
         summary.append("⚠️ 저혈당이 여러 차례 발생했습니다. 기저 인슐린을 줄이는 것이 좋겠습니다.")
@@ -452,9 +453,13 @@ for seg in [1, 2, 3]:
         if seg == 1 and "env_user" not in st.session_state:
             sensor = CGMSensor.withName("Dexcom")
             pump = InsulinPump.withName("Insulet")
-            patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg)
+            try:
+                patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg)
+            except ValueError:
+                # 이 혈당을 유지하는 기저 인슐린이 없음: 기저 0에서 시작 (혈당이 서서히 내려감)
+                patient = T1DPatient.withName(st.session_state.selected_patient, init_state=init_bg, init_basal=0)
             scenario = RandomScenario(start_time=datetime.datetime.now(), seed=42)
-            env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario)
+            env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario, info_level="none")
             env_user.reset()
             st.session_state.env_user = env_user
 
@@ -491,10 +496,10 @@ for seg in [1, 2, 3]:
 
         st.subheader("3. 인슐린 주입 후 환자의 혈당 변화를 확인해 보세요.")
         if env_init_key not in st.session_state:
-            st.session_state[env_init_key] = copy.deepcopy(env)
+            st.session_state[env_init_key] = env.snapshot()
 
         if st.button(f"시뮬레이션 {seg} 실행"):
-            env = copy.deepcopy(st.session_state[env_init_key])
+            env.restore(st.session_state[env_init_key])
             result = []
 
             # 1️⃣ 식사 시점 탐지 및 볼루스 주입 시점 설정
@@ -510,7 +515,7 @@ for seg in [1, 2, 3]:
                 obs, _, _, _ = env.step(Action(basal=basal, bolus=bolus))
                 result.append(obs[0])
             st.session_state[bg_key] = result
-            st.session_state[env_result_key] = copy.deepcopy(env)
+            st.session_state[env_result_key] = env.snapshot()
 
             # ⏱ x축: 시작 시간 + 3분 간격 × 스텝
             start_time = datetime.datetime.strptime("00:00", "%H:%M") + datetime.timedelta(minutes=seg * 160 * 3)
@@ -607,7 +612,7 @@ for seg in [1, 2, 3]:
         #         del st.session_state[bg_key]
 
         if st.button("➡️ 다음 구간으로"):
-            st.session_state.env_user = copy.deepcopy(st.session_state[env_result_key])
+            st.session_state.env_user.restore(st.session_state[env_result_key])
             st.session_state.dose_basal = basal
             st.session_state.step += 1
             st.rerun()
@@ -712,8 +717,7 @@ if st.session_state.step == 24:
     # 3. TIR 계산 및 막대 시각화
     st.markdown("하루동안 혈당이 얼마나 정상범위에 머물렀는지 보여줍니다.")
     def compute_tir(bg_series):
-        in_range = np.logical_and(np.array(bg_series) >= 70, np.array(bg_series) <= 180)
-        return 100 * np.sum(in_range) / len(bg_series)
+        return time_in_range(bg_series)
 
     tir_ai = compute_tir(ai_bg)
     tir_user = compute_tir(full_bg)
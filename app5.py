@@ -5,7 +5,6 @@ import numpy as np
 import datetime
 import sys
 import plotly.graph_objects as go
-import copy
 from plotly.subplots import make_subplots
 
 # 사용자 정의 simglucose 경로 설정
@@ -17,6 +16,7 @@ from simglucose.patient.t1dpatient import T1DPatient
 from simglucose.sensor.cgm import CGMSensor
 from simglucose.actuator.pump import InsulinPump
 from simglucose.controller.base import Action
+from simglucose.analysis.risk import time_in_range, range_counts
 
 components.html("""
     <script>
@@ -108,8 +108,9 @@ def summarize_today(basal_list, bolus_list, meal_total, bg_series):
         summary.append("🥗 적절한 식사량이 유지되었습니다.")
 
     # 3. 혈당 패턴 평가
-    hypo = sum(bg < 70 for bg in bg_series)
-    hyper = sum(bg > 180 for bg in bg_series)
+    counts = range_counts(bg_series)
+    hypo = counts["BG<70"]
+    hyper = counts["BG>180"]
 
     if hypo > 5:
         summary.append("⚠️ 저혈당이 여러 차례 발생했습니다. 기저 인슐린을 줄이는 것이 좋겠습니다.")
@@ -425,14 +426,18 @@ for seg in [1, 2, 3]:
         if seg == 1 and env_key not in st.session_state:
             sensor = CGMSensor.withName("Dexcom")
             pump = InsulinPump.withName("Insulet")
-            patient = T1DPatient.withName(st.session_state.selected_patient, init_state=bg_now)
+            try:
+                patient = T1DPatient.withName(st.session_state.selected_patient, init_state=bg_now)
+            except ValueError:
+                # 이 혈당을 유지하는 기저 인슐린이 없음: 기저 0에서 시작 (혈당이 서서히 내려감)
+                patient = T1DPatient.withName(st.session_state.selected_patient, init_state=bg_now, init_basal=0)
             scenario = RandomScenario(start_time=datetime.datetime.now(), seed=42)
-            env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario)
+            env_user = T1DSimEnv(patient=patient, sensor=sensor, pump=pump, scenario=scenario, info_level="none")
             env_user.reset()
             st.session_state[env_key] = env_user
 
         if env_init_key not in st.session_state:
-            st.session_state[env_init_key] = copy.deepcopy(st.session_state[env_key])
+            st.session_state[env_init_key] = st.session_state[env_key].snapshot()
 
         if st.button("📊 시뮬레이션 실행"):
             st.session_state.step += 1
@@ -446,19 +451,19 @@ for seg in [1, 2, 3]:
 
         dose = st.session_state.get(dose_key, 1.0)
         basal = st.session_state.get(basal_key, 0.02)
-        env = copy.deepcopy(st.session_state[env_init_key])
-        result = []
+        env = st.session_state[env_key]
+        env.restore(st.session_state[env_init_key])
 
         meal_times = section_df[section_df["CHO"] >= 10].index.tolist()
         bolus_step = max(meal_times[0] - 10, 0) if meal_times else None
 
-        for t in range(160):
-            bolus = dose if bolus_step == t else 0.0
-            obs, _, _, _ = env.step(Action(basal=basal, bolus=bolus))
-            result.append(obs[0])
+        bolus = np.zeros(160)
+        if bolus_step is not None and bolus_step < len(bolus):
+            bolus[bolus_step] = dose
+        result = env.run(basal, bolus).CGM.tolist()
 
         st.session_state[bg_key] = result
-        st.session_state[env_result_key] = copy.deepcopy(env)
+        st.session_state[env_result_key] = env.snapshot()
 
         # 시각화
         # ⏱ x축: 시작 시간 + 3분 간격 × 스텝
@@ -544,7 +549,7 @@ for seg in [1, 2, 3]:
         bg_final = result[-1]
 
         if st.button("➡️ 다음 구간으로"):
-            st.session_state.env_user = copy.deepcopy(st.session_state[env_result_key])
+            st.session_state.env_user.restore(st.session_state[env_result_key])
             st.session_state.dose_basal = basal
             st.session_state.step += 1
             st.rerun()
@@ -656,7 +661,7 @@ if st.session_state.step == 33:
         """, unsafe_allow_html=True)
 
     if st.button("결과 분석"):
-        st.session_state.env_user = copy.deepcopy(st.session_state[env_result_key])
+        st.session_state.env_user.restore(st.session_state[env_result_key])
         st.session_state.fbg = full_bg
         st.session_state.step = 34
         st.rerun()
@@ -670,8 +675,7 @@ if st.session_state.step == 34:
        
     # 3. TIR 계산 및 막대 시각화
     def compute_tir(bg_series):
-        in_range = np.logical_and(np.array(bg_series) >= 70, np.array(bg_series) <= 180)
-        return 100 * np.sum(in_range) / len(bg_series)
+        return time_in_range(bg_series)
 
     tir_ai = compute_tir(ai_bg)
     tir_user = compute_tir(full_bg)
@@ -1,10 +1,7 @@
-import pandas as pd
-import pkg_resources
+from simglucose.registry import PUMPS, INSULIN_PUMP_PARA_FILE
 import logging
 import numpy as np
 
-INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/pump_params.csv')
 logger = logging.getLogger(__name__)
 
 
@@ -16,17 +13,18 @@ class InsulinPump(object):
 
     @classmethod
     def withName(cls, name):
-        pump_params = pd.read_csv(INSULIN_PUMP_PARA_FILE)
-        params = pump_params.loc[pump_params.Name == name].squeeze()
+        params = PUMPS.byName(name)
         return cls(params)
 
+    # bolus and basal quantize a rate in U/min, a scalar or an array of
+    # rates of pumps of this type
     def bolus(self, amount):
         bol = amount * self.U2PMOL  # convert from U/min to pmol/min
         bol = np.round(bol / self._params['inc_bolus']
                        ) * self._params['inc_bolus']
         bol = bol / self.U2PMOL     # convert from pmol/min to U/min
-        bol = min(bol, self._params['max_bolus'])
-        bol = max(bol, self._params['min_bolus'])
+        bol = np.minimum(bol, self._params['max_bolus'])
+        bol = np.maximum(bol, self._params['min_bolus'])
         return bol
 
     def basal(self, amount):
@@ -34,8 +32,8 @@ class InsulinPump(object):
         bas = np.round(bas / self._params['inc_basal']
                        ) * self._params['inc_basal']
         bas = bas / self.U2PMOL     # convert from pmol/min to U/min
-        bas = min(bas, self._params['max_basal'])
-        bas = max(bas, self._params['min_basal'])
+        bas = np.minimum(bas, self._params['max_basal'])
+        bas = np.maximum(bas, self._params['min_basal'])
         return bas
 
     def reset(self):
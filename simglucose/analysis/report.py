@@ -5,6 +5,7 @@ import os
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.collections import PatchCollection
+from simglucose.analysis.risk import percent_in_ranges, hourly_risk
 # from pandas.plotting import lag_plot
 import logging
 
@@ -74,17 +75,8 @@ def ensemblePlot(df):
 def percent_stats(BG, ax=None):
     if ax is None:
         fig, ax = plt.subplots(1)
-    p_hyper = (BG > 180).sum() / len(BG) * 100
-    p_hyper.name = 'BG>180'
-    p_hypo = (BG < 70).sum() / len(BG) * 100
-    p_hypo.name = 'BG<70'
-    p_normal = ((BG >= 70) & (BG <= 180)).sum() / len(BG) * 100
-    p_normal.name = '70<=BG<=180'
-    p_250 = (BG > 250).sum() / len(BG) * 100
-    p_250.name = 'BG>250'
-    p_50 = (BG < 50).sum() / len(BG) * 100
-    p_50.name = 'BG<50'
-    p_stats = pd.concat([p_normal, p_hyper, p_hypo, p_250, p_50], axis=1)
+    p_stats = pd.DataFrame(
+        percent_in_ranges(BG.to_numpy(dtype=float), axis=0), index=BG.columns)
     p_stats.plot(ax=ax, kind='bar')
     ax.set_ylabel('Percent of time in Range (%)')
     fig.tight_layout()
@@ -93,21 +85,11 @@ def percent_stats(BG, ax=None):
 
 
 def risk_index_trace(df_BG, sample_time=3, window_length=60, visualize=False):
-    step_size = int(window_length / sample_time)  # window size set to 1 hour for calculating Risk Index
-    chunk_BG = [df_BG.iloc[i:i + step_size, :] for i in range(0, len(df_BG), step_size)]
-
-    if len(chunk_BG[-1]) != step_size:  # Remove the last chunk which is not full
-        chunk_BG.pop()
-
-    fBG = [
-        1.509 * (np.log(BG[BG > 0]) ** 1.084 - 5.381) for BG in chunk_BG
-    ]
-
-    rl = [(10 * (fbg * (fbg < 0)) ** 2).mean() for fbg in fBG]
-    rh = [(10 * (fbg * (fbg > 0)) ** 2).mean() for fbg in fBG]
-
-    LBGI = pd.concat(rl, axis=1).transpose()
-    HBGI = pd.concat(rh, axis=1).transpose()
+    # One row per full window (1 hour by default), one column per patient
+    rl, rh, _ = hourly_risk(df_BG.to_numpy(dtype=float), sample_time,
+                            window_length, axis=0)
+    LBGI = pd.DataFrame(rl.T, columns=df_BG.columns)
+    HBGI = pd.DataFrame(rh.T, columns=df_BG.columns)
     RI = LBGI + HBGI
 
     ri_per_hour = pd.concat(
@@ -0,0 +1,190 @@
+"""
+One-at-a-time sensitivity sweeps of the outcome metrics of report.py over
+the patient parameters of vpatient_params.csv.
+
+The sweep settings (scenario, controller, sensor, pump, simulation time) are
+sent to each worker process once, through the pool initializer, and every
+worker builds its patients from its own copy of the parameter table. A task
+is then just (patient name, parameter, factor), and tasks are handed out in
+chunks.
+"""
+from simglucose.registry import PATIENTS
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.patient.population import derive, FREE_FIELDS
+from simglucose.analysis.risk import glycemic_metrics
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.sim_engine import SimObj
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+from multiprocessing import Pool
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SweepConfig = namedtuple("SweepConfig", [
+    "scenario", "controller", "sim_time", "sensor", "pump", "seed", "rebalance"])
+
+METRICS = ["70<=BG<=180", "BG>180", "BG<70", "BG>250", "BG<50",
+           "LBGI", "HBGI", "Risk Index", "mean BG"]
+
+# Settings of the sweep in a worker process, see _init_worker
+_config = None
+
+
+def outcome_metrics(BG, sample_time=3, window_length=60):
+    """
+    The percent time in ranges of report.percent_stats and the mean hourly
+    risk indices of report.risk_index_trace for one BG trace, ordered as
+    METRICS
+    """
+    metrics = glycemic_metrics(BG, sample_time, window_length)
+    return [float(metrics[m]) for m in METRICS]
+
+
+def perturbed_params(name, parameter, factor, rebalance=False):
+    """
+    The parameters of patient name with parameter scaled by factor.
+
+    By default only that parameter changes, so perturbing one that enters
+    the basal equilibrium starts the simulation with a transient. With
+    rebalance=True the equilibrium parameters and the initial state are
+    derived again (see population.derive); parameter must then be one of
+    population.FREE_FIELDS.
+    """
+    params = PATIENTS.byName(name)
+    if parameter is None:
+        return params
+    params = params.copy()
+    if parameter not in params.index:
+        raise KeyError("{} is not a patient parameter.".format(parameter))
+    params[parameter] = params[parameter] * factor
+    if rebalance:
+        if parameter not in FREE_FIELDS:
+            raise ValueError("{} is derived from the other parameters and "
+                             "cannot be rebalanced.".format(parameter))
+        columns, valid = derive({f: np.array([params[f]]) for f in FREE_FIELDS})
+        if not valid[0]:
+            raise ValueError("{} x {} gives no valid equilibrium for {}.".format(
+                parameter, factor, name))
+        for column, value in columns.items():
+            if column in params.index:
+                params[column] = value[0]
+    return params
+
+
+def _init_worker(config):
+    global _config
+    _config = config
+    # Load the parameter table once per process
+    len(PATIENTS)
+
+
+def _run(task):
+    """
+    Simulate one (patient, parameter, factor) task and return its metrics
+    """
+    name, parameter, factor = task
+    config = _config
+    patient = T1DPatient(perturbed_params(name, parameter, factor, config.rebalance))
+    sensor = CGMSensor.withName(config.sensor, seed=config.seed)
+    pump = InsulinPump.withName(config.pump)
+    env = T1DSimEnv(patient, sensor, pump, config.scenario)
+    sim = SimObj(env, config.controller, config.sim_time, animate=False)
+    sim.simulate()
+    BG = sim.results().BG.values
+    return [name, parameter, factor] + outcome_metrics(BG, sensor.sample_time)
+
+
+def sweep(ranges, patients=None, scenario=None, controller=None,
+          sim_time=timedelta(days=1), sensor="Dexcom", pump="Insulet",
+          seed=1, rebalance=False, processes=None, chunksize=None):
+    """
+    Simulate every patient with each parameter of ranges scaled by each of
+    its factors, one parameter at a time, plus an unperturbed baseline.
+    Inputs:
+        - ranges: {parameter: sequence of scale factors}, e.g.
+          {"kabs": [0.8, 1.2], "Vmx": [0.5, 2]}
+        - patients: patient names, all bundled patients by default
+        - scenario, controller: shared by all runs, by default a
+          RandomScenario(seed=seed) starting 2018-01-01 00:00 and a
+          BBController
+        - sensor, pump: names in sensor_params.csv / pump_params.csv
+        - rebalance: keep the perturbed patients at equilibrium, see
+          perturbed_params
+        - processes: worker processes, os.cpu_count() by default; 1 runs
+          in this process
+        - chunksize: tasks per work unit, by default about four units per
+          worker
+    Return a tidy DataFrame with one row per run: patient, parameter
+    (None for the baseline), factor and the METRICS.
+    """
+    if patients is None:
+        patients = PATIENTS.names
+    if scenario is None:
+        scenario = RandomScenario(start_time=datetime(2018, 1, 1, 0, 0, 0), seed=seed)
+    if controller is None:
+        controller = BBController()
+    config = SweepConfig(scenario, controller, sim_time, sensor, pump, seed, rebalance)
+
+    tasks = []
+    for name in patients:
+        tasks.append((name, None, 1.0))
+        for parameter, factors in ranges.items():
+            tasks.extend((name, parameter, float(f)) for f in factors)
+
+    if processes is None:
+        processes = os.cpu_count()
+    if processes == 1:
+        _init_worker(config)
+        rows = [_run(task) for task in tasks]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (4 * processes))
+        with Pool(processes, initializer=_init_worker, initargs=(config,)) as pool:
+            rows = pool.map(_run, tasks, chunksize=chunksize)
+    return pd.DataFrame(rows, columns=["patient", "parameter", "factor"] + METRICS)
+
+
+if __name__ == "__main__":
+    import pickle
+    import time
+
+    ranges = {"kabs": [0.8, 1.2], "Vmx": [0.8, 1.2], "p2u": [0.8, 1.2],
+              "ka1": [0.8, 1.2]}
+    patients = ["adolescent#001", "adult#001", "child#001"]
+    n_runs = len(patients) * (1 + sum(len(f) for f in ranges.values()))
+
+    # What a task costs to ship, compared with the SimObj per run that
+    # sim_engine.batch_sim sends through pathos (dill)
+    print("Bytes pickled per run: sweep task {}".format(
+        len(pickle.dumps(("adult#001", "kabs", 0.8)))))
+    try:
+        import dill
+        scenario = RandomScenario(start_time=datetime(2018, 1, 1, 0, 0, 0), seed=1)
+        sim = SimObj(T1DSimEnv(T1DPatient.withName("adult#001"),
+                               CGMSensor.withName("Dexcom", seed=1),
+                               InsulinPump.withName("Insulet"), scenario),
+                     BBController(), timedelta(days=1), animate=False)
+        print("                       SimObj {}".format(len(dill.dumps(sim))))
+    except ImportError:
+        pass
+
+    for processes in sorted({1, os.cpu_count()}):
+        tic = time.time()
+        df = sweep(ranges, patients, processes=processes)
+        toc = time.time()
+        print("{} runs of 1 day on {} process(es): {:.1f} s".format(
+            n_runs, processes, toc - tic))
+
+    baseline = df[df.parameter.isnull()].set_index("patient")
+    df["delta TIR"] = df["70<=BG<=180"].values - baseline.loc[df.patient, "70<=BG<=180"].values
+    df["delta Risk"] = df["Risk Index"].values - baseline.loc[df.patient, "Risk Index"].values
+    print(df.dropna(subset=["parameter"]).pivot_table(
+        index=["parameter", "factor"], values=["delta TIR", "delta Risk"]).round(2))
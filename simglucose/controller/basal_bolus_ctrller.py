@@ -1,15 +1,12 @@
 from .base import Controller
 from .base import Action
+from simglucose.registry import PATIENTS, QUESTS
+from simglucose.registry import CONTROL_QUEST, PATIENT_PARA_FILE
 import numpy as np
 import pandas as pd
-import pkg_resources
 import logging
 
 logger = logging.getLogger(__name__)
-CONTROL_QUEST = pkg_resources.resource_filename('simglucose',
-                                                'params/Quest.csv')
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/vpatient_params.csv')
 
 
 class BBController(Controller):
@@ -18,9 +15,9 @@ class BBController(Controller):
     Diabetes patient. The performance of this controller can serve as a
     baseline when developing a more advanced controller.
     """
+    STATELESS = True
+
     def __init__(self, target=140):
-        self.quest = pd.read_csv(CONTROL_QUEST)
-        self.patient_params = pd.read_csv(PATIENT_PARA_FILE)
         self.target = target
 
     def policy(self, observation, reward, done, **kwargs):
@@ -49,15 +46,14 @@ class BBController(Controller):
         simulator only accepts insulin rate. Hence the bolus is converted to
         insulin rate.
         """
-        if any(self.quest.Name.str.match(name)):
-            quest = self.quest[self.quest.Name.str.match(name)]
-            params = self.patient_params[self.patient_params.Name.str.match(
-                name)]
-            u2ss = params.u2ss.values.item()  # unit: pmol/(L*kg)
-            BW = params.BW.values.item()  # unit: kg
+        if name in QUESTS:
+            quest = QUESTS.byName(name)
+            params = PATIENTS.byName(name)
+            u2ss = params.u2ss  # unit: pmol/(L*kg)
+            BW = params.BW  # unit: kg
         else:
-            quest = pd.DataFrame([['Average', 1 / 15, 1 / 50, 50, 30]],
-                                 columns=['Name', 'CR', 'CF', 'TDI', 'Age'])
+            quest = pd.Series(['Average', 1 / 15, 1 / 50, 50, 30],
+                              index=['Name', 'CR', 'CF', 'TDI', 'Age'])
             u2ss = 1.43  # unit: pmol/(L*kg)
             BW = 57.0  # unit: kg
 
@@ -67,8 +63,8 @@ class BBController(Controller):
             logger.info(f'Meal = {meal} g/min')
             logger.info(f'glucose = {glucose}')
             bolus = (
-                (meal * env_sample_time) / quest.CR.values + (glucose > 150) *
-                (glucose - self.target) / quest.CF.values).item()  # unit: U
+                (meal * env_sample_time) / quest.CR + (glucose > 150) *
+                (glucose - self.target) / quest.CF)  # unit: U
         else:
             bolus = 0  # unit: U
 
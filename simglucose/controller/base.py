@@ -4,6 +4,18 @@ Action = namedtuple('ctrller_action', ['basal', 'bolus'])
 
 
 class Controller(object):
+    '''
+    Base class of the controllers.
+
+    Simulations checkpointed by sim_engine.SimObj save the controller with
+    snapshot and bring it back with restore, so that a resumed run takes
+    the same actions as an uninterrupted one. A controller that keeps state
+    between policy calls must implement both; one without state can set
+    STATELESS = True instead. Checkpointing any other controller raises
+    NotImplementedError rather than resuming it from a fresh state.
+    '''
+    STATELESS = False
+
     def __init__(self, init_state):
         self.init_state = init_state
         self.state = init_state
@@ -32,3 +44,20 @@ class Controller(object):
         Reset the controller state to inital state, must be implemented
         '''
         raise NotImplementedError
+
+    def snapshot(self):
+        '''
+        Capture the internal state of the controller, None for a STATELESS
+        controller; see the class docstring
+        '''
+        if self.STATELESS:
+            return None
+        raise NotImplementedError(
+            "{} keeps state and must implement snapshot and restore to be "
+            "checkpointed.".format(type(self).__name__))
+
+    def restore(self, snapshot):
+        if snapshot is not None or not self.STATELESS:
+            raise NotImplementedError(
+                "{} keeps state and must implement snapshot and restore to "
+                "be checkpointed.".format(type(self).__name__))
@@ -1,8 +1,10 @@
 from .base import Controller
 from .base import Action
+from collections import namedtuple
 import logging
 
 logger = logging.getLogger(__name__)
+PIDSnapshot = namedtuple("PIDSnapshot", ["integrated_state", "prev_state"])
 
 
 class PIDController(Controller):
@@ -38,3 +40,11 @@ class PIDController(Controller):
     def reset(self):
         self.integrated_state = 0
         self.prev_state = 0
+
+    def snapshot(self):
+        return PIDSnapshot(integrated_state=self.integrated_state,
+                           prev_state=self.prev_state)
+
+    def restore(self, snapshot):
+        self.integrated_state = snapshot.integrated_state
+        self.prev_state = snapshot.prev_state
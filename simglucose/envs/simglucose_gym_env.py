@@ -4,20 +4,15 @@ from simglucose.sensor.cgm import CGMSensor
 from simglucose.actuator.pump import InsulinPump
 from simglucose.simulation.scenario_gen import RandomScenario
 from simglucose.controller.base import Action
+from simglucose.registry import PATIENT_PARA_FILE
+from simglucose import seeding
 import numpy as np
-import pkg_resources
 import gym
 from gym import spaces
-from gym.utils import seeding
 from datetime import datetime
 # import gymnasium
 
 
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
-)
-
-
 class T1DSimEnv(gym.Env):
     """
     A wrapper of simglucose.simulation.env.T1DSimEnv to support gym API
@@ -29,11 +24,25 @@ class T1DSimEnv(gym.Env):
     INSULIN_PUMP_HARDWARE = "Insulet"
 
     def __init__(
-        self, patient_name=None, custom_scenario=None, reward_fun=None, seed=None
+        self,
+        patient_name=None,
+        custom_scenario=None,
+        reward_fun=None,
+        seed=None,
+        event_driven=False,
+        integrator="dopri5",
+        info_level="full",
     ):
         """
         patient_name must be 'adolescent#001' to 'adolescent#010',
         or 'adult#001' to 'adult#010', or 'child#001' to 'child#010'
+        event_driven and integrator select how the patient is integrated,
+        see simglucose.patient.t1dpatient.T1DPatient
+        info_level ("none", "minimal" or "full") selects the info returned
+        by step, see simglucose.simulation.env.T1DSimEnv
+        Episode k draws its patient, sensor and scenario seeds, start hour
+        and patient from seeding.cell_seeds(seed, k), so it does not depend
+        on the episodes before it.
         """
         # have to hard code the patient_name, gym has some interesting
         # error when choosing the patient
@@ -42,8 +51,12 @@ class T1DSimEnv(gym.Env):
 
         self.patient_name = patient_name
         self.reward_fun = reward_fun
-        self.np_random, _ = seeding.np_random(seed=seed)
+        self._seed_sequence = seeding.as_sequence(seed)
+        self._episode = 0
         self.custom_scenario = custom_scenario
+        self.event_driven = event_driven
+        self.integrator = integrator
+        self.info_level = info_level
         self.env, _, _, _ = self._create_env()
 
     def _step(self, action: float):
@@ -62,31 +75,42 @@ class T1DSimEnv(gym.Env):
         return obs
 
     def _seed(self, seed=None):
-        self.np_random, seed1 = seeding.np_random(seed=seed)
+        self._seed_sequence = seeding.as_sequence(seed)
+        self._episode = 0
         self.env, seed2, seed3, seed4 = self._create_env()
-        return [seed1, seed2, seed3, seed4]
+        return [self._seed_sequence.entropy, seed2, seed3, seed4]
 
     def _create_env(self):
-        # Derive a random seed. This gets passed as a uint, but gets
-        # checked as an int elsewhere, so we need to keep it below
-        # 2**31.
-        seed2 = seeding.hash_seed(self.np_random.randint(0, 1000)) % 2**31
-        seed3 = seeding.hash_seed(seed2 + 1) % 2**31
-        seed4 = seeding.hash_seed(seed3 + 1) % 2**31
-
-        hour = self.np_random.randint(low=0.0, high=24.0)
+        # Seeds below 2**31 for the sensor, scenario and patient of this
+        # episode
+        cell = seeding.cell_seeds(self._seed_sequence, self._episode)
+        self._episode += 1
+        seed2, seed3, seed4 = cell.sensor, cell.scenario, cell.patient
+        self.np_random = cell.rng
+
+        hour = int(self.np_random.integers(0, 24))
         start_time = datetime(2018, 1, 1, hour, 0, 0)
 
         if isinstance(self.patient_name, list):
-            patient_name = self.np_random.choice(self.patient_name)
-            patient = T1DPatient.withName(patient_name, random_init_bg=True, seed=seed4)
+            patient_name = self.patient_name[self.np_random.integers(len(self.patient_name))]
+            patient = T1DPatient.withName(
+                patient_name,
+                random_init_bg=True,
+                seed=seed4,
+                event_driven=self.event_driven,
+                integrator=self.integrator,
+            )
         else:
             patient = T1DPatient.withName(
-                self.patient_name, random_init_bg=True, seed=seed4
+                self.patient_name,
+                random_init_bg=True,
+                seed=seed4,
+                event_driven=self.event_driven,
+                integrator=self.integrator,
             )
 
         if isinstance(self.custom_scenario, list):
-            scenario = self.np_random.choice(self.custom_scenario)
+            scenario = self.custom_scenario[self.np_random.integers(len(self.custom_scenario))]
         else:
             scenario = (
                 RandomScenario(start_time=start_time, seed=seed3)
@@ -96,7 +120,7 @@ class T1DSimEnv(gym.Env):
 
         sensor = CGMSensor.withName(self.SENSOR_HARDWARE, seed=seed2)
         pump = InsulinPump.withName(self.INSULIN_PUMP_HARDWARE)
-        env = _T1DSimEnv(patient, sensor, pump, scenario)
+        env = _T1DSimEnv(patient, sensor, pump, scenario, info_level=self.info_level)
         return env, seed2, seed3, seed4
 
     def _render(self, mode="human", close=False):
@@ -0,0 +1,403 @@
+from .base import Patient
+from .t1dpatient import Observation
+from .params import PARAM_FIELDS
+from simglucose.registry import PATIENTS
+import numpy as np
+from scipy.integrate import ode
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_DIM = 13
+
+
+class BatchT1DPatient(Patient):
+    """
+    N virtual patients advanced in lockstep.
+
+    The patients share one clock and one dopri5 integrator over the
+    flattened (N, 13) state matrix, and the right-hand side evaluates all of
+    them with array operations. Each row reproduces T1DPatient.step: meal
+    announcement, eating detection with _last_Qsto/_last_foodtaken tracking,
+    and the non-negativity clamps of the model.
+
+    dopri5 accepts a step when the RMS of the scaled error over all N x 13
+    components is below 1, so with the tolerances of T1DPatient one row
+    could carry up to sqrt(N) times its own error bound. The tolerances are
+    divided by sqrt(N): the squared RMS over the batch is then the sum of
+    the squared RMS of the rows under the T1DPatient tolerances, and every
+    row meets them. The rows still share step sizes, so a row does not
+    reproduce its T1DPatient exactly. Over 10 hours with a meal, the
+    largest Gsub difference grows with N, from 2e-10 mg/dL for one patient
+    to about 3e-5 for 10 and 3e-4 for 30 to 100. That is the size of the
+    T1DPatient's own error against a tightly integrated solution.
+    """
+    SAMPLE_TIME = 1  # min
+    EAT_RATE = 5  # g/min CHO
+    # Tolerances of the scalar T1DPatient (scipy's dopri5 defaults), per row
+    RTOL = 1e-6
+    ATOL = 1e-12
+
+    def __init__(self, params, init_state=None, random_init_bg=False, seed=None, t0=0):
+        """
+        BatchT1DPatient constructor.
+        Inputs:
+            - params: a pandas DataFrame with one row per patient, in the
+              layout of vpatient_params.csv
+            - init_state: customized (N, 13) initial state.
+              If not specified, load the default initial states in
+              params.iloc[:, 2:15]
+            - seed: None, an integer shared by all patients, or a sequence of
+              N seeds (used when random_init_bg is True)
+            - t0: simulation start time, it is 0 by default
+        """
+        params = params.reset_index(drop=True)
+        self._param_matrix = params.loc[:, list(PARAM_FIELDS)].to_numpy(dtype=float)
+        self._default_state = params.iloc[:, 2:15].to_numpy(dtype=float)
+        self.names = list(params.Name)
+        self._init(init_state, random_init_bg, seed, t0)
+
+    def _init(self, init_state=None, random_init_bg=False, seed=None, t0=0):
+        self._init_state = init_state
+        self.random_init_bg = random_init_bg
+        self._seed = seed
+        self.t0 = t0
+        self.reset()
+
+    @classmethod
+    def withIDs(cls, patient_ids, **kwargs):
+        """
+        Construct patients by patient_id, see T1DPatient.withID
+        """
+        params = PATIENTS.frame().iloc[[i - 1 for i in patient_ids], :]
+        return cls(params, **kwargs)
+
+    @classmethod
+    def withNames(cls, names, **kwargs):
+        """
+        Construct patients by name, see T1DPatient.withName
+        """
+        params = PATIENTS.frame().set_index("Name", drop=False).loc[list(names)]
+        return cls(params, **kwargs)
+
+    @classmethod
+    def fromArrays(cls, param_matrix, default_state, names=None, **kwargs):
+        """
+        Construct patients from an (N, P) parameter matrix ordered as
+        PARAM_FIELDS and their (N, 13) default initial states, without a
+        DataFrame. names defaults to "patient#1", "patient#2", ...
+        """
+        self = cls.__new__(cls)
+        self._param_matrix = np.array(param_matrix, dtype=float)
+        self._default_state = np.array(default_state, dtype=float)
+        if names is None:
+            names = ["patient#{}".format(i + 1) for i in range(len(self._param_matrix))]
+        self.names = list(names)
+        self._init(**kwargs)
+        return self
+
+    @classmethod
+    def withPopulation(cls, population, indices, **kwargs):
+        """
+        Construct the patients at indices of a population.Population
+        """
+        return cls.fromArrays(population.param_matrix(indices),
+                              population.init_states(indices),
+                              names=[population.name(i) for i in indices],
+                              **kwargs)
+
+    @property
+    def n(self):
+        return self._param_matrix.shape[0]
+
+    @property
+    def params(self):
+        """(N, P) parameter matrix, columns ordered as PARAM_FIELDS"""
+        return self._param_matrix
+
+    @property
+    def state(self):
+        return self._odesolver.y.reshape(self.n, STATE_DIM)
+
+    @property
+    def t(self):
+        return self._odesolver.t
+
+    @property
+    def sample_time(self):
+        return self.SAMPLE_TIME
+
+    def step(self, CHO, insulin):
+        """
+        Run one time step for all patients.
+        CHO and insulin are scalars or (N,) arrays in g/min and U/min.
+        """
+        CHO = np.broadcast_to(np.asarray(CHO, dtype=float), (self.n,))
+        insulin = np.broadcast_to(np.asarray(insulin, dtype=float),
+                                  (self.n,)).copy()
+
+        # Convert announcing meal to the meal amount to eat at the moment
+        to_eat = self._announce_meal(CHO)
+
+        # Detect eating or not and update last digestion amount
+        starts = (to_eat > 0) & (self._last_CHO <= 0)
+        if starts.any():
+            logger.info("t = {}, patients {} start eating ...".format(
+                self.t, np.flatnonzero(starts)))
+            state = self.state
+            self._last_Qsto[starts] = state[starts, 0] + state[starts, 1]
+            self._last_foodtaken[starts] = 0
+            self.is_eating[starts] = True
+
+        self._last_foodtaken[self.is_eating] += to_eat[self.is_eating]
+
+        # Detect eating ended
+        ends = (to_eat <= 0) & (self._last_CHO > 0)
+        if ends.any():
+            logger.info("t = {}, patients {} finish eating!".format(
+                self.t, np.flatnonzero(ends)))
+            self.is_eating[ends] = False
+
+        # Update last input
+        self._last_CHO = to_eat
+        self._last_insulin = insulin
+
+        # ODE solver
+        self._odesolver.set_f_params(to_eat, insulin, self._param_matrix,
+                                     self._last_Qsto.copy(),
+                                     self._last_foodtaken.copy())
+        if self._odesolver.successful():
+            self._odesolver.integrate(self._odesolver.t + self.sample_time)
+        else:
+            logger.error("ODE solver failed!!")
+            raise RuntimeError("ODE solver failed")
+
+    @staticmethod
+    def _flat_model(t, y, CHO, insulin, params, last_Qsto, last_foodtaken):
+        x = y.reshape(-1, STATE_DIM)
+        return BatchT1DPatient.model(t, x, CHO, insulin, params, last_Qsto,
+                                     last_foodtaken).ravel()
+
+    @staticmethod
+    def model(t, x, CHO, insulin, params, last_Qsto, last_foodtaken):
+        """
+        Vectorized T1DPatient.model: x is (N, 13), params is (N, P) ordered
+        as PARAM_FIELDS, the remaining inputs are (N,) arrays.
+        """
+        (BW, u2ss, kmax, kmin, b, d_, kabs, f, kp1, kp2, kp3, Fsnc, ke1, ke2,
+         k1, k2, Vm0, Vmx, Km0, m1, m2, m4, m30, ka1, ka2, kd, Vi, Ib, p2u,
+         ki, ksc, _) = params.T
+        x0, x1, x2, x3, x4, x5, x6, x7, x8, x9, x10, x11, x12 = x.T
+        dxdt = np.empty_like(x)
+
+        d = CHO * 1000  # g -> mg
+        ins = insulin * 6000 / BW  # U/min -> pmol/kg/min
+
+        # Glucose in the stomach
+        qsto = x0 + x1
+        Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
+
+        # Stomach solid
+        dxdt[:, 0] = -kmax * x0 + d
+
+        eating = Dbar > 0
+        Dsafe = np.where(eating, Dbar, 1.0)
+        aa = 5 / (2 * Dsafe * (1 - b))
+        cc = 5 / (2 * Dsafe * d_)
+        kgut = np.where(
+            eating,
+            kmin + (kmax - kmin) / 2 * (np.tanh(aa * (qsto - b * Dsafe))
+                                        - np.tanh(cc * (qsto - d_ * Dsafe))
+                                        + 2),
+            kmax)
+
+        # stomach liquid
+        dxdt[:, 1] = kmax * x0 - x1 * kgut
+
+        # intestine
+        dxdt[:, 2] = kgut * x1 - kabs * x2
+
+        # Rate of appearance
+        Rat = f * kabs * x2 / BW
+        # Glucose Production
+        EGPt = kp1 - kp2 * x3 - kp3 * x8
+
+        # renal excretion
+        Et = np.where(x3 > ke2, ke1 * (x3 - ke2), 0)
+
+        # glucose kinetics
+        dxdt[:, 3] = (np.maximum(EGPt, 0) + Rat - Fsnc - Et - k1 * x3
+                      + k2 * x4) * (x3 >= 0)
+
+        Uidt = (Vm0 + Vmx * x6) * x4 / (Km0 + x4)
+        dxdt[:, 4] = (-Uidt + k1 * x3 - k2 * x4) * (x4 >= 0)
+
+        # insulin kinetics
+        dxdt[:, 5] = (-(m2 + m4) * x5 + m1 * x9 + ka1 * x10
+                      + ka2 * x11) * (x5 >= 0)
+        It = x5 / Vi
+
+        # insulin action on glucose utilization
+        dxdt[:, 6] = -p2u * x6 + p2u * (It - Ib)
+
+        # insulin action on production
+        dxdt[:, 7] = -ki * (x7 - It)
+
+        dxdt[:, 8] = -ki * (x8 - x7)
+
+        # insulin in the liver (pmol/kg)
+        dxdt[:, 9] = (-(m1 + m30) * x9 + m2 * x5) * (x9 >= 0)
+
+        # subcutaneous insulin kinetics
+        dxdt[:, 10] = (ins - (ka1 + kd) * x10) * (x10 >= 0)
+
+        dxdt[:, 11] = (kd * x10 - ka2 * x11) * (x11 >= 0)
+
+        # subcutaneous glucose
+        dxdt[:, 12] = (-ksc * x12 + ksc * x3) * (x12 >= 0)
+
+        return dxdt
+
+    @property
+    def observation(self):
+        """
+        return the observation of every patient as (N,) arrays
+        """
+        GM = self.state[:, 12]  # subcutaneous glucose (mg/kg)
+        Gsub = GM / self._param_matrix[:, PARAM_FIELDS.index("Vg")]
+        return Observation(Gsub=Gsub)
+
+    def _announce_meal(self, meal):
+        """
+        Vectorized T1DPatient._announce_meal
+        """
+        self.planned_meal = self.planned_meal + meal
+        planned = self.planned_meal > 0
+        to_eat = np.where(planned, np.minimum(self.EAT_RATE, self.planned_meal), 0.0)
+        self.planned_meal = np.where(
+            planned, np.maximum(0, self.planned_meal - to_eat), self.planned_meal)
+        return to_eat
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @seed.setter
+    def seed(self, seed):
+        self._seed = seed
+        self.reset()
+
+    def _seeds(self):
+        if self._seed is None or np.ndim(self._seed) == 0:
+            return [self._seed] * self.n
+        if len(self._seed) != self.n:
+            raise ValueError("seed must be None, an integer or a sequence of N seeds.")
+        return list(self._seed)
+
+    @staticmethod
+    def _randomize(states, seeds):
+        # Only randomize glucose related states, x4, x5, and x13, drawing
+        # from the same per-patient streams as T1DPatient
+        for i, seed in enumerate(seeds):
+            random_state = np.random.RandomState(seed)
+            mean = states[i, [3, 4, 12]]
+            cov = np.diag(0.1 * mean)
+            states[i, [3, 4, 12]] = random_state.multivariate_normal(mean, cov)
+
+    def set_patients(self, rows, param_matrix, default_state, names):
+        """
+        Replace the patients of rows: their (k, P) parameters ordered as
+        PARAM_FIELDS, (k, 13) default initial states and names. The new
+        patients start at the next reset_rows of these rows.
+        """
+        self._param_matrix[rows] = param_matrix
+        self._default_state[rows] = default_state
+        for i, name in zip(np.atleast_1d(rows), names):
+            self.names[i] = name
+
+    def reset_rows(self, rows, init_state=None, seeds=None):
+        """
+        Restart the patients of rows at the current time, from init_state
+        ((k, 13)) or else from their default initial states. These are
+        randomized as in reset with seeds, one per row, if given, or else
+        with the seeds of the rows when random_init_bg is set. The other
+        patients continue undisturbed, but the integrator restarts its step
+        size control.
+        """
+        rows = np.atleast_1d(np.asarray(rows, dtype=int))
+        if init_state is None:
+            init_state = self._default_state[rows].copy()
+            if seeds is None and self.random_init_bg:
+                seeds = [self._seeds()[i] for i in rows]
+            if seeds is not None:
+                self._randomize(init_state, seeds)
+        else:
+            init_state = np.array(init_state, dtype=float).reshape(len(rows), STATE_DIM)
+
+        state = self.state.copy()
+        state[rows] = init_state
+        self._last_Qsto[rows] = init_state[:, 0] + init_state[:, 1]
+        self._last_foodtaken[rows] = 0
+        self._last_CHO[rows] = 0
+        self._last_insulin[rows] = 0
+        self.is_eating[rows] = False
+        self.planned_meal[rows] = 0
+        self._odesolver.set_initial_value(state.ravel(), self.t)
+
+    def reset(self):
+        """
+        Reset all patients to their intial states
+        """
+        if self._init_state is None:
+            self.init_state = self._default_state.copy()
+        else:
+            init_state = np.array(self._init_state, dtype=float)
+            if init_state.shape != (self.n, STATE_DIM):
+                raise ValueError("init_state must be None or an (N, 13) array.")
+            self.init_state = init_state
+
+        if self.random_init_bg:
+            self._randomize(self.init_state, self._seeds())
+
+        self._last_Qsto = self.init_state[:, 0] + self.init_state[:, 1]
+        self._last_foodtaken = np.zeros(self.n)
+
+        scale = np.sqrt(self.n)
+        self._odesolver = ode(self._flat_model).set_integrator(
+            "dopri5", rtol=self.RTOL / scale, atol=self.ATOL / scale)
+        self._odesolver.set_initial_value(self.init_state.ravel(), self.t0)
+
+        self._last_CHO = np.zeros(self.n)
+        self._last_insulin = np.zeros(self.n)
+        self.is_eating = np.zeros(self.n, dtype=bool)
+        self.planned_meal = np.zeros(self.n)
+
+
+if __name__ == "__main__":
+    import time
+    from .t1dpatient import T1DPatient, Action
+
+    names = PATIENTS.names
+    batch = BatchT1DPatient.withNames(names)
+    basal = batch.params[:, 1] * batch.params[:, 0] / 6000  # U/min
+
+    tic = time.time()
+    while batch.t < 600:
+        carb = 80 if batch.t == 100 else 0
+        batch.step(carb, basal)
+    toc = time.time()
+    print("Batch of {} patients, 600 min: {:.2f} s".format(batch.n, toc - tic))
+
+    tic = time.time()
+    Gsub = []
+    for name, ins in zip(names, basal):
+        p = T1DPatient.withName(name)
+        while p.t < 600:
+            carb = 80 if p.t == 100 else 0
+            p.step(Action(CHO=carb, insulin=ins))
+        Gsub.append(p.observation.Gsub)
+    toc = time.time()
+    print("{} single patients, 600 min: {:.2f} s".format(len(names), toc - tic))
+    print("Max |Gsub difference|: {:.2e} mg/dL".format(
+        np.max(np.abs(batch.observation.Gsub - np.array(Gsub)))))
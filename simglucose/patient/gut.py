@@ -0,0 +1,347 @@
+"""
+Tabulated meal absorption.
+
+The gut states of T1DPatient.model (x0 - x2) and the rate of glucose
+appearance Ra = f * kabs * x2 / BW depend only on the patient parameters, the
+initial gut state and the meals, never on insulin. A GutTrace holds these
+states at every simulated minute for one (patient, meal sequence) pair, so
+runs that share a scenario (e.g. a controller comparison) can integrate the
+glucose/insulin states only and read Ra from the table.
+"""
+import numpy as np
+from scipy.integrate import ode
+from .solver import EventDrivenSolver, METHODS
+from collections import namedtuple, OrderedDict
+import hashlib
+import threading
+import logging
+import zipfile
+import os
+
+logger = logging.getLogger(__name__)
+
+# to_eat: (M,) g/min actually eaten in each minute (after meal announcement)
+# gut: (M + 1, 3) gut states at every minute
+# x2_slope: (M, 2) dx2/dt at the start and end of each minute, under the
+#   inputs of that minute, for cubic Hermite interpolation of x2
+GutTrace = namedtuple("GutTrace", ["to_eat", "gut", "x2_slope"])
+
+
+def gut_model(t, x, CHO, params, last_Qsto, last_foodtaken):
+    """
+    The gut block of T1DPatient.model, x = (x0, x1, x2)
+    """
+    dxdt = np.empty(3)
+    kmax = params.kmax
+    qsto = x[0] + x[1]
+    Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
+
+    dxdt[0] = -kmax * x[0] + CHO * 1000
+
+    if Dbar > 0:
+        b = params.b
+        aa = 5 / (2 * Dbar * (1 - b))
+        cc = 5 / (2 * Dbar * params.d)
+        kgut = params.kmin + params.kmax_kmin / 2 * (
+            np.tanh(aa * (qsto - b * Dbar))
+            - np.tanh(cc * (qsto - params.d * Dbar))
+            + 2
+        )
+    else:
+        kgut = kmax
+
+    dxdt[1] = kmax * x[0] - x[1] * kgut
+    dxdt[2] = kgut * x[1] - params.kabs * x[2]
+    return dxdt
+
+
+def compute_gut_trace(params, init_gut, meals, eat_rate=5):
+    """
+    Integrate the gut alone over len(meals) one-minute steps.
+
+    params is a PatientParams record, init_gut the initial (x0, x1, x2) and
+    meals the CHO (g/min) passed to T1DPatient.step at every minute. The
+    meal announcement and eating bookkeeping follow T1DPatient.step.
+    """
+    meals = np.asarray(meals, dtype=float)
+    M = len(meals)
+    to_eat = np.zeros(M)
+    gut = np.zeros((M + 1, 3))
+    x2_slope = np.zeros((M, 2))
+    gut[0] = init_gut
+
+    solver = ode(gut_model).set_integrator("dopri5")
+    solver.set_initial_value(gut[0], 0)
+    last_Qsto = gut[0, 0] + gut[0, 1]
+    last_foodtaken = 0
+    last_CHO = 0
+    is_eating = False
+    planned_meal = 0
+    for k in range(M):
+        planned_meal += meals[k]
+        if planned_meal > 0:
+            CHO = min(eat_rate, planned_meal)
+            planned_meal = max(0, planned_meal - CHO)
+        else:
+            CHO = 0
+
+        if CHO > 0 and last_CHO <= 0:
+            last_Qsto = gut[k, 0] + gut[k, 1]
+            last_foodtaken = 0
+            is_eating = True
+        if is_eating:
+            last_foodtaken += CHO
+        if CHO <= 0 and last_CHO > 0:
+            is_eating = False
+        last_CHO = CHO
+
+        args = (CHO, params, last_Qsto, last_foodtaken)
+        solver.set_f_params(*args)
+        gut[k + 1] = solver.integrate(k + 1)
+        if not solver.successful():
+            logger.error("ODE solver failed!!")
+            raise RuntimeError("ODE solver failed")
+        to_eat[k] = CHO
+        x2_slope[k, 0] = gut_model(k, gut[k], *args)[2]
+        x2_slope[k, 1] = gut_model(k + 1, gut[k + 1], *args)[2]
+
+    return GutTrace(to_eat=to_eat, gut=gut, x2_slope=x2_slope)
+
+
+def meal_sequence(scenario, minutes, start_time=None):
+    """
+    The meal (g/min) a T1DSimEnv feeds its patient at each of the next
+    minutes of scenario, from start_time (scenario.start_time by default).
+    The scenario is returned to its current state afterwards.
+    """
+    from datetime import timedelta
+
+    snapshot = scenario.snapshot()
+    if start_time is None:
+        meals = [scenario.get_action_minute(k).meal for k in range(minutes)]
+    else:
+        meals = [scenario.get_action(start_time + timedelta(minutes=k)).meal
+                 for k in range(minutes)]
+    meals = np.array(meals, dtype=float)
+    scenario.restore(snapshot)
+    return meals
+
+
+class GutTraceCache(object):
+    """
+    LRU cache of GutTraces keyed by (patient parameters, initial gut state,
+    meal sequence). With a cache_dir, traces are also written there as .npz
+    files and reused across processes.
+    """
+    def __init__(self, maxsize=64, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(params, init_gut, meals):
+        h = hashlib.sha1()
+        h.update(params.to_array().tobytes())
+        h.update(np.asarray(init_gut, dtype=float).tobytes())
+        h.update(np.asarray(meals, dtype=float).tobytes())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, "gut_{}.npz".format(key))
+
+    def get(self, params, init_gut, meals):
+        """
+        Return the GutTrace of params, init_gut and meals, computing it on a
+        miss
+        """
+        key = self.key(params, init_gut, meals)
+        with self._lock:
+            if key in self._traces:
+                self._traces.move_to_end(key)
+                self.hits += 1
+                return self._traces[key]
+
+        trace = None
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            trace = self._load(key)
+        if trace is None:
+            trace = compute_gut_trace(params, init_gut, meals)
+            if self.cache_dir is not None:
+                self._save(key, trace)
+
+        with self._lock:
+            self.misses += 1
+            self._traces[key] = trace
+            while len(self._traces) > self.maxsize:
+                self._traces.popitem(last=False)
+        return trace
+
+    def _load(self, key):
+        """
+        The GutTrace in the file of key, None if it cannot be read
+        """
+        try:
+            with np.load(self._path(key)) as f:
+                trace = GutTrace(**{name: f[name] for name in GutTrace._fields})
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+            logger.warning("Unreadable gut trace file {}, recomputing it.".format(
+                self._path(key)))
+            return None
+        logger.debug("Loaded gut trace {}".format(key))
+        return trace
+
+    def _save(self, key, trace):
+        """
+        Write the file of key atomically, so that other processes never
+        read it half-written
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        filename = self._path(key)
+        tmp = "{}.{}.{}.tmp.npz".format(filename[:-4], os.getpid(),
+                                        threading.get_ident())
+        try:
+            np.savez(tmp, **trace._asdict())
+            os.replace(tmp, filename)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+GUT_TRACES = GutTraceCache()
+
+
+def tabulate_meals(patient, scenario, minutes, cache=GUT_TRACES):
+    """
+    Switch patient to tabulated meal absorption for the next minutes of
+    scenario, starting from the patient's initial state
+    """
+    meals = meal_sequence(scenario, minutes)
+    patient.gut_trace = cache.get(patient._model_params,
+                                  patient.init_state[:3], meals)
+
+
+class TabulatedGutSolver(EventDrivenSolver):
+    """
+    An EventDrivenSolver that reads the gut states from a GutTrace and only
+    integrates x3 - x12. x2, and with it Ra, is the piecewise cubic Hermite
+    interpolant of the tabulated states and slopes, so the solver keeps
+    running across minutes until the insulin or meal input changes.
+
+    The integrated inputs must match the trace: a step whose CHO differs
+    from trace.to_eat, or that runs past its end, raises ValueError.
+    """
+    def __init__(self, f, trace, t0=0, rtol=1e-6, atol=1e-12):
+        """
+        f is T1DPatient.model
+        """
+        super().__init__(f, rtol=rtol, atol=atol)
+        self.trace = trace
+        self.t0 = t0
+
+    def set_f_params(self, action, params, last_Qsto, last_foodtaken):
+        # The gut derivatives are discarded, so skip the kgut branch with
+        # Dbar = 0. This also keeps the solver running across the per-minute
+        # updates of last_foodtaken during a meal.
+        return super().set_f_params(action, params, 0, 0)
+
+    def _restart(self):
+        f = self.f
+        args = self._f_params
+        t0 = self.t0
+        gut = self.trace.gut
+        x2_slope = self.trace.x2_slope
+        last = len(x2_slope) - 1
+        x = self.y.copy()
+
+        def fun(t, x_rest):
+            k = min(int(t - t0), last)
+            s = t - t0 - k
+            s2 = s * s
+            s3 = s2 * s
+            x[2] = ((2 * s3 - 3 * s2 + 1) * gut[k, 2]
+                    + (s3 - 2 * s2 + s) * x2_slope[k, 0]
+                    + (-2 * s3 + 3 * s2) * gut[k + 1, 2]
+                    + (s3 - s2) * x2_slope[k, 1])
+            x[3:] = x_rest
+            return f(t, x, *args)[3:]
+
+        self._solver = METHODS[self.method](fun, self.t, self.y[3:], np.inf,
+                                            rtol=self.rtol, atol=self.atol)
+        self._interp = None
+        self.nrestarts += 1
+
+    def integrate(self, t):
+        trace = self.trace
+        k = int(round(t - self.t0)) - 1
+        if k >= len(trace.to_eat):
+            raise ValueError("The gut trace ends at t = {}".format(
+                self.t0 + len(trace.to_eat)))
+        if self._f_params[0].CHO != trace.to_eat[k]:
+            raise ValueError("t = {}, CHO {} does not match the gut trace ({})".format(
+                self.t, self._f_params[0].CHO, trace.to_eat[k]))
+
+        y = np.empty(13)
+        y[3:] = self._solve_to(t)
+        y[:3] = trace.gut[k + 1]
+        self.y = y
+        self.t = t
+        return self.y
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+    from datetime import datetime
+    from .t1dpatient import T1DPatient, Action
+    from simglucose.simulation.scenario_gen import RandomScenario
+
+    minutes = 1440
+    scenario = RandomScenario(datetime(2018, 1, 1, 6), seed=1)
+    meals = meal_sequence(scenario, minutes)
+    # Controllers to compare: basal multipliers and insulin-to-carb ratios
+    controllers = [(m, cr) for m in (0.8, 1.0, 1.2) for cr in (8, 10, 15)]
+    cache = GutTraceCache(cache_dir=tempfile.mkdtemp())
+
+    def run(patient):
+        basal = patient._model_params.basal
+        BG = []
+        for m, cr in controllers:
+            patient.reset()
+            for k in range(minutes):
+                patient.step(Action(CHO=meals[k],
+                                    insulin=m * basal + meals[k] / cr))
+                BG.append(patient.observation.Gsub)
+        return np.array(BG)
+
+    print("{} controllers on one scenario, {} min".format(len(controllers), minutes))
+    for name in ("adolescent#001", "adult#001", "child#001"):
+        p = T1DPatient.withName(name)
+        tic = time.time()
+        BG0 = run(p)
+        t_full = time.time() - tic
+        tic = time.time()
+        run(T1DPatient.withName(name, event_driven=True))
+        t_event = time.time() - tic
+
+        tic = time.time()
+        tabulate_meals(p, scenario, minutes, cache=cache)
+        t_trace = time.time() - tic
+        tic = time.time()
+        BG1 = run(p)
+        t_tab = time.time() - tic
+        print("{}: full model {:.2f} s (event-driven {:.2f} s), tabulated "
+              "{:.2f} s + {:.2f} s for the trace, max |BG - full| {:.2e} "
+              "mg/dL".format(name, t_full, t_event, t_tab, t_trace,
+                             np.max(np.abs(BG0 - BG1))))
+
+    cache.clear()
+    tic = time.time()
+    tabulate_meals(T1DPatient.withName("adult#001"), scenario, minutes, cache=cache)
+    print("Trace reloaded from disk in {:.3f} s".format(time.time() - tic))
@@ -0,0 +1,179 @@
+import numpy as np
+from scipy.linalg import expm
+from .solver import EventDrivenSolver, METHODS, IMPLICIT_METHODS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Plasma (x5), liver (x9) and subcutaneous (x10, x11) insulin
+INSULIN_STATES = np.array([5, 9, 10, 11])
+# Gut, glucose, insulin action and subcutaneous glucose states
+GLUCOSE_STATES = np.array([0, 1, 2, 3, 4, 6, 7, 8, 12])
+
+
+class InsulinSubsystem(object):
+    """
+    The insulin compartments of T1DPatient.model, dz/dt = A z + B u with
+    z = (x5, x9, x10, x11) and u the insulin rate in U/min.
+
+    A is a Metzler matrix and B >= 0, so z stays non-negative for
+    non-negative inputs and the clamps of the model never act on it. Under a
+    constant u the subsystem can then be advanced exactly:
+        z(h) = Phi(h) z(0) + Gamma(h) u
+    with Phi and Gamma taken from one matrix exponential per step length.
+    """
+    def __init__(self, params):
+        """
+        params: a PatientParams record
+        """
+        self.A = np.array([
+            [-params.m2_m4, params.m1, params.ka1, params.ka2],
+            [params.m2, -params.m1_m30, 0, 0],
+            [0, 0, -params.ka1_kd, 0],
+            [0, 0, params.kd, -params.ka2],
+        ])
+        self.B = np.array([0, 0, params.ins_scale, 0])
+        self._A_inv_B = np.linalg.solve(self.A, self.B)
+        self._propagators = {}
+
+        lam, V = np.linalg.eig(self.A)
+        # Real and distinct eigenvalues for every bundled patient; otherwise
+        # fall back to a matrix exponential per evaluation
+        self._diagonal = (not np.iscomplexobj(lam)
+                          and np.linalg.cond(V) < 1e8)
+        if self._diagonal:
+            self._lam = lam
+            self._V = V
+            self._V_inv = np.linalg.inv(V)
+
+    def propagator(self, h):
+        """
+        (Phi, Gamma) advancing the subsystem by h minutes, cached per h
+        """
+        if h not in self._propagators:
+            M = np.zeros((5, 5))
+            M[:4, :4] = self.A
+            M[:4, 4] = self.B
+            E = expm(M * h)
+            self._propagators[h] = (E[:4, :4], E[:4, 4])
+        return self._propagators[h]
+
+    def advance(self, z, insulin, h):
+        Phi, Gamma = self.propagator(h)
+        return Phi.dot(z) + Gamma * insulin
+
+    def steady_state(self, insulin):
+        return -self._A_inv_B * insulin
+
+    def trajectory(self, z, insulin):
+        """
+        Return a function of s giving z(s) for s minutes after z
+        """
+        zss = self.steady_state(insulin)
+        if self._diagonal:
+            W = self._V * self._V_inv.dot(z - zss)
+            lam = self._lam
+            return lambda s: zss + W.dot(np.exp(lam * s))
+
+        A = self.A
+        dz = z - zss
+        return lambda s: zss + expm(A * s).dot(dz)
+
+
+class SplitInsulinSolver(EventDrivenSolver):
+    """
+    An EventDrivenSolver that advances the linear insulin compartments
+    exactly with InsulinSubsystem and only integrates the nonlinear
+    gut/glucose states (GLUCOSE_STATES) numerically. Inside the numerical
+    solver the insulin states follow their exact trajectory from the last
+    restart; at the requested times they are advanced with the cached
+    propagator of the step length.
+
+    This takes the insulin kinetics, and with them the time scale of the
+    subcutaneous depot after a bolus, out of the step size control.
+    """
+    def __init__(self, f, params, method="RK45", jac=None, rtol=1e-6, atol=1e-12):
+        """
+        f is T1DPatient.model and params the patient's PatientParams
+        """
+        super().__init__(f, method=method, jac=jac, rtol=rtol, atol=atol)
+        self.insulin = InsulinSubsystem(params)
+
+    def _restart(self):
+        f = self.f
+        args = self._f_params
+        t0 = self.t
+        z_of = self.insulin.trajectory(self.y[INSULIN_STATES], args[0].insulin)
+        x = self.y.copy()
+
+        def fun(t, g):
+            x[GLUCOSE_STATES] = g
+            x[INSULIN_STATES] = z_of(t - t0)
+            return f(t, x, *args)[GLUCOSE_STATES]
+
+        kwargs = {}
+        if self.jac is not None and self.method in IMPLICIT_METHODS:
+            jac = self.jac
+
+            def jac_fun(t, g):
+                x[GLUCOSE_STATES] = g
+                x[INSULIN_STATES] = z_of(t - t0)
+                return jac(t, x, *args)[np.ix_(GLUCOSE_STATES, GLUCOSE_STATES)]
+
+            kwargs["jac"] = jac_fun
+        self._solver = METHODS[self.method](fun, t0, self.y[GLUCOSE_STATES],
+                                            np.inf, rtol=self.rtol,
+                                            atol=self.atol, **kwargs)
+        self._interp = None
+        self.nrestarts += 1
+
+    def integrate(self, t):
+        y = np.empty(13)
+        y[GLUCOSE_STATES] = self._solve_to(t)
+        y[INSULIN_STATES] = self.insulin.advance(
+            self.y[INSULIN_STATES], self._f_params[0].insulin, t - self.t)
+        self.y = y
+        self.t = t
+        return self.y
+
+
+if __name__ == "__main__":
+    import time
+    from simglucose.registry import PATIENTS
+    from .t1dpatient import T1DPatient, Action
+
+    class CountingT1DPatient(T1DPatient):
+        """Counts evaluations of the model, whichever integrator is used"""
+        nfev = 0
+
+        @staticmethod
+        def model(t, x, action, params, last_Qsto, last_foodtaken):
+            CountingT1DPatient.nfev += 1
+            return T1DPatient.model(t, x, action, params, last_Qsto, last_foodtaken)
+
+    minutes = 1440
+    meals = {420: 50, 720: 70, 1080: 80}  # min: g CHO
+
+    print("{} patients, 3 meals with boluses, {} min".format(len(PATIENTS), minutes))
+    reference = None
+    for label, kwargs in [("dopri5 per minute", {}),
+                          ("RK45 event-driven", {"event_driven": True}),
+                          ("split", {"integrator": "split"})]:
+        CountingT1DPatient.nfev = 0
+        BG = []
+        tic = time.time()
+        for name in PATIENTS.names:
+            p = CountingT1DPatient.withName(name, **kwargs)
+            basal = p._model_params.basal
+            for k in range(minutes):
+                carb = meals.get(k, 0)
+                p.step(Action(CHO=carb, insulin=basal + carb / 10.0))
+                BG.append(p.observation.Gsub)
+        toc = time.time()
+        BG = np.array(BG)
+        if reference is None:
+            reference = BG
+        print("{:18s}: {:8d} RHS evaluations, {:6.2f} s, "
+              "max |BG - dopri5| {:.2e} mg/dL".format(
+                  label, CountingT1DPatient.nfev, toc - tic,
+                  np.max(np.abs(BG - reference))))
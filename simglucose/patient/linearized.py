@@ -0,0 +1,217 @@
+"""
+Linearized, discretized surrogate of a virtual patient for short-horizon BG
+prediction.
+
+Around an operating point (x0, insulin u0, meal status) the model is
+    dx/dt ~ f0 + A (x - x0) + B (u - u0)
+with A the analytic jacobian, f0 the model derivative at the operating point
+(zero only at an equilibrium) and B the input columns for insulin (U/min)
+and CHO (g/min). Holding the inputs over each sample time h gives
+    dx[k+1] = Ad dx[k] + Bd du[k] + cd
+and H-step predictions of the observed glucose are affine in the input
+sequence, so whole batches of candidate sequences cost one matrix product.
+"""
+from .t1dpatient import T1DPatient, Action
+from .params import PatientParams
+from scipy.linalg import expm
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LinearizedPatient(object):
+    def __init__(self, params, x0, basal, CHO=0, last_Qsto=0, last_foodtaken=0,
+                 sample_time=3, horizon=20, output="Gsub"):
+        """
+        LinearizedPatient constructor.
+        Inputs:
+            - params: a PatientParams record or a row of vpatient_params.csv
+            - x0, basal, CHO: operating point state (13,) and inputs
+              (U/min, g/min)
+            - last_Qsto, last_foodtaken: meal status, as in T1DPatient.model
+            - sample_time: minutes the inputs are held, e.g. the CGM sample
+              time
+            - horizon: number of samples predicted
+            - output: "Gsub" (subcutaneous glucose, what the CGM sees) or
+              "BG" (plasma glucose)
+        """
+        if not isinstance(params, PatientParams):
+            params = PatientParams.from_series(params)
+        if output not in ("Gsub", "BG"):
+            raise ValueError('output must be "Gsub" or "BG".')
+        self.params = params
+        self.x0 = np.array(x0, dtype=float)
+        self.u0 = np.array([basal, CHO], dtype=float)
+        self.sample_time = sample_time
+        self.horizon = horizon
+
+        action = Action(CHO=CHO, insulin=basal)
+        args = (action, params, last_Qsto, last_foodtaken)
+        self.A = T1DPatient.jacobian(0, self.x0, *args)
+        self.f0 = T1DPatient.model(0, self.x0, *args)
+        self.B = np.zeros((13, 2))
+        self.B[10, 0] = params.ins_scale  # insulin, U/min -> pmol/kg/min
+        self.B[0, 1] = 1000  # CHO, g -> mg
+
+        # Zero-order hold: expm([[A, B, f0], [0, 0, 0]] h)
+        M = np.zeros((16, 16))
+        M[:13, :13] = self.A
+        M[:13, 13:15] = self.B
+        M[:13, 15] = self.f0
+        E = expm(M * sample_time)
+        self.Ad = E[:13, :13]
+        self.Bd = E[:13, 13:15]
+        self.cd = E[:13, 15]
+
+        self.C = np.zeros(13)
+        self.C[12 if output == "Gsub" else 3] = 1 / params.Vg
+        self._prediction_matrices()
+
+    @classmethod
+    def fromPatient(cls, patient, basal=None, **kwargs):
+        """
+        Linearize around the current state and meal status of a T1DPatient.
+        basal defaults to the patient's last insulin rate.
+        """
+        if basal is None:
+            basal = patient._last_action.insulin
+        return cls(patient._model_params, patient.state, basal,
+                   CHO=patient._last_action.CHO,
+                   last_Qsto=patient._last_Qsto,
+                   last_foodtaken=patient._last_foodtaken, **kwargs)
+
+    def _prediction_matrices(self):
+        """
+        y[k] = y0 + O[k] dx[0] + F[k] + sum_j G[k, j] du[j] for k = 1..H
+        """
+        H = self.horizon
+        O = np.zeros((H, 13))
+        F = np.zeros(H)
+        G = np.zeros((H, H, 2))
+
+        # Markov parameters C Ad^i Bd and the drift sum C (Ad^0 + ... ) cd
+        CAd = self.C.copy()
+        markov = np.zeros((H, 2))
+        drift = 0.0
+        for i in range(H):
+            markov[i] = CAd.dot(self.Bd)
+            drift += CAd.dot(self.cd)
+            F[i] = drift
+            CAd = CAd.dot(self.Ad)
+            O[i] = CAd
+        for k in range(H):
+            G[k, :k + 1] = markov[k::-1]
+
+        self.y0 = self.C.dot(self.x0)
+        self.O = O
+        self.F = F
+        self.G_insulin = G[:, :, 0]
+        self.G_CHO = G[:, :, 1]
+
+    def predict(self, insulin, CHO=0, x=None):
+        """
+        Predict the output at the next horizon samples.
+        Inputs:
+            - insulin: (H,) or a batch (N, H) of insulin rates (U/min), one
+              per sample
+            - CHO: scalar, (H,) or (N, H) CHO rates (g/min)
+            - x: state to predict from, the operating point by default
+        Return (H,) or (N, H) glucose in mg/dL.
+        """
+        insulin = np.asarray(insulin, dtype=float)
+        du = insulin - self.u0[0]
+        y = self.y0 + self.F + du.dot(self.G_insulin.T)
+        dCHO = np.broadcast_to(np.asarray(CHO, dtype=float) - self.u0[1],
+                               du.shape)
+        if dCHO.any():
+            y = y + dCHO.dot(self.G_CHO.T)
+        if x is not None:
+            y = y + self.O.dot(np.asarray(x, dtype=float) - self.x0)
+        return y
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import pandas as pd
+
+    data_dir = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+    sample_time = 3  # min, the files are sampled at the Dexcom rate
+    horizon = 20  # samples, 60 min
+    every = 10  # linearize every 30 min
+    candidates = 100
+
+    errors = []
+    meal_in_window = []
+    t_full = t_linear = t_batch = 0.0
+    n = 0
+    for fname in sorted(os.listdir(data_dir)):
+        if not fname.endswith("_100_500.csv"):
+            continue
+        df = pd.read_csv(os.path.join(data_dir, fname))
+        name = fname[:-len("_100_500.csv")]
+        p = T1DPatient.withName(name)
+        np.random.seed(0)
+
+        # The CSV holds per-sample averages of the announced meals. Both
+        # paths get the same input: the rate actually eaten, held over each
+        # sample as predict assumes. Meals are spread at up to EAT_RATE, and
+        # announcing at most EAT_RATE each minute makes the patient eat
+        # exactly that rate.
+        cho = np.zeros(len(df))
+        pending = 0.0
+        for k in range(len(df)):
+            pending += df.CHO[k] * sample_time
+            cho[k] = min(pending / sample_time, p.EAT_RATE)
+            pending -= cho[k] * sample_time
+
+        def sample_step(k):
+            for m in range(sample_time):
+                p.step(Action(CHO=cho[k], insulin=df.insulin[k]))
+
+        for k in range(len(df) - 1):
+            if k % every == 0 and k + horizon < len(df):
+                snapshot = p.snapshot()
+                tic = time.time()
+                truth = []
+                for j in range(k, k + horizon):
+                    sample_step(j)
+                    truth.append(p.observation.Gsub)
+                t_full += time.time() - tic
+                p.restore(snapshot)
+
+                tic = time.time()
+                lin = LinearizedPatient.fromPatient(
+                    p, basal=df.insulin[k], sample_time=sample_time, horizon=horizon)
+                pred = lin.predict(df.insulin[k:k + horizon].values,
+                                   cho[k:k + horizon])
+                t_linear += time.time() - tic
+
+                U = np.clip(df.insulin[k] + 0.02 * np.random.randn(candidates, horizon),
+                            0, None)
+                tic = time.time()
+                lin.predict(U)
+                t_batch += time.time() - tic
+
+                errors.append(pred - np.array(truth))
+                meal_in_window.append(cho[k:k + horizon].any() or p.is_eating)
+                n += 1
+            sample_step(k)
+
+    errors = np.abs(np.array(errors))
+    meal_in_window = np.array(meal_in_window)
+    print("{} predictions along the data/*_100_500.csv inputs, horizon {} min, "
+          "|surrogate - full simulation| in mg/dL".format(n, horizon * sample_time))
+    for label, rows in [("no meal", ~meal_in_window),
+                        ("meal in window", meal_in_window)]:
+        print("  {} ({} predictions)".format(label, rows.sum()))
+        for minutes in (15, 30, 60):
+            e = errors[rows, minutes // sample_time - 1]
+            print("    {:2d} min ahead: mean {:.2f}, 95th pct {:.2f}, max {:.2f}".format(
+                minutes, e.mean(), np.percentile(e, 95), e.max()))
+    print("Full simulation:  {:.2f} ms per prediction".format(1e3 * t_full / n))
+    print("Surrogate:        {:.2f} ms to linearize and predict".format(
+        1e3 * t_linear / n))
+    print("  {} candidates: {:.3f} ms per batch (full simulation ~{:.0f} ms)".format(
+        candidates, 1e3 * t_batch / n, 1e3 * t_full / n * candidates))
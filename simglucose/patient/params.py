@@ -0,0 +1,97 @@
+import numpy as np
+
+
+# Parameters read by the patient model, in the column order of the (N, P)
+# parameter matrix of BatchT1DPatient
+PARAM_FIELDS = (
+    "BW", "u2ss", "kmax", "kmin", "b", "d", "kabs", "f", "kp1", "kp2", "kp3",
+    "Fsnc", "ke1", "ke2", "k1", "k2", "Vm0", "Vmx", "Km0", "m1", "m2", "m4",
+    "m30", "ka1", "ka2", "kd", "Vi", "Ib", "p2u", "ki", "ksc", "Vg",
+)
+
+# Constants derived once from PARAM_FIELDS
+DERIVED_FIELDS = (
+    "basal",  # U/min, u2ss * BW / 6000
+    "ins_scale",  # U/min -> pmol/kg/min, 6000 / BW
+    "kmax_kmin",  # kmax - kmin
+    "Ra_scale",  # f * kabs / BW
+    "inv_Vi",  # 1 / Vi
+    "inv_Vg",  # 1 / Vg
+    "m2_m4",  # m2 + m4
+    "m1_m30",  # m1 + m30
+    "ka1_kd",  # ka1 + kd
+)
+
+
+class PatientParams(object):
+    """
+    Compiled, read-only record of the parameters T1DPatient.model reads.
+
+    Looking up a slot is much cheaper than attribute access on the pandas
+    Series the patient is constructed from, and the model runs many times per
+    simulated minute.
+    """
+    __slots__ = ("Name",) + PARAM_FIELDS + DERIVED_FIELDS
+
+    def __init__(self, Name, **values):
+        set_ = object.__setattr__
+        set_(self, "Name", Name)
+        for field in PARAM_FIELDS:
+            set_(self, field, float(values[field]))
+
+        set_(self, "basal", self.u2ss * self.BW / 6000)
+        set_(self, "ins_scale", 6000 / self.BW)
+        set_(self, "kmax_kmin", self.kmax - self.kmin)
+        set_(self, "Ra_scale", self.f * self.kabs / self.BW)
+        set_(self, "inv_Vi", 1 / self.Vi)
+        set_(self, "inv_Vg", 1 / self.Vg)
+        set_(self, "m2_m4", self.m2 + self.m4)
+        set_(self, "m1_m30", self.m1 + self.m30)
+        set_(self, "ka1_kd", self.ka1 + self.kd)
+
+    @classmethod
+    def from_series(cls, params):
+        """
+        Compile a row of vpatient_params.csv (a pandas Series or a dict)
+        """
+        return cls(params["Name"], **{f: params[f] for f in PARAM_FIELDS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PatientParams is read-only")
+
+    def __reduce__(self):
+        return (_from_dict, (self.Name, {f: getattr(self, f) for f in PARAM_FIELDS}))
+
+    def __repr__(self):
+        return "PatientParams(Name={!r})".format(self.Name)
+
+    def to_array(self):
+        """Parameters as a float array ordered as PARAM_FIELDS"""
+        return np.array([getattr(self, f) for f in PARAM_FIELDS])
+
+
+def _from_dict(name, values):
+    return PatientParams(name, **values)
+
+
+if __name__ == "__main__":
+    import time
+    from .t1dpatient import T1DPatient, Action
+
+    p = T1DPatient.withName("adolescent#001")
+    x = p.state.copy()
+    action = Action(CHO=0, insulin=p._model_params.basal)
+    n = 2000
+
+    def evals_per_sec(params):
+        tic = time.time()
+        for _ in range(n):
+            T1DPatient.model(0, x, action, params, p._last_Qsto, 0)
+        return n / (time.time() - tic)
+
+    before = evals_per_sec(p._params)
+    after = evals_per_sec(p._model_params)
+    print("RHS evaluations per second")
+    print("  pandas Series:  {:12.0f}".format(before))
+    print("  PatientParams:  {:12.0f}".format(after))
+    print("  speedup:        {:12.1f}x".format(after / before))
@@ -0,0 +1,221 @@
+"""
+Synthetic virtual populations.
+
+For each age group of vpatient_params.csv (adolescent, adult, child) the
+free model parameters are fitted with a multivariate normal in log space and
+sampled. The parameters that pin the basal equilibrium (Gpb, Ipb, Ilb, u2ss,
+the subcutaneous steady state, Gtb, Vm0, kp1) are then derived from the
+sampled ones exactly as in the original table, so every synthetic patient
+starts at equilibrium at its basal rate.
+
+A population is stored as a float64 array of shape (F, N), one row per
+column of COLUMNS, next to a JSON sidecar, and read back memory-mapped by
+Population.
+"""
+from .params import PARAM_FIELDS
+from simglucose.registry import PATIENTS
+import numpy as np
+import pandas as pd
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parameters drawn from the fitted distribution
+FREE_FIELDS = (
+    "BW", "EGPb", "Gb", "Ib", "kabs", "kmax", "kmin", "b", "d", "Vg", "Vi",
+    "Vmx", "Km0", "k2", "k1", "p2u", "m1", "m2", "m4", "m30", "ki", "kp2",
+    "kp3", "f", "ke1", "ke2", "Fsnc", "kd", "ksc", "ka1", "ka2",
+)
+# Initial state columns of vpatient_params.csv
+STATE_COLUMNS = tuple("x0_{:2d}".format(i) for i in range(1, 14))
+# Rows of a population array
+COLUMNS = STATE_COLUMNS + PARAM_FIELDS
+
+
+def fit(frame=None):
+    """
+    Fit the log-space distribution of FREE_FIELDS per age group.
+    Return {group: (mean, cov, lo, hi)}, where lo/hi bound the accepted
+    log values: the observed range widened by half its width on both sides.
+    """
+    if frame is None:
+        frame = PATIENTS.frame()
+    groups = frame.Name.str.split("#").str[0]
+    fits = {}
+    for group in groups.unique():
+        logs = np.log(frame.loc[groups == group, list(FREE_FIELDS)].to_numpy(dtype=float))
+        lo = logs.min(axis=0)
+        hi = logs.max(axis=0)
+        # The absolute term admits the parameters shared by all patients
+        margin = 0.5 * (hi - lo) + 1e-9
+        fits[group] = (logs.mean(axis=0), np.cov(logs, rowvar=False),
+                       lo - margin, hi + margin)
+    return fits
+
+
+def derive(free):
+    """
+    Complete a dict of FREE_FIELDS arrays with the equilibrium parameters
+    and the initial state. Return (columns, valid), columns a dict over
+    COLUMNS and valid a mask of physiologically usable samples.
+    """
+    p = dict(free)
+    Gpb = p["Gb"] * p["Vg"]
+    Ipb = p["Ib"] * p["Vi"]
+    Ilb = p["m2"] * Ipb / (p["m1"] + p["m30"])
+    # Insulin balance: (m2 + m4) Ipb = m1 Ilb + ka1 isc1 + ka2 isc2
+    u2ss = (p["m2"] + p["m4"]) * Ipb - p["m1"] * Ilb
+    isc1ss = u2ss / (p["kd"] + p["ka1"])
+    isc2ss = p["kd"] * isc1ss / p["ka2"]
+    # Glucose balance: EGPb = Fsnc + Et + k1 Gpb - k2 Gtb, Uidb = EGPb - Fsnc - Et
+    Et = np.where(Gpb > p["ke2"], p["ke1"] * (Gpb - p["ke2"]), 0)
+    Gtb = (p["Fsnc"] + Et - p["EGPb"] + p["k1"] * Gpb) / p["k2"]
+    Uidb = p["EGPb"] - p["Fsnc"] - Et
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p["Vm0"] = Uidb * (p["Km0"] + Gtb) / Gtb
+    p["kp1"] = p["EGPb"] + p["kp2"] * Gpb + p["kp3"] * p["Ib"]
+    p["u2ss"] = u2ss
+
+    valid = ((p["b"] < 1) & (p["d"] < 1) & (p["kmin"] < p["kmax"])
+             & (Gtb > 0) & (Uidb > 0))
+
+    zero = np.zeros_like(Gpb)
+    state = (zero, zero, zero, Gpb, Gtb, Ipb, zero, p["Ib"], p["Ib"], Ilb,
+             isc1ss, isc2ss, Gpb)
+    columns = dict(zip(STATE_COLUMNS, state))
+    columns.update((f, p[f]) for f in PARAM_FIELDS)
+    return columns, valid
+
+
+def generate(n, groups=None, weights=None, seed=None, fits=None):
+    """
+    Sample n patients. groups defaults to all age groups, in equal shares
+    unless weights are given. Return the (F, n) array, rows ordered as
+    COLUMNS, and a list of (group, start, count).
+    """
+    if fits is None:
+        fits = fit()
+    if groups is None:
+        groups = list(fits)
+    if weights is None:
+        weights = np.ones(len(groups))
+    weights = np.asarray(weights, dtype=float)
+    counts = np.floor(n * weights / weights.sum()).astype(int)
+    counts[:n - counts.sum()] += 1
+
+    rng = np.random.default_rng(seed)
+    out = np.empty((len(COLUMNS), n))
+    layout = []
+    start = 0
+    for group, count in zip(groups, counts):
+        mean, cov, lo, hi = fits[group]
+        filled = 0
+        while filled < count:
+            logs = rng.multivariate_normal(mean, cov, size=2 * (count - filled) + 16,
+                                           method="eigh")
+            logs = logs[np.all((logs >= lo) & (logs <= hi), axis=1)]
+            columns, valid = derive(dict(zip(FREE_FIELDS, np.exp(logs).T)))
+            take = np.flatnonzero(valid)[:count - filled]
+            for row, column in enumerate(COLUMNS):
+                out[row, start + filled:start + filled + len(take)] = columns[column][take]
+            filled += len(take)
+        layout.append((group, int(start), int(count)))
+        start += count
+    return out, layout
+
+
+def write_population(path, n, groups=None, weights=None, seed=None):
+    """
+    Generate n patients and write them to path.npy (the (F, n) array) and
+    path.json (columns and group layout). Return a Population.
+    """
+    data, layout = generate(n, groups=groups, weights=weights, seed=seed)
+    np.save(path + ".npy", data)
+    with open(path + ".json", "w") as f:
+        json.dump({"columns": list(COLUMNS), "groups": layout, "n": n,
+                   "seed": seed}, f, indent=2)
+    return Population(path)
+
+
+class Population(object):
+    """
+    A population written by write_population, memory-mapped. Patients are
+    addressed by integer index; patient i of group g is named
+    "g#s000001" and so on, counting within the group.
+    """
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            self.meta = json.load(f)
+        if tuple(self.meta["columns"]) != COLUMNS:
+            raise ValueError("{} has an unexpected column layout.".format(path))
+        self.path = path
+        self.data = np.load(path + ".npy", mmap_mode="r")
+        self._starts = np.array([start for _, start, _ in self.meta["groups"]])
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def column(self, name):
+        """A column as a memory-mapped (N,) view"""
+        return self.data[COLUMNS.index(name)]
+
+    def name(self, i):
+        g = np.searchsorted(self._starts, i, side="right") - 1
+        group, start, _ = self.meta["groups"][g]
+        return "{}#s{:06d}".format(group, i - start + 1)
+
+    def init_states(self, indices):
+        """(k, 13) initial states of the patients at indices"""
+        return np.array(self.data[:13, indices].T)
+
+    def param_matrix(self, indices):
+        """(k, P) parameters of the patients at indices, ordered as PARAM_FIELDS"""
+        return np.array(self.data[13:, indices].T)
+
+    def series(self, i):
+        """
+        Patient i as a pandas Series in the layout of vpatient_params.csv
+        """
+        values = [self.name(i), i + 1] + list(self.data[:, i])
+        return pd.Series(values, index=["Name", "i"] + list(COLUMNS))
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import tempfile
+    from .t1dpatient import T1DPatient, Action
+    from .batch_t1dpatient import BatchT1DPatient
+
+    n = 100000
+    path = os.path.join(tempfile.mkdtemp(), "population")
+    tic = time.time()
+    pop = write_population(path, n, seed=1)
+    toc = time.time()
+    print("Generated and wrote {} patients in {:.2f} s ({:.1f} MB)".format(
+        n, toc - tic, os.path.getsize(path + ".npy") / 1e6))
+
+    table = PATIENTS.frame()
+    print("{:6s} {:>22s} {:>22s}".format("", "table min / max", "synthetic 1-99 pct"))
+    for column in ("BW", "kabs", "u2ss", "Vm0", "kp1"):
+        values = pop.column(column)
+        print("{:6s} {:10.3f} / {:9.3f} {:10.3f} / {:9.3f}".format(
+            column, table[column].min(), table[column].max(),
+            np.percentile(values, 1), np.percentile(values, 99)))
+
+    # Every synthetic patient should rest at its basal equilibrium
+    indices = np.random.default_rng(0).choice(n, 200, replace=False)
+    batch = BatchT1DPatient.withPopulation(pop, indices)
+    basal = batch.params[:, 1] * batch.params[:, 0] / 6000
+    BG0 = batch.observation.Gsub
+    while batch.t < 600:
+        batch.step(0, basal)
+    print("Basal drift of 200 patients over 600 min: max {:.2e} mg/dL".format(
+        np.max(np.abs(batch.observation.Gsub - BG0))))
+
+    p = T1DPatient.withPopulation(pop, int(indices[0]))
+    while p.t < 600:
+        p.step(Action(CHO=50 if p.t == 60 else 0, insulin=p._model_params.basal))
+    print("{}: BG {:.1f} mg/dL at t = 600 after a 50 g meal".format(
+        p.name, p.observation.Gsub))
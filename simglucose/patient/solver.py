@@ -0,0 +1,200 @@
+import numpy as np
+from scipy.integrate import RK45, BDF, Radau
+import logging
+
+logger = logging.getLogger(__name__)
+
+METHODS = {
+    "RK45": RK45,
+    "BDF": BDF,
+    "Radau": Radau,
+}
+# Methods that use a Jacobian
+IMPLICIT_METHODS = ("BDF", "Radau")
+
+
+class EventDrivenSolver(object):
+    """
+    A stand-in for scipy.integrate.ode as T1DPatient uses it, which keeps a
+    single adaptive solver running for as long as the model inputs
+    (f_params) stay the same.
+
+    scipy.integrate.ode restarts dopri5 on every integrate call, i.e. once per
+    simulated minute. Here the solver takes its natural step size across
+    spans of unchanged inputs (steady basal, no CHO) and is only restarted
+    when set_f_params receives new inputs, e.g. at a meal or a bolus.
+    Intermediate times such as sensor sample times are read from the dense
+    output of the current step.
+
+    method is one of METHODS. The implicit ones (BDF, Radau) suit the
+    stiff dynamics after large boluses; pass jac with the signature of f to
+    give them an analytic Jacobian instead of finite differences.
+    """
+    def __init__(self, f, method="RK45", jac=None, rtol=1e-6, atol=1e-12):
+        if method not in METHODS:
+            raise ValueError("method must be one of {}".format(list(METHODS)))
+        self.f = f
+        self.jac = jac
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.t = 0.0
+        self.y = None
+        self.nsteps = 0  # accepted solver steps
+        self.nrestarts = 0
+        self._f_params = None
+        self._solver = None
+        self._interp = None
+
+    def set_initial_value(self, y, t=0.0):
+        self.y = np.array(y, dtype=float)
+        self.t = t
+        self._solver = None
+        return self
+
+    def set_f_params(self, *args):
+        if args != self._f_params:
+            self._f_params = args
+            self._solver = None
+        return self
+
+    def successful(self):
+        return self._solver is None or self._solver.status != "failed"
+
+    def _restart(self):
+        f = self.f
+        args = self._f_params
+
+        def fun(t, y):
+            return f(t, y, *args)
+
+        kwargs = {}
+        if self.jac is not None and self.method in IMPLICIT_METHODS:
+            jac = self.jac
+
+            def jac_fun(t, y):
+                return jac(t, y, *args)
+
+            kwargs["jac"] = jac_fun
+        self._solver = METHODS[self.method](fun, self.t, self.y, np.inf,
+                                            rtol=self.rtol, atol=self.atol,
+                                            **kwargs)
+        self._interp = None
+        self.nrestarts += 1
+
+    def _solve_to(self, t):
+        """
+        Step the running solver past t and return its solution at t
+        """
+        if self._solver is None:
+            self._restart()
+
+        solver = self._solver
+        while solver.t < t:
+            message = solver.step()
+            self.nsteps += 1
+            self._interp = None
+            if solver.status == "failed":
+                logger.error("ODE solver failed!!")
+                raise RuntimeError(message)
+
+        if solver.t == t:
+            return solver.y.copy()
+        if self._interp is None:
+            self._interp = solver.dense_output()
+        return self._interp(t)
+
+    def integrate(self, t):
+        self.y = self._solve_to(t)
+        self.t = t
+        return self.y
+
+
+def _benchmark_event_driven(days=3):
+    """
+    Solver steps per simulated day with and without event-driven integration
+    for a BB-controlled random scenario
+    """
+    import time
+    from datetime import datetime, timedelta
+    from simglucose.simulation.env import T1DSimEnv
+    from simglucose.simulation.scenario_gen import RandomScenario
+    from simglucose.simulation.sim_engine import SimObj
+    from simglucose.sensor.cgm import CGMSensor
+    from simglucose.actuator.pump import InsulinPump
+    from simglucose.controller.basal_bolus_ctrller import BBController
+
+    print("Event-driven integration, adolescent#001, {} days".format(days))
+    for event_driven in (False, True):
+        patient = _CountingT1DPatient.withName("adolescent#001", event_driven=event_driven)
+        env = T1DSimEnv(patient, CGMSensor.withName("Dexcom", seed=1),
+                        InsulinPump.withName("Insulet"),
+                        RandomScenario(datetime(2018, 1, 1, 0, 0, 0), seed=1))
+        sim = SimObj(env, BBController(), timedelta(days=days), animate=False)
+        tic = time.time()
+        sim.simulate()
+        toc = time.time()
+        label = "event-driven RK45" if event_driven else "dopri5 per minute"
+        print("{:18s}: {:7.0f} solver steps per day, {:.2f} s per day, "
+              "mean BG {:.2f}".format(label, patient.solver_steps / days,
+                                      (toc - tic) / days,
+                                      sim.results().BG.mean()))
+
+
+def _benchmark_stiff(minutes=720):
+    """
+    Explicit vs implicit integrators on all bundled patients with three large
+    meals, each covered by an aggressive one-minute bolus
+    """
+    import time
+    from simglucose.registry import PATIENTS
+    from .t1dpatient import Action
+
+    meals = {60: 100, 300: 120, 540: 100}  # min: g CHO
+    bolus = 25  # U delivered within one minute
+
+    print("Aggressive bolus scenario, {} patients, {} min".format(
+        len(PATIENTS), minutes))
+    reference = None
+    for label, kwargs in [("dopri5 per minute", {}),
+                          ("RK45 event-driven", {"event_driven": True}),
+                          ("BDF + jacobian", {"integrator": "BDF"}),
+                          ("Radau + jacobian", {"integrator": "Radau"})]:
+        steps = 0
+        BG = []
+        tic = time.time()
+        for name in PATIENTS.names:
+            p = _CountingT1DPatient.withName(name, **kwargs)
+            basal = p._model_params.basal
+            for k in range(minutes):
+                carb = meals.get(k, 0)
+                p.step(Action(CHO=carb, insulin=basal + (bolus if carb else 0)))
+                BG.append(p.observation.Gsub)
+            steps += p.solver_steps
+        toc = time.time()
+        BG = np.array(BG)
+        if reference is None:
+            reference = BG
+        print("{:18s}: {:8d} steps, {:6.2f} s, max |BG - dopri5| {:.2e} mg/dL".format(
+            label, steps, toc - tic, np.max(np.abs(BG - reference))))
+
+
+if __name__ == "__main__":
+    from .t1dpatient import T1DPatient
+
+    class _CountingT1DPatient(T1DPatient):
+        """Counts accepted solver steps, whichever integrator is used"""
+        def step(self, action):
+            super().step(action)
+            if hasattr(self._odesolver, "nsteps"):  # an EventDrivenSolver
+                self.solver_steps = self._odesolver.nsteps
+            else:
+                # dopri5 reports the steps of the last integrate call
+                self.solver_steps += self._odesolver._integrator.iwork[17]
+
+        def reset(self):
+            super().reset()
+            self.solver_steps = 0
+
+    _benchmark_event_driven()
+    _benchmark_stiff()
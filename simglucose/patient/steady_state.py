@@ -0,0 +1,139 @@
+"""
+Equilibrium states of T1DPatient.model for a requested blood glucose.
+
+Without a meal the gut is empty and the insulin compartments settle at
+-A^-1 B u for a basal rate u (see InsulinSubsystem). The insulin action
+states follow from plasma insulin, and with Gp = BG * Vg the plasma glucose
+balance gives Gt in closed form. What remains is the tissue glucose balance
+dGt/dt = 0, which holds for exactly one basal rate; it is found with a
+one-dimensional root search. At high BG, where renal excretion lowers
+glucose even without insulin, no non-negative basal rate is consistent and
+there is no equilibrium: steady_state raises ValueError unless a basal rate
+is given explicitly.
+"""
+from .params import PatientParams, PARAM_FIELDS
+from .linear_insulin import InsulinSubsystem
+from scipy.optimize import brentq
+from collections import namedtuple
+import numpy as np
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# state: the 13 states, basal: the insulin rate (U/min) they correspond to
+SteadyState = namedtuple("SteadyState", ["state", "basal"])
+
+
+def _state_for(params, insulin_ss, Gp, basal):
+    """
+    The state with the insulin subsystem at steady state for basal, plasma
+    glucose Gp and dGp/dt = 0. Also return dGt/dt at that state.
+    """
+    x = np.zeros(13)
+    x[[5, 9, 10, 11]] = insulin_ss.steady_state(basal)
+    It = x[5] * params.inv_Vi
+    x[6] = It - params.Ib
+    x[7] = It
+    x[8] = It
+
+    x[3] = Gp
+    x[12] = Gp
+    EGPt = max(params.kp1 - params.kp2 * Gp - params.kp3 * x[8], 0)
+    Et = params.ke1 * (Gp - params.ke2) if Gp > params.ke2 else 0
+    x[4] = (params.k1 * Gp + params.Fsnc + Et - EGPt) / params.k2
+
+    Uidt = (params.Vm0 + params.Vmx * x[6]) * x[4] / (params.Km0 + x[4])
+    dGt = -Uidt + params.k1 * Gp - params.k2 * x[4]
+    return x, dGt
+
+
+@functools.lru_cache(maxsize=1024)
+def _steady_state(values, BG, basal):
+    params = PatientParams(None, **dict(zip(PARAM_FIELDS, values)))
+    insulin_ss = InsulinSubsystem(params)
+    Gp = BG * params.Vg
+
+    if basal is None:
+        def residual(u):
+            return _state_for(params, insulin_ss, Gp, u)[1]
+
+        # More insulin lowers EGP and raises utilization, so the residual
+        # decreases in u
+        if residual(0) <= 0:
+            # Even without insulin the glucose falls, as at high BG where
+            # renal excretion dominates
+            raise ValueError("No basal rate holds BG {} mg/dL at equilibrium; "
+                             "give a basal rate to start from a state that "
+                             "drifts.".format(BG))
+        hi = params.basal
+        while residual(hi) > 0:
+            if hi > 1e3 * params.basal:
+                raise ValueError("No basal rate holds BG {} mg/dL at "
+                                 "equilibrium.".format(BG))
+            hi *= 2
+        basal = brentq(residual, 0, hi, xtol=1e-14, rtol=1e-12)
+
+    state, _ = _state_for(params, insulin_ss, Gp, basal)
+    if state[4] < 0:
+        raise ValueError("BG {} mg/dL gives a negative Gt.".format(BG))
+    state.flags.writeable = False
+    return SteadyState(state=state, basal=basal)
+
+
+def steady_state(params, BG, basal=None):
+    """
+    The equilibrium state of a patient at blood glucose BG (mg/dL), as a
+    SteadyState.
+
+    params is a PatientParams record or a row of vpatient_params.csv. With
+    basal=None the basal rate that holds BG is solved for; ValueError is
+    raised when none does. With a given basal (U/min) the insulin states
+    are at steady state for it and the glucose states satisfy dGp/dt = 0, so
+    BG drifts unless basal is the equilibrium rate.
+
+    Results are cached per (patient parameters, BG, basal).
+    """
+    if not isinstance(params, PatientParams):
+        params = PatientParams.from_series(params)
+    values = tuple(getattr(params, f) for f in PARAM_FIELDS)
+    basal = None if basal is None else float(basal)
+    result = _steady_state(values, float(BG), basal)
+    return result._replace(state=result.state.copy())
+
+
+if __name__ == "__main__":
+    import time
+    from .t1dpatient import T1DPatient, Action
+
+    BG = 180
+    minutes = 240
+
+    tic = time.time()
+    p = T1DPatient.withName("adult#001", init_state=BG)
+    toc = time.time()
+    print("Equilibrium at {} mg/dL in {:.1f} ms, basal {:.4f} U/min "
+          "(nominal {:.4f})".format(BG, 1e3 * (toc - tic), p.init_basal,
+                                    p._model_params.basal))
+    tic = time.time()
+    T1DPatient.withName("adult#001", init_state=BG)
+    print("Cached: {:.1f} ms".format(1e3 * (time.time() - tic)))
+
+    Gsub = []
+    for _ in range(minutes):
+        p.step(Action(CHO=0, insulin=p.init_basal))
+        Gsub.append(p.observation.Gsub)
+    print("Max |Gsub - {}| over {} min at that basal: {:.2e} mg/dL".format(
+        BG, minutes, np.max(np.abs(np.array(Gsub) - BG))))
+
+    # The former initialization: only two states overwritten, the rest at
+    # the nominal basal state
+    state = p._params.iloc[2:15].to_numpy(dtype=float)
+    state[3] = state[12] = BG * p._model_params.Vg
+    q = T1DPatient(p._params, init_state=state)
+    Gsub = []
+    for _ in range(minutes):
+        q.step(Action(CHO=0, insulin=p.init_basal))
+        Gsub.append(q.observation.Gsub)
+    print("Nominal state with Gp = Gsub = {}: max |Gsub - {}| {:.1f} mg/dL".format(
+        BG, BG, np.max(np.abs(np.array(Gsub) - BG))))
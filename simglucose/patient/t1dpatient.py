@@ -1,18 +1,24 @@
 from .base import Patient
+from .params import PatientParams
+from .solver import EventDrivenSolver
+from .linear_insulin import SplitInsulinSolver
+from .gut import TabulatedGutSolver
+from .steady_state import steady_state
+from simglucose.registry import PATIENTS, PATIENT_PARA_FILE
 import numpy as np
-from scipy.integrate import ode
-import pandas as pd
+from scipy.integrate import ode, solve_ivp
 from collections import namedtuple
 import logging
-import pkg_resources
 
 logger = logging.getLogger(__name__)
 
 Action = namedtuple("patient_action", ["CHO", "insulin"])
 Observation = namedtuple("observation", ["Gsub"])
-
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
+Trajectory = namedtuple("trajectory", ["t", "BG", "Gsub"])
+PatientSnapshot = namedtuple(
+    "PatientSnapshot",
+    ["t", "state", "last_Qsto", "last_foodtaken", "last_CHO", "last_insulin",
+     "is_eating", "planned_meal"],
 )
 
 
@@ -20,21 +26,49 @@ class T1DPatient(Patient):
     SAMPLE_TIME = 1  # min
     EAT_RATE = 5  # g/min CHO
 
-    def __init__(self, params, init_state=None, random_init_bg=False, seed=None, t0=0):
+    def __init__(self, params, init_state=None, random_init_bg=False, seed=None, t0=0,
+                 event_driven=False, integrator="dopri5", gut_trace=None,
+                 init_basal=None):
         """
         T1DPatient constructor.
         Inputs:
             - params: a pandas sequence
             - init_state: customized initial state.
               If not specified, load the default initial state in
-              params.iloc[2:15]
+              params.iloc[2:15]. A single BG value (mg/dL) starts the
+              patient at the equilibrium state for that BG, see
+              steady_state.steady_state
+            - init_basal: the basal rate (U/min) of the equilibrium when
+              init_state is a BG value. By default the basal rate that holds
+              the BG is solved for; it is available as init_basal after
+              reset. ValueError is raised when no basal rate holds the BG;
+              give init_basal (e.g. 0) to start there anyway, off
+              equilibrium.
             - t0: simulation start time, it is 0 by default
+            - event_driven: keep one adaptive solver running across steps
+              whose inputs are unchanged instead of restarting dopri5 every
+              sample time, see EventDrivenSolver
+            - integrator: "dopri5" (default), one of the stiff solvers
+              "BDF" and "Radau", which use the analytic jacobian and always
+              run event-driven, or "split", which advances the insulin
+              compartments exactly and integrates the rest event-driven with
+              RK45 (see SplitInsulinSolver)
+            - gut_trace: a GutTrace of this patient's meals. The gut states
+              are then read from it rather than integrated, see
+              TabulatedGutSolver and gut.tabulate_meals. The remaining states
+              are integrated event-driven with RK45, so event_driven and
+              integrator must keep their defaults.
         """
         self._params = params
+        self._model_params = PatientParams.from_series(params)
         self._init_state = init_state
         self.random_init_bg = random_init_bg
         self._seed = seed
         self.t0 = t0
+        self.event_driven = event_driven
+        self.integrator = integrator
+        self._gut_trace = gut_trace
+        self._init_basal = init_basal
         self.reset()
 
     @classmethod
@@ -46,8 +80,7 @@ class T1DPatient(Patient):
         11 - 20: adult#001 - adult#001
         21 - 30: child#001 - child#010
         """
-        patient_params = pd.read_csv(PATIENT_PARA_FILE)
-        params = patient_params.iloc[patient_id - 1, :]
+        params = PATIENTS.byID(patient_id)
         return cls(params, **kwargs)
 
     @classmethod
@@ -59,10 +92,16 @@ class T1DPatient(Patient):
             adult#001 - adult#001
             child#001 - child#010
         """
-        patient_params = pd.read_csv(PATIENT_PARA_FILE)
-        params = patient_params.loc[patient_params.Name == name].squeeze()
+        params = PATIENTS.byName(name)
         return cls(params, **kwargs)
 
+    @classmethod
+    def withPopulation(cls, population, i, **kwargs):
+        """
+        Construct patient i of a synthetic population.Population
+        """
+        return cls(population.series(i), **kwargs)
+
     @property
     def state(self):
         return self._odesolver.y
@@ -76,6 +115,23 @@ class T1DPatient(Patient):
         return self.SAMPLE_TIME
 
     def step(self, action):
+        action = self._ingest(action)
+
+        # ODE solver
+        self._odesolver.set_f_params(
+            action, self._model_params, self._last_Qsto, self._last_foodtaken
+        )
+        if self._odesolver.successful():
+            self._odesolver.integrate(self._odesolver.t + self.sample_time)
+        else:
+            logger.error("ODE solver failed!!")
+            raise
+
+    def _ingest(self, action):
+        """
+        Apply the meal announcement and eating bookkeeping of one step and
+        return the action to integrate over it
+        """
         # Convert announcing meal to the meal amount to eat at the moment
         to_eat = self._announce_meal(action.CHO)
         action = action._replace(CHO=to_eat)
@@ -100,23 +156,120 @@ class T1DPatient(Patient):
 
         # Update last input
         self._last_action = action
+        return action
 
-        # ODE solver
-        self._odesolver.set_f_params(
-            action, self._params, self._last_Qsto, self._last_foodtaken
-        )
-        if self._odesolver.successful():
-            self._odesolver.integrate(self._odesolver.t + self.sample_time)
-        else:
-            logger.error("ODE solver failed!!")
-            raise
+    def advance(self, minutes, insulin_schedule, cho_schedule=0, times=None):
+        """
+        Advance the patient by a number of steps with piecewise-constant
+        inputs, equivalent to calling step once per sample time.
+        The solver runs uninterrupted across steps whose inputs do not change
+        and restarts only at input discontinuities (e.g. boluses and meals).
+        This holds for the default dopri5 integrator only: with
+        event_driven, a gut_trace or another integrator, advance calls
+        step once per sample time, so that the configured solver is used,
+        and times must be step ends.
+        Inputs:
+            - minutes: number of sample times to advance
+            - insulin_schedule: insulin rate (U/min) held over each step, a
+              scalar or a sequence of length minutes
+            - cho_schedule: announced CHO (g) at each step as in Action.CHO,
+              a scalar or a sequence of length minutes
+            - times: patient times at which to report the output, within
+              [t, t + minutes * sample_time]. Every step end by default.
+              They are returned in ascending order.
+        Output:
+            Trajectory(t, BG, Gsub) with the plasma (BG) and subcutaneous
+            (Gsub) glucose at times, in mg/dL
+        """
+        minutes = int(minutes)
+        insulin = np.broadcast_to(np.asarray(insulin_schedule, dtype=float), (minutes,))
+        cho = np.broadcast_to(np.asarray(cho_schedule, dtype=float), (minutes,))
+        t_start = self.t
+        t_end = t_start + minutes * self.sample_time
+        if times is None:
+            times = t_start + np.arange(1, minutes + 1) * self.sample_time
+        times = np.sort(np.asarray(times, dtype=float))
+        if times.size and (times.min() < t_start or times.max() > t_end):
+            raise ValueError("times must lie within [t, t + minutes * sample_time].")
+
+        if self.integrator != "dopri5" or self.event_driven or self._gut_trace is not None:
+            return self._advance_steps(insulin, cho, times)
+
+        out = np.empty((times.size, 13))
+        out[times == t_start] = self.state
+
+        # The pending segment [seg_t0, t) runs with constant seg_args
+        y = self.state
+        seg_t0 = t_start
+        seg_args = None
+
+        def flush(t):
+            nonlocal y, seg_t0
+            if seg_args is not None and t > seg_t0:
+                mask = (times > seg_t0) & (times < t)
+                # dopri5 with the tolerances scipy.integrate.ode uses
+                sol = solve_ivp(self.model, (seg_t0, t), y, method="RK45",
+                                t_eval=np.append(times[mask], t), args=seg_args,
+                                rtol=1e-6, atol=1e-12)
+                if not sol.success:
+                    logger.error("ODE solver failed!!")
+                    raise RuntimeError(sol.message)
+                y = sol.y[:, -1]
+                out[mask] = sol.y[:, :-1].T
+                out[times == t] = y
+            self._odesolver.set_initial_value(y, float(t))
+            seg_t0 = t
+
+        t = t_start
+        for k in range(minutes):
+            # Eating start reads the state, so the solver has to catch up
+            if self._last_action.CHO <= 0 and self.planned_meal + cho[k] > 0:
+                flush(t)
+            action = self._ingest(Action(CHO=cho[k], insulin=insulin[k]))
+            args = (action, self._model_params, self._last_Qsto, self._last_foodtaken)
+            if args != seg_args:
+                flush(t)
+                seg_args = args
+            t = t_start + (k + 1) * self.sample_time
+        flush(t)
+        if seg_args is not None:
+            self._odesolver.set_f_params(*seg_args)
+
+        Vg = self._model_params.Vg
+        return Trajectory(t=times, BG=out[:, 3] / Vg, Gsub=out[:, 12] / Vg)
+
+    def _advance_steps(self, insulin, cho, times):
+        """
+        advance as a loop of steps, for the solvers other than the default
+        dopri5
+        """
+        steps = (times - self.t) / self.sample_time
+        index = np.rint(steps)
+        if not np.allclose(steps, index, rtol=0, atol=1e-9):
+            raise ValueError(
+                "With event_driven, a gut_trace or the {} integrator, times "
+                "must be step ends.".format(self.integrator))
+        out = np.empty((times.size, 13))
+        out[index == 0] = self.state
+        for k in range(len(insulin)):
+            self.step(Action(CHO=cho[k], insulin=insulin[k]))
+            out[index == k + 1] = self.state
+
+        Vg = self._model_params.Vg
+        return Trajectory(t=times, BG=out[:, 3] / Vg, Gsub=out[:, 12] / Vg)
 
     @staticmethod
     def model(t, x, action, params, last_Qsto, last_foodtaken):
+        """
+        params is a PatientParams record; a pandas Series is compiled on the
+        fly, which is much slower.
+        """
+        if not isinstance(params, PatientParams):
+            params = PatientParams.from_series(params)
         dxdt = np.zeros(13)
         d = action.CHO * 1000  # g -> mg
-        insulin = action.insulin * 6000 / params.BW  # U/min -> pmol/kg/min
-        basal = params.u2ss * params.BW / 6000  # U/min
+        insulin = action.insulin * params.ins_scale  # U/min -> pmol/kg/min
+        kmax = params.kmax
 
         # Glucose in the stomach
         qsto = x[0] + x[1]
@@ -126,27 +279,28 @@ class T1DPatient(Patient):
         Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
 
         # Stomach solid
-        dxdt[0] = -params.kmax * x[0] + d
+        dxdt[0] = -kmax * x[0] + d
 
         if Dbar > 0:
-            aa = 5 / (2 * Dbar * (1 - params.b))
+            b = params.b
+            aa = 5 / (2 * Dbar * (1 - b))
             cc = 5 / (2 * Dbar * params.d)
-            kgut = params.kmin + (params.kmax - params.kmin) / 2 * (
-                np.tanh(aa * (qsto - params.b * Dbar))
+            kgut = params.kmin + params.kmax_kmin / 2 * (
+                np.tanh(aa * (qsto - b * Dbar))
                 - np.tanh(cc * (qsto - params.d * Dbar))
                 + 2
             )
         else:
-            kgut = params.kmax
+            kgut = kmax
 
         # stomach liquid
-        dxdt[1] = params.kmax * x[0] - x[1] * kgut
+        dxdt[1] = kmax * x[0] - x[1] * kgut
 
         # intestine
         dxdt[2] = kgut * x[1] - params.kabs * x[2]
 
         # Rate of appearance
-        Rat = params.f * params.kabs * x[2] / params.BW
+        Rat = params.Ra_scale * x[2]
         # Glucose Production
         EGPt = params.kp1 - params.kp2 * x[3] - params.kp3 * x[8]
         # Glucose Utilization
@@ -160,53 +314,149 @@ class T1DPatient(Patient):
 
         # glucose kinetics
         # plus dextrose IV injection input u[2] if needed
-        dxdt[3] = max(EGPt, 0) + Rat - Uiit - Et - params.k1 * x[3] + params.k2 * x[4]
-        dxdt[3] = (x[3] >= 0) * dxdt[3]
+        k1 = params.k1
+        k2 = params.k2
+        if EGPt < 0:
+            EGPt = 0
+        if x[3] >= 0:
+            dxdt[3] = EGPt + Rat - Uiit - Et - k1 * x[3] + k2 * x[4]
 
         Vmt = params.Vm0 + params.Vmx * x[6]
         Kmt = params.Km0
         Uidt = Vmt * x[4] / (Kmt + x[4])
-        dxdt[4] = -Uidt + params.k1 * x[3] - params.k2 * x[4]
-        dxdt[4] = (x[4] >= 0) * dxdt[4]
+        if x[4] >= 0:
+            dxdt[4] = -Uidt + k1 * x[3] - k2 * x[4]
 
         # insulin kinetics
-        dxdt[5] = (
-            -(params.m2 + params.m4) * x[5]
-            + params.m1 * x[9]
-            + params.ka1 * x[10]
-            + params.ka2 * x[11]
-        )  # plus insulin IV injection u[3] if needed
-        It = x[5] / params.Vi
-        dxdt[5] = (x[5] >= 0) * dxdt[5]
+        if x[5] >= 0:
+            dxdt[5] = (
+                -params.m2_m4 * x[5]
+                + params.m1 * x[9]
+                + params.ka1 * x[10]
+                + params.ka2 * x[11]
+            )  # plus insulin IV injection u[3] if needed
+        It = x[5] * params.inv_Vi
 
         # insulin action on glucose utilization
-        dxdt[6] = -params.p2u * x[6] + params.p2u * (It - params.Ib)
+        p2u = params.p2u
+        dxdt[6] = -p2u * x[6] + p2u * (It - params.Ib)
 
         # insulin action on production
-        dxdt[7] = -params.ki * (x[7] - It)
+        ki = params.ki
+        dxdt[7] = -ki * (x[7] - It)
 
-        dxdt[8] = -params.ki * (x[8] - x[7])
+        dxdt[8] = -ki * (x[8] - x[7])
 
         # insulin in the liver (pmol/kg)
-        dxdt[9] = -(params.m1 + params.m30) * x[9] + params.m2 * x[5]
-        dxdt[9] = (x[9] >= 0) * dxdt[9]
+        if x[9] >= 0:
+            dxdt[9] = -params.m1_m30 * x[9] + params.m2 * x[5]
 
         # subcutaneous insulin kinetics
-        dxdt[10] = insulin - (params.ka1 + params.kd) * x[10]
-        dxdt[10] = (x[10] >= 0) * dxdt[10]
+        if x[10] >= 0:
+            dxdt[10] = insulin - params.ka1_kd * x[10]
 
-        dxdt[11] = params.kd * x[10] - params.ka2 * x[11]
-        dxdt[11] = (x[11] >= 0) * dxdt[11]
+        if x[11] >= 0:
+            dxdt[11] = params.kd * x[10] - params.ka2 * x[11]
 
         # subcutaneous glucose
-        dxdt[12] = -params.ksc * x[12] + params.ksc * x[3]
-        dxdt[12] = (x[12] >= 0) * dxdt[12]
+        if x[12] >= 0:
+            dxdt[12] = -params.ksc * x[12] + params.ksc * x[3]
 
-        if action.insulin > basal:
+        if action.insulin > params.basal:
             logger.debug("t = {}, injecting insulin: {}".format(t, action.insulin))
 
         return dxdt
 
+    @staticmethod
+    def jacobian(t, x, action, params, last_Qsto, last_foodtaken):
+        """
+        Analytic Jacobian d(model)/dx, a 13 x 13 matrix. It has the same
+        signature as model and follows the same branches (clamps, renal
+        excretion threshold, EGP floor).
+        """
+        if not isinstance(params, PatientParams):
+            params = PatientParams.from_series(params)
+        J = np.zeros((13, 13))
+        kmax = params.kmax
+
+        qsto = x[0] + x[1]
+        Dbar = last_Qsto + last_foodtaken * 1000  # unit: mg
+        if Dbar > 0:
+            b = params.b
+            aa = 5 / (2 * Dbar * (1 - b))
+            cc = 5 / (2 * Dbar * params.d)
+            tb = np.tanh(aa * (qsto - b * Dbar))
+            td = np.tanh(cc * (qsto - params.d * Dbar))
+            kgut = params.kmin + params.kmax_kmin / 2 * (tb - td + 2)
+            # d(kgut)/d(qsto)
+            dkgut = params.kmax_kmin / 2 * (aa * (1 - tb**2) - cc * (1 - td**2))
+        else:
+            kgut = kmax
+            dkgut = 0
+
+        J[0, 0] = -kmax
+
+        J[1, 0] = kmax - x[1] * dkgut
+        J[1, 1] = -kgut - x[1] * dkgut
+
+        J[2, 0] = x[1] * dkgut
+        J[2, 1] = kgut + x[1] * dkgut
+        J[2, 2] = -params.kabs
+
+        k1 = params.k1
+        k2 = params.k2
+        if x[3] >= 0:
+            EGPt = params.kp1 - params.kp2 * x[3] - params.kp3 * x[8]
+            J[3, 2] = params.Ra_scale
+            J[3, 3] = -k1
+            J[3, 4] = k2
+            if EGPt > 0:
+                J[3, 3] -= params.kp2
+                J[3, 8] = -params.kp3
+            if x[3] > params.ke2:
+                J[3, 3] -= params.ke1
+
+        if x[4] >= 0:
+            Vmt = params.Vm0 + params.Vmx * x[6]
+            Kmt = params.Km0
+            J[4, 3] = k1
+            J[4, 4] = -Vmt * Kmt / (Kmt + x[4])**2 - k2
+            J[4, 6] = -params.Vmx * x[4] / (Kmt + x[4])
+
+        if x[5] >= 0:
+            J[5, 5] = -params.m2_m4
+            J[5, 9] = params.m1
+            J[5, 10] = params.ka1
+            J[5, 11] = params.ka2
+
+        p2u = params.p2u
+        J[6, 5] = p2u * params.inv_Vi
+        J[6, 6] = -p2u
+
+        ki = params.ki
+        J[7, 5] = ki * params.inv_Vi
+        J[7, 7] = -ki
+
+        J[8, 7] = ki
+        J[8, 8] = -ki
+
+        if x[9] >= 0:
+            J[9, 5] = params.m2
+            J[9, 9] = -params.m1_m30
+
+        if x[10] >= 0:
+            J[10, 10] = -params.ka1_kd
+
+        if x[11] >= 0:
+            J[11, 10] = params.kd
+            J[11, 11] = -params.ka2
+
+        if x[12] >= 0:
+            J[12, 3] = params.ksc
+            J[12, 12] = -params.ksc
+
+        return J
+
     @property
     def observation(self):
         """
@@ -215,7 +465,7 @@ class T1DPatient(Patient):
         TODO: add heart rate as an observation
         """
         GM = self.state[12]  # subcutaneous glucose (mg/kg)
-        Gsub = GM / self._params.Vg
+        Gsub = GM / self._model_params.Vg
         observation = Observation(Gsub=Gsub)
         return observation
 
@@ -244,29 +494,64 @@ class T1DPatient(Patient):
         self._seed = seed
         self.reset()
 
+    @property
+    def gut_trace(self):
+        return self._gut_trace
+
+    @gut_trace.setter
+    def gut_trace(self, trace):
+        self._gut_trace = trace
+        self.reset()
+
+    def snapshot(self):
+        """
+        Capture the numeric state of the patient in an immutable
+        PatientSnapshot, see restore
+        """
+        state = np.array(self.state, dtype=float)
+        state.flags.writeable = False
+        return PatientSnapshot(
+            t=self.t,
+            state=state,
+            last_Qsto=self._last_Qsto,
+            last_foodtaken=self._last_foodtaken,
+            last_CHO=self._last_action.CHO,
+            last_insulin=self._last_action.insulin,
+            is_eating=self.is_eating,
+            planned_meal=self.planned_meal,
+        )
+
+    def restore(self, snapshot):
+        """
+        Return the patient to a PatientSnapshot taken from this patient (or
+        one with the same parameters). In event-driven mode the solver
+        restarts at the snapshot time, so the continuation matches the
+        original run to solver tolerance rather than bit for bit.
+        """
+        self._odesolver.set_initial_value(np.array(snapshot.state), snapshot.t)
+        self._last_Qsto = snapshot.last_Qsto
+        self._last_foodtaken = snapshot.last_foodtaken
+        self._last_action = Action(CHO=snapshot.last_CHO,
+                                   insulin=snapshot.last_insulin)
+        self.is_eating = snapshot.is_eating
+        self.planned_meal = snapshot.planned_meal
+
     def reset(self):
         """
         Reset the patient state to default intial state
         """
-        default_state = np.copy(self._params.iloc[2:15].values)
-
-        # ✅ init_state가 float 또는 BG만 포함된 경우 처리
+        self.init_basal = self._model_params.basal
         if self._init_state is None:
-            self.init_state = default_state
-        elif isinstance(self._init_state, (float, int)):
-            default_state[2] = self._init_state  # Gp
-            default_state[3] = self._init_state  # Gt
-            self.init_state = default_state
-        elif isinstance(self._init_state, (list, np.ndarray)) and len(self._init_state) == 1:
-            default_state[2] = self._init_state[0]  # Gp
-            default_state[3] = self._init_state[0]  # Gt
-            self.init_state = default_state
-        elif isinstance(self._init_state, (list, np.ndarray)) and len(self._init_state) == 13:
-            self.init_state = np.array(self._init_state)
+            self.init_state = np.copy(self._params.iloc[2:15].values)
+        elif np.size(self._init_state) == 1:
+            # A BG value: start at the equilibrium state for it
+            self.init_state, self.init_basal = steady_state(
+                self._model_params, np.ravel(self._init_state)[0], self._init_basal)
+        elif np.size(self._init_state) == 13:
+            self.init_state = np.array(self._init_state, dtype=float)
         else:
             raise ValueError("init_state must be None, a single BG value, or a 13-element array.")
 
-
         self.random_state = np.random.RandomState(self.seed)
         if self.random_init_bg:
             # Only randomize glucose related states, x4, x5, and x13
@@ -291,7 +576,19 @@ class T1DPatient(Patient):
         self._last_foodtaken = 0
         self.name = self._params.Name
 
-        self._odesolver = ode(self.model).set_integrator("dopri5")
+        if self._gut_trace is not None:
+            if self.integrator != "dopri5" or self.event_driven:
+                raise ValueError("gut_trace cannot be combined with event_driven or integrator.")
+            self._odesolver = TabulatedGutSolver(self.model, self._gut_trace, self.t0)
+        elif self.integrator == "split":
+            self._odesolver = SplitInsulinSolver(self.model, self._model_params)
+        elif self.integrator != "dopri5":
+            self._odesolver = EventDrivenSolver(self.model, method=self.integrator,
+                                                jac=self.jacobian)
+        elif self.event_driven:
+            self._odesolver = EventDrivenSolver(self.model)
+        else:
+            self._odesolver = ode(self.model).set_integrator("dopri5")
         self._odesolver.set_initial_value(self.init_state, self.t0)
 
         self._last_action = Action(CHO=0, insulin=0)
@@ -313,7 +610,7 @@ if __name__ == "__main__":
     logger.addHandler(ch)
 
     p = T1DPatient.withName("adolescent#001")
-    basal = p._params.u2ss * p._params.BW / 6000  # U/min
+    basal = p._model_params.basal  # U/min
     t = []
     CHO = []
     insulin = []
@@ -0,0 +1,97 @@
+"""
+Process-wide registry of the parameter tables in simglucose/params.
+
+Each CSV is parsed the first time it is needed and kept for the life of the
+process, indexed by Name and by 1-based row ID. Lookups hand out read-only
+views of the rows: writing to one raises ValueError, so callers can never
+modify the shared tables, and callers that need a modified row copy it.
+"""
+import pkg_resources
+import pandas as pd
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+PATIENT_PARA_FILE = pkg_resources.resource_filename(
+    'simglucose', 'params/vpatient_params.csv')
+CONTROL_QUEST = pkg_resources.resource_filename('simglucose',
+                                                'params/Quest.csv')
+SENSOR_PARA_FILE = pkg_resources.resource_filename(
+    'simglucose', 'params/sensor_params.csv')
+INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
+    'simglucose', 'params/pump_params.csv')
+
+
+class ParamTable(object):
+    """
+    A lazily loaded parameter CSV with a Name column.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._frame = None
+        self._rows = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    logger.debug('Loading {}'.format(self.filename))
+                    frame = pd.read_csv(self.filename)
+                    rows = frame.to_numpy(dtype=object)
+                    rows.flags.writeable = False
+                    self._rows = rows
+                    self._index = {name: i for i, name in enumerate(frame['Name'])}
+                    self._frame = frame
+        return self._frame
+
+    @property
+    def names(self):
+        self._load()
+        return list(self._index)
+
+    def __len__(self):
+        return len(self._load())
+
+    def _row(self, i):
+        # A Series over the read-only row, without copying it
+        return pd.Series(self._rows[i], index=self._frame.columns, name=i, copy=False)
+
+    def __contains__(self, name):
+        self._load()
+        return name in self._index
+
+    def byName(self, name):
+        """
+        Return the row of name as a read-only pandas Series. Raise
+        KeyError if the table has no such name.
+        """
+        self._load()
+        try:
+            i = self._index[name]
+        except KeyError:
+            raise KeyError('{} not found in {}'.format(name, self.filename))
+        return self._row(i)
+
+    def byID(self, row_id):
+        """
+        Return the row with 1-based row_id as a read-only pandas Series
+        """
+        frame = self._load()
+        if not 1 <= row_id <= len(frame):
+            raise KeyError('ID {} not found in {}'.format(row_id, self.filename))
+        return self._row(row_id - 1)
+
+    def frame(self):
+        """
+        Return a copy of the whole table
+        """
+        return self._load().copy()
+
+
+PATIENTS = ParamTable(PATIENT_PARA_FILE)
+QUESTS = ParamTable(CONTROL_QUEST)
+SENSORS = ParamTable(SENSOR_PARA_FILE)
+PUMPS = ParamTable(INSULIN_PUMP_PARA_FILE)
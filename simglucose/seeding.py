@@ -0,0 +1,82 @@
+"""
+Hierarchical seeding with numpy SeedSequence.
+
+A batch has one root seed. Every cell of the batch (an environment, an
+episode, a job) is addressed by a path of integer keys below the root, and
+gets the SeedSequence that root.spawn would give it, computed directly from
+its keys:
+
+    child(seed, 3)     == SeedSequence(seed).spawn(4)[3]
+    child(seed, 3, 7)  == SeedSequence(seed).spawn(4)[3].spawn(8)[7]
+
+so the streams of a cell depend only on the root seed and its keys, never on
+which worker runs it or in which order. cell_seeds splits the sequence of a
+cell into independent integer seeds for the patient, sensor and scenario
+(the components take legacy RandomState seeds) and a Generator for any other
+draws of the cell.
+"""
+from collections import namedtuple
+import numpy as np
+
+# Keys of the streams of a cell, below the cell's own keys
+ROLES = ("patient", "sensor", "scenario", "rng")
+
+CellSeeds = namedtuple("CellSeeds", ["patient", "sensor", "scenario", "rng"])
+
+
+def as_sequence(seed=None):
+    """
+    A SeedSequence from None (fresh OS entropy), an integer or a
+    SeedSequence
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def child(seed, *keys):
+    """
+    The SeedSequence at keys below seed, as repeated spawn calls would
+    give it
+    """
+    seed = as_sequence(seed)
+    return np.random.SeedSequence(seed.entropy,
+                                  spawn_key=tuple(seed.spawn_key) + tuple(keys),
+                                  pool_size=seed.pool_size)
+
+
+def int_seed(sequence):
+    """
+    An integer seed below 2**31 drawn from a SeedSequence, for the
+    components seeded with RandomState
+    """
+    return int(sequence.generate_state(1, np.uint32)[0] >> 1)
+
+
+def cell_seeds(seed, *keys):
+    """
+    The CellSeeds of the cell at keys below seed
+    """
+    cell = child(seed, *keys)
+    return CellSeeds(patient=int_seed(child(cell, ROLES.index("patient"))),
+                     sensor=int_seed(child(cell, ROLES.index("sensor"))),
+                     scenario=int_seed(child(cell, ROLES.index("scenario"))),
+                     rng=np.random.default_rng(child(cell, ROLES.index("rng"))))
+
+
+def batch_seeds(seed, n):
+    """
+    The CellSeeds of cells 0 to n - 1 below seed
+    """
+    return [cell_seeds(seed, i) for i in range(n)]
+
+
+if __name__ == "__main__":
+    root = np.random.SeedSequence(12345)
+    spawned = root.spawn(4)[3].spawn(8)[7]
+    print("child(root, 3, 7) equals spawn: {}".format(
+        np.array_equal(child(root, 3, 7).generate_state(4),
+                       spawned.generate_state(4))))
+    seeds = batch_seeds(12345, 1000)
+    distinct = len({(s.patient, s.sensor, s.scenario) for s in seeds})
+    print("{} distinct seed triples in a batch of 1000".format(distinct))
@@ -1,12 +1,12 @@
 # from .noise_gen import CGMNoiseGenerator
-from .noise_gen import CGMNoise
-import pandas as pd
+from .noise_gen import CGMNoise, BatchCGMNoise
+from simglucose.registry import SENSORS, SENSOR_PARA_FILE
+from collections import namedtuple
+import numpy as np
 import logging
-import pkg_resources
 
 logger = logging.getLogger(__name__)
-SENSOR_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/sensor_params.csv')
+SensorSnapshot = namedtuple('SensorSnapshot', ['last_CGM', 'noise'])
 
 
 class CGMSensor(object):
@@ -19,14 +19,23 @@ class CGMSensor(object):
 
     @classmethod
     def withName(cls, name, **kwargs):
-        sensor_params = pd.read_csv(SENSOR_PARA_FILE)
-        params = sensor_params.loc[sensor_params.Name == name].squeeze()
+        params = SENSORS.byName(name)
         return cls(params, **kwargs)
 
     def measure(self, patient):
         if patient.t % self.sample_time == 0:
-            BG = patient.observation.Gsub
-            CGM = BG + next(self._noise_generator)
+            return self.read(patient.t, patient.observation.Gsub)
+
+        # Zero-Order Hold
+        return self._last_CGM
+
+    def read(self, t, Gsub):
+        """
+        The reading measure returns for a patient at time t with
+        subcutaneous glucose Gsub, without the patient object
+        """
+        if t % self.sample_time == 0:
+            CGM = Gsub + next(self._noise_generator)
             CGM = max(CGM, self._params["min"])
             CGM = min(CGM, self._params["max"])
             self._last_CGM = CGM
@@ -44,11 +53,62 @@ class CGMSensor(object):
         self._seed = seed
         self._noise_generator = CGMNoise(self._params, seed=seed)
 
+    def snapshot(self):
+        return SensorSnapshot(last_CGM=self._last_CGM,
+                              noise=self._noise_generator.snapshot())
+
+    def restore(self, snapshot):
+        self._last_CGM = snapshot.last_CGM
+        self._noise_generator.restore(snapshot.noise)
+
     def reset(self):
         logger.debug('Resetting CGM sensor ...')
         self._noise_generator = CGMNoise(self._params, seed=self.seed)
         self._last_CGM = 0
 
 
+class BatchCGMSensor(object):
+    """
+    N CGM sensors of one type measuring a BatchT1DPatient. Row i follows
+    CGMSensor(params, seed=seeds[i]).
+    """
+    def __init__(self, params, seeds):
+        self._params = params
+        self.name = params.Name
+        self.sample_time = params.sample_time
+        self._noise_generator = BatchCGMNoise(params, list(seeds))
+        self._last_CGM = np.zeros(len(seeds))
+
+    @classmethod
+    def withName(cls, name, seeds):
+        params = SENSORS.byName(name)
+        return cls(params, seeds)
+
+    def measure(self, patient, rows=None):
+        """
+        (N,) CGM readings, or those of rows only
+        """
+        if rows is None:
+            rows = slice(None)
+        if patient.t % self.sample_time == 0:
+            BG = patient.observation.Gsub[rows]
+            CGM = BG + self._noise_generator.next(
+                None if isinstance(rows, slice) else rows)
+            CGM = np.maximum(CGM, self._params["min"])
+            CGM = np.minimum(CGM, self._params["max"])
+            self._last_CGM[rows] = CGM
+            return CGM
+
+        # Zero-Order Hold
+        return self._last_CGM[rows].copy()
+
+    def reset_rows(self, rows, seeds):
+        """
+        Replace the sensors of rows with fresh ones seeded with seeds
+        """
+        self._noise_generator.reset_rows(rows, seeds)
+        self._last_CGM[rows] = 0
+
+
 if __name__ == '__main__':
     pass
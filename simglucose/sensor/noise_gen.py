@@ -1,11 +1,13 @@
 import numpy as np
 from scipy.interpolate import interp1d
 import math
-from collections import deque
+from collections import deque, namedtuple
 import logging
 import matplotlib.pyplot as plt
 
 logger = logging.getLogger(__name__)
+NoiseSnapshot = namedtuple('NoiseSnapshot', ['count', 'noise', 'noise_init',
+                                             'count15', 'e', 'rand_state'])
 
 
 def johnson_transform_SU(xi, lam, gamma, delta, x):
@@ -58,6 +60,31 @@ class CGMNoise(object):
     def __iter__(self):
         return self
 
+    def snapshot(self):
+        """
+        Capture the generator state (RNG, AR(1) term and the buffered noise)
+        in an immutable NoiseSnapshot
+        """
+        name, key, pos, has_gauss, cached_gaussian = \
+            self._noise15_gen.rand_gen.get_state()
+        key = key.copy()
+        key.flags.writeable = False
+        return NoiseSnapshot(count=self.count,
+                             noise=tuple(self.noise),
+                             noise_init=self._noise_init,
+                             count15=self._noise15_gen.count,
+                             e=self._noise15_gen.e,
+                             rand_state=(name, key, pos, has_gauss,
+                                         cached_gaussian))
+
+    def restore(self, snapshot):
+        self.count = snapshot.count
+        self.noise = deque(snapshot.noise)
+        self._noise_init = snapshot.noise_init
+        self._noise15_gen.count = snapshot.count15
+        self._noise15_gen.e = snapshot.e
+        self._noise15_gen.rand_gen.set_state(snapshot.rand_state)
+
     def __next__(self):
         if self.count < self.n:
             if len(self.noise) == 0:
@@ -95,3 +122,80 @@ class noise15_iter:
                                    self.e)
         self.count += 1
         return eps
+
+
+class BatchCGMNoise(object):
+    """
+    The CGMNoise of N sensors of one type, drawn in lockstep.
+
+    Each row has its own RandomState and follows CGMNoise with the same
+    seed; the Johnson transform and the cubic interpolation of each new
+    PRECOMPUTE x 15 min sequence run over all rows that need one at once.
+    """
+    PRECOMPUTE = CGMNoise.PRECOMPUTE
+    MDL_SAMPLE_TIME = CGMNoise.MDL_SAMPLE_TIME
+
+    def __init__(self, params, seeds):
+        self._params = params
+        n = len(seeds)
+        self._t15 = np.arange(self.PRECOMPUTE + 1) * self.MDL_SAMPLE_TIME
+        nsample = int(math.floor(
+            self.PRECOMPUTE * self.MDL_SAMPLE_TIME / params["sample_time"])) + 1
+        self._t = np.arange(nsample) * params["sample_time"]
+        self._rand_gens = [None] * n
+        self._e = np.zeros(n)
+        self._noise_init = np.zeros(n)
+        self._noise = np.zeros((n, nsample - 1))
+        self._pos = np.zeros(n, dtype=int)
+        self.reset_rows(np.arange(n), seeds)
+
+    def __len__(self):
+        return len(self._rand_gens)
+
+    def reset_rows(self, rows, seeds):
+        """
+        Restart the noise of rows from seeds
+        """
+        rows = np.asarray(rows, dtype=int)
+        for i, seed in zip(rows, seeds):
+            self._rand_gens[i] = np.random.RandomState(seed)
+        # The first 15 min noise starts the AR(1) process without PACF
+        self._e[rows] = [self._rand_gens[i].randn() for i in rows]
+        self._noise_init[rows] = self._johnson(self._e[rows])
+        self._pos[rows] = self._noise.shape[1]
+
+    def _johnson(self, e):
+        p = self._params
+        return johnson_transform_SU(p["xi"], p["lambda"], p["gamma"], p["delta"], e)
+
+    def _refill(self, rows):
+        z = np.array([self._rand_gens[i].randn(self.PRECOMPUTE) for i in rows])
+        e = np.empty_like(z)
+        last = self._e[rows]
+        for k in range(self.PRECOMPUTE):
+            last = self._params["PACF"] * (last + z[:, k])
+            e[:, k] = last
+        self._e[rows] = last
+
+        noise15 = np.empty((len(rows), self.PRECOMPUTE + 1))
+        noise15[:, 0] = self._noise_init[rows]
+        noise15[:, 1:] = self._johnson(e)
+        self._noise_init[rows] = noise15[:, -1]
+        noise = interp1d(self._t15, noise15, kind='cubic', axis=1)(self._t)
+        self._noise[rows] = noise[:, 1:]
+        self._pos[rows] = 0
+
+    def next(self, rows=None):
+        """
+        The next noise value of every row, or of rows only
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.asarray(rows, dtype=int)
+        empty = rows[self._pos[rows] == self._noise.shape[1]]
+        if len(empty):
+            self._refill(empty)
+        pos = self._pos[rows]
+        self._pos[rows] = pos + 1
+        return self._noise[rows, pos]
@@ -0,0 +1,248 @@
+"""
+VectorT1DSimEnv spread over worker processes.
+
+The N environments are split into contiguous blocks, one VectorT1DSimEnv
+per worker process. Actions, observations, rewards, done flags and info
+live in preallocated shared float64 buffers with one slot per
+environment; the pipes to the workers only carry short commands and
+acknowledgements, so nothing is pickled per step.
+"""
+from simglucose.simulation.vector_env import VectorT1DSimEnv
+from simglucose import seeding
+import multiprocessing as mp
+import numpy as np
+import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared buffers, one float64 slot per environment
+BUFFERS = ("basal", "bolus", "obs", "reward", "done", "truncated",
+           "terminal_observation", "bg", "meal", "insulin")
+INFO_KEYS = (("bg", "bg"), ("meal", "meal"), ("insulin", "insulin"),
+             ("TimeLimit.truncated", "truncated"),
+             ("terminal_observation", "terminal_observation"))
+
+
+def _views(buffers, start=0, stop=None):
+    return {name: np.frombuffer(buffer, dtype=float)[start:stop]
+            for name, buffer in buffers.items()}
+
+
+def _worker(conn, buffers, start, stop, env_kwargs, seeds):
+    """
+    Run environments start to stop of the shared buffers until closed
+    """
+    arrays = _views(buffers, start, stop)
+    try:
+        env = VectorT1DSimEnv(stop - start, seed=seeds, **env_kwargs)
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        conn.close()
+        return
+    conn.send(("ok", None))
+
+    while True:
+        try:
+            command, data = conn.recv()
+        except EOFError:
+            break
+        try:
+            if command == "step":
+                obs, reward, done, info = env.step(arrays["basal"], arrays["bolus"])
+                arrays["obs"][:] = obs
+                arrays["reward"][:] = reward
+                arrays["done"][:] = done
+                for key, name in INFO_KEYS:
+                    arrays[name][:] = info[key]
+            elif command == "reset":
+                arrays["obs"][:] = env.reset()
+            elif command == "seed":
+                env.seed(data)
+            elif command == "close":
+                conn.send(("ok", None))
+                break
+            else:
+                raise ValueError("Unknown command {}".format(command))
+            conn.send(("ok", None))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+
+
+class AsyncVectorT1DSimEnv(object):
+    def __init__(self, n, num_workers=None, seed=None, context=None, **kwargs):
+        """
+        AsyncVectorT1DSimEnv constructor.
+        Inputs:
+            - n: number of environments
+            - num_workers: number of worker processes, all cores by default
+            - seed: as for VectorT1DSimEnv; environment i draws the same
+              episodes whatever the number of workers
+            - context: multiprocessing start method, the platform default
+              if None
+            - kwargs: the other VectorT1DSimEnv arguments. With the spawn
+              and forkserver start methods they must be picklable.
+        """
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        num_workers = max(1, min(num_workers, n))
+        self.n = n
+        self.num_workers = num_workers
+        ctx = mp.get_context(context)
+
+        self._buffers = {name: ctx.RawArray("d", n) for name in BUFFERS}
+        self._arrays = _views(self._buffers)
+        self._bounds = np.linspace(0, n, num_workers + 1).astype(int)
+        seeds = self._spawn(seed)
+
+        self._conns = []
+        self._processes = []
+        for start, stop in zip(self._bounds[:-1], self._bounds[1:]):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child, self._buffers, start, stop, kwargs, seeds[start:stop]),
+                daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+        self._waiting = False
+        self.closed = False
+        try:
+            self._receive()
+        except Exception:
+            self.close()
+            raise
+
+    def _spawn(self, seed):
+        """
+        The SeedSequences of the n environments, as VectorT1DSimEnv.seed
+        derives them
+        """
+        if isinstance(seed, (list, tuple)):
+            if len(seed) != self.n:
+                raise ValueError("Expected {} seeds, got {}.".format(self.n, len(seed)))
+            return [seeding.as_sequence(s) for s in seed]
+        root = seeding.as_sequence(seed)
+        return [seeding.child(root, i) for i in range(self.n)]
+
+    def _send(self, command, data=None):
+        for conn in self._conns:
+            conn.send((command, data))
+
+    def _receive(self):
+        errors = []
+        for conn in self._conns:
+            status, message = conn.recv()
+            if status == "error":
+                errors.append(message)
+        if errors:
+            raise RuntimeError("Worker failed:\n{}".format(errors[0]))
+
+    def _check(self):
+        if self.closed:
+            raise RuntimeError("The environment is closed.")
+        if self._waiting:
+            raise RuntimeError("A step is pending, call step_wait first.")
+
+    def seed(self, seed=None):
+        self._check()
+        seeds = self._spawn(seed)
+        for conn, start, stop in zip(self._conns, self._bounds[:-1], self._bounds[1:]):
+            conn.send(("seed", seeds[start:stop]))
+        self._receive()
+
+    def reset(self):
+        """
+        Start new episodes in all environments; return the (n,) CGM
+        observations
+        """
+        self._check()
+        self._send("reset")
+        self._receive()
+        return self._arrays["obs"].copy()
+
+    def step_async(self, basal, bolus=0):
+        """
+        Start a step of all environments with (n,) basal rates (U/min) and
+        optional boluses, and return without waiting for it
+        """
+        self._check()
+        self._arrays["basal"][:] = basal
+        self._arrays["bolus"][:] = bolus
+        self._send("step")
+        self._waiting = True
+
+    def step_wait(self):
+        """
+        Wait for the pending step; return (observation, reward, done, info)
+        as VectorT1DSimEnv.step does
+        """
+        if not self._waiting:
+            raise RuntimeError("No step pending, call step_async first.")
+        self._waiting = False
+        self._receive()
+        arrays = self._arrays
+        info = {key: arrays[name].copy() for key, name in INFO_KEYS}
+        info["TimeLimit.truncated"] = info["TimeLimit.truncated"].astype(bool)
+        return (arrays["obs"].copy(), arrays["reward"].copy(),
+                arrays["done"].astype(bool), info)
+
+    def step(self, basal, bolus=0):
+        self.step_async(basal, bolus)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self._waiting:
+            try:
+                self.step_wait()
+            except RuntimeError:
+                logger.warning("Pending step failed while closing.")
+        for conn, process in zip(self._conns, self._processes):
+            if process.is_alive():
+                try:
+                    conn.send(("close", None))
+                    conn.recv()
+                except (OSError, EOFError):
+                    pass
+            conn.close()
+            process.join()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    import time
+
+    names = ["adolescent#001", "adult#001", "child#001"]
+    n = 48
+    steps = 160  # 8 hours
+
+    venv = VectorT1DSimEnv(n, patient_name=names, seed=0)
+    venv.reset()
+    tic = time.time()
+    for _ in range(steps):
+        venv.step(np.full(n, 0.02))
+    t_single = time.time() - tic
+    print("{} envs x {} steps, {} cores".format(n, steps, mp.cpu_count()))
+    print("Single process: {:.0f} env-steps/s".format(n * steps / t_single))
+
+    for workers in sorted({1, 4, mp.cpu_count()}):
+        with AsyncVectorT1DSimEnv(n, num_workers=workers,
+                                  patient_name=names, seed=0) as aenv:
+            aenv.reset()
+            tic = time.time()
+            for _ in range(steps):
+                aenv.step(np.full(n, 0.02))
+            t_async = time.time() - tic
+        print("{:2d} workers:      {:.0f} env-steps/s ({:.2f}x)".format(
+            workers, n * steps / t_async, t_single / t_async))
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of simulation results.
+
+A cell, one JobSpec of scheduler.py, is keyed by the SHA-256 of its
+canonical configuration and of the library fingerprint: the hash of the
+package sources and parameter tables. Changing any of them therefore
+misses the cache instead of returning stale results.
+
+Each cached history is one compressed .npz file of columns, named by its
+key. index.jsonl, appended one line per stored cell, holds the spec and the
+glycemic metrics of every cell, so a sweep can be resumed or its metrics
+re-reported without loading any history.
+"""
+from simglucose.simulation.history import History, HistoryView
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_fingerprint = None
+
+
+def library_fingerprint():
+    """
+    SHA-256 of the .py sources and .csv parameter tables of the package,
+    computed once per process
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        files = []
+        for root, dirs, names in os.walk(PACKAGE_DIR):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            files.extend(os.path.join(root, name) for name in names
+                         if name.endswith((".py", ".csv")))
+        for filename in sorted(files):
+            digest.update(os.path.relpath(filename, PACKAGE_DIR).encode())
+            with open(filename, "rb") as f:
+                digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+def _canonical(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Cannot hash {!r} in a cell configuration.".format(value))
+
+
+def spec_dict(spec):
+    """
+    The fields of a JobSpec as JSON-compatible values
+    """
+    return json.loads(json.dumps(spec._asdict(), default=_canonical))
+
+
+def cell_key(spec, fingerprint=None):
+    """
+    Hex SHA-256 of a JobSpec and the library fingerprint
+    """
+    if fingerprint is None:
+        fingerprint = library_fingerprint()
+    config = json.dumps({"spec": spec._asdict(), "library": fingerprint},
+                        sort_keys=True, default=_canonical)
+    return hashlib.sha256(config.encode()).hexdigest()
+
+
+class ResultCache(object):
+    INDEX = "index.jsonl"
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index = {}
+        index = os.path.join(path, self.INDEX)
+        if os.path.exists(index):
+            with open(index) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # An interrupted append; the cell is simulated again
+                        logger.warning("Skipping a corrupt line of {}".format(index))
+                        continue
+                    self._index[record["key"]] = record
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def metrics(self, key):
+        return self._index[key]["metrics"]
+
+    def save_history(self, key, history):
+        """
+        Write the columns of a History; safe to call from worker processes
+        """
+        filename = self._file(key)
+        tmp = "{}.{}.tmp.npz".format(filename[:-4], os.getpid())
+        np.savez_compressed(tmp, **history.view()._asdict())
+        os.replace(tmp, filename)
+
+    def add(self, key, spec, metrics):
+        """
+        Record a cell whose history has been saved. Only one process should
+        add to a cache at a time.
+        """
+        record = {"key": key, "spec": spec_dict(spec), "metrics": metrics}
+        with open(os.path.join(self.path, self.INDEX), "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self._index[key] = record
+
+    def history(self, key):
+        """
+        The History of a cached cell
+        """
+        with np.load(self._file(key)) as columns:
+            return History.fromView(HistoryView(**{name: columns[name]
+                                                   for name in HistoryView._fields}))
+
+    def frame(self):
+        """
+        One row per cached cell: key, spec fields and metrics
+        """
+        return pd.DataFrame([dict(key=key, **record["spec"], **record["metrics"])
+                             for key, record in self._index.items()])
@@ -1,10 +1,11 @@
 from simglucose.patient.t1dpatient import Action
-from simglucose.analysis.risk import risk_index
-import pandas as pd
+from simglucose.analysis.risk import risk
+from simglucose.simulation.history import History
+from simglucose.simulation.reward import RewardWindow, risk_diff
 from datetime import timedelta
+import numpy as np
 import logging
 from collections import namedtuple
-# from simglucose.simulation.rendering import Viewer
 
 try:
     from rllab.envs.base import Step
@@ -21,41 +22,66 @@ except ImportError:
 
 
 Observation = namedtuple("Observation", ["CGM"])
+# Per-step arrays returned by T1DSimEnv.run
+RunResult = namedtuple("RunResult",
+                       ["BG", "CGM", "CHO", "insulin", "LBGI", "HBGI", "Risk"])
+EnvSnapshot = namedtuple("EnvSnapshot",
+                         ["patient", "sensor", "scenario", "history_length"])
 logger = logging.getLogger(__name__)
 
 
-def risk_diff(BG_last_hour):
-    if len(BG_last_hour) < 2:
-        return 0
-    else:
-        _, _, risk_current = risk_index([BG_last_hour[-1]], 1)
-        _, _, risk_prev = risk_index([BG_last_hour[-2]], 1)
-        return risk_prev - risk_current
-
-
 class T1DSimEnv(object):
-    def __init__(self, patient, sensor, pump, scenario):
+    # What step and reset put in the info of their Step:
+    # "none": nothing
+    # "minimal": what the bundled controllers use (sample_time,
+    #            patient_name, meal) and the minute
+    # "full": also the patient state, time, BG and risk indices
+    INFO_LEVELS = ("none", "minimal", "full")
+
+    def __init__(self, patient, sensor, pump, scenario, info_level="full"):
         self.patient = patient
         self.sensor = sensor
         self.pump = pump
         self.scenario = scenario
+        self.info_level = info_level
         self._reset()
 
+    @property
+    def info_level(self):
+        return self._info_level
+
+    @info_level.setter
+    def info_level(self, info_level):
+        if info_level not in self.INFO_LEVELS:
+            raise ValueError("info_level must be one of {}.".format(
+                ", ".join(self.INFO_LEVELS)))
+        self._info_level = info_level
+
+    @property
+    def minute(self):
+        """
+        Simulation clock: integer minutes of patient time since the scenario
+        start time
+        """
+        return self._minute
+
     @property
     def time(self):
-        return self.scenario.start_time + timedelta(minutes=self.patient.t)
+        return self.scenario.start_time + timedelta(minutes=self._minute)
 
     def mini_step(self, action):
+        insulin = self.pump.basal(action.basal) + self.pump.bolus(action.bolus)
+        return self._mini_step(insulin)
+
+    def _mini_step(self, insulin):
         # current action
-        patient_action = self.scenario.get_action(self.time)
-        basal = self.pump.basal(action.basal)
-        bolus = self.pump.bolus(action.bolus)
-        insulin = basal + bolus
+        patient_action = self.scenario.get_action_minute(self._minute)
         CHO = patient_action.meal
         patient_mdl_act = Action(insulin=insulin, CHO=CHO)
 
         # State update
         self.patient.step(patient_mdl_act)
+        self._minute += self.patient.sample_time
 
         # next observation
         BG = self.patient.observation.Gsub
@@ -63,77 +89,238 @@ class T1DSimEnv(object):
 
         return CHO, insulin, BG, CGM
 
-    def step(self, action, reward_fun=risk_diff):
+    def _sample(self, insulin):
         """
-        action is a namedtuple with keys: basal, bolus
+        Advance one sample time at a pump-quantized insulin rate and return
+        the averages of CHO, insulin, BG and CGM over it
         """
         CHO = 0.0
-        insulin = 0.0
+        insulin_avg = 0.0
         BG = 0.0
         CGM = 0.0
 
         for _ in range(int(self.sample_time)):
             # Compute moving average as the sample measurements
-            tmp_CHO, tmp_insulin, tmp_BG, tmp_CGM = self.mini_step(action)
+            tmp_CHO, tmp_insulin, tmp_BG, tmp_CGM = self._mini_step(insulin)
             CHO += tmp_CHO / self.sample_time
-            insulin += tmp_insulin / self.sample_time
+            insulin_avg += tmp_insulin / self.sample_time
             BG += tmp_BG / self.sample_time
             CGM += tmp_CGM / self.sample_time
+        return CHO, insulin_avg, BG, CGM
 
+    def _record(self, CHO, insulin, BG, CGM):
         # Compute risk index
-        horizon = 1
-        LBGI, HBGI, risk = risk_index([BG], horizon)
+        LBGI, HBGI, RI = risk(BG)
 
         # Record current action
-        self.CHO_hist.append(CHO)
-        self.insulin_hist.append(insulin)
+        self.history.record_action(CHO, insulin)
 
         # Record next observation
-        self.time_hist.append(self.time)
-        self.BG_hist.append(BG)
-        self.CGM_hist.append(CGM)
-        self.risk_hist.append(risk)
-        self.LBGI_hist.append(LBGI)
-        self.HBGI_hist.append(HBGI)
+        self.history.append(self._minute, BG, CGM, LBGI, HBGI, RI)
+        self.reward_window.push(CGM)
+        return LBGI, HBGI, RI
+
+    def step(self, action, reward_fun=risk_diff):
+        """
+        action is a namedtuple with keys: basal, bolus
+        reward_fun gets a read-only array of the CGM readings of the last
+        hour, oldest first
+        """
+        # The pump quantizes the same action every minute of the sample
+        insulin = self.pump.basal(action.basal) + self.pump.bolus(action.bolus)
+        CHO, insulin, BG, CGM = self._sample(insulin)
+        LBGI, HBGI, RI = self._record(CHO, insulin, BG, CGM)
 
         # Compute reward, and decide whether game is over
-        window_size = int(60 / self.sample_time)
-        BG_last_hour = self.CGM_hist[-window_size:]
-        reward = reward_fun(BG_last_hour)
+        if reward_fun is risk_diff:
+            reward = self.reward_window.risk_diff()
+        else:
+            reward = reward_fun(self.reward_window.view())
         done = BG < 10 or BG > 600
         obs = Observation(CGM=CGM)
+        return self._result(obs, reward, done, CHO, BG, LBGI, HBGI, RI)
 
-        return Step(
-            observation=obs,
-            reward=reward,
-            done=done,
-            sample_time=self.sample_time,
-            patient_name=self.patient.name,
-            meal=CHO,
-            patient_state=self.patient.state,
-            time=self.time,
-            bg=BG,
-            lbgi=LBGI,
-            hbgi=HBGI,
-            risk=risk,
-        )
+    def _result(self, obs, reward, done, CHO, BG, LBGI, HBGI, RI):
+        """
+        The Step of step and reset, with the info of info_level
+        """
+        if self._info_level == "full":
+            return Step(
+                observation=obs,
+                reward=reward,
+                done=done,
+                sample_time=self.sample_time,
+                patient_name=self.patient.name,
+                meal=CHO,
+                patient_state=self.patient.state,
+                time=self.time,
+                minute=self._minute,
+                bg=BG,
+                lbgi=LBGI,
+                hbgi=HBGI,
+                risk=RI,
+            )
+        if self._info_level == "minimal":
+            return Step(
+                observation=obs,
+                reward=reward,
+                done=done,
+                sample_time=self.sample_time,
+                patient_name=self.patient.name,
+                meal=CHO,
+                minute=self._minute,
+            )
+        return Step(observation=obs, reward=reward, done=done)
+
+    def run(self, basal, bolus=0):
+        """
+        Apply an open-loop schedule of K actions, as K calls of
+        step(Action(basal=basal[k], bolus=bolus[k])) but without building
+        the Step records or computing rewards. basal and bolus are scalars
+        or length-K sequences (U/min). The history is recorded as by step.
+        Return a RunResult of (K,) arrays: the observation after each step
+        and the CHO and insulin averaged over it.
+
+        A patient with an advance method (T1DPatient) is advanced over the
+        whole schedule at once, restarting its solver only where the
+        inputs change, so the glucose matches step to solver tolerance
+        rather than bit for bit; the sensor noise draws are the same.
+        """
+        basal, bolus = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(basal, dtype=float)),
+            np.atleast_1d(np.asarray(bolus, dtype=float)))
+        if basal.ndim != 1:
+            raise ValueError("basal and bolus must be scalars or 1-D sequences.")
+        # The pump quantization only depends on the rate; schedules repeat
+        # few distinct values
+        values, index = np.unique(basal, return_inverse=True)
+        rates = np.array([self.pump.basal(v) for v in values])[index]
+        values, index = np.unique(bolus, return_inverse=True)
+        rates += np.array([self.pump.bolus(v) for v in values])[index]
+
+        out = np.empty((len(RunResult._fields), len(rates)))
+        if hasattr(self.patient, "advance") and hasattr(self.sensor, "read"):
+            samples = self._advance(rates)
+        else:
+            samples = (self._sample(rate) for rate in rates.tolist())
+        for k, (CHO, insulin, BG, CGM) in enumerate(samples):
+            LBGI, HBGI, RI = self._record(CHO, insulin, BG, CGM)
+            out[:, k] = (BG, CGM, CHO, insulin, LBGI, HBGI, RI)
+        return RunResult(*out)
+
+    def _advance(self, rates):
+        """
+        The (CHO, insulin, BG, CGM) sample averages of _sample for each of
+        the pump-quantized rates, with one patient.advance over all of them
+        """
+        n = int(self.sample_time)
+        dt = self.patient.sample_time
+        minutes = self._minute + dt * np.arange(len(rates) * n)
+        meals = np.array([self.scenario.get_action_minute(int(m)).meal
+                          for m in minutes])
+        insulin = np.repeat(rates, n)
+        Gsub = self.patient.advance(len(minutes), insulin, meals).Gsub
+        t = self.patient.t - dt * (len(minutes) - 1 - np.arange(len(minutes)))
+        CGM = np.array([self.sensor.read(t[j], Gsub[j]) for j in range(len(minutes))])
+        start = self._minute
+
+        for k, rate in enumerate(rates.tolist()):
+            self._minute = start + dt * n * (k + 1)
+            CHO = 0.0
+            insulin_avg = 0.0
+            BG = 0.0
+            CGM_avg = 0.0
+            for j in range(k * n, (k + 1) * n):
+                CHO += meals[j] / self.sample_time
+                insulin_avg += rate / self.sample_time
+                BG += Gsub[j] / self.sample_time
+                CGM_avg += CGM[j] / self.sample_time
+            yield CHO, insulin_avg, BG, CGM_avg
 
     def _reset(self):
         self.sample_time = self.sensor.sample_time
         self.viewer = None
+        self._minute = int(round(self.patient.t))
 
         BG = self.patient.observation.Gsub
-        horizon = 1
-        LBGI, HBGI, risk = risk_index([BG], horizon)
+        LBGI, HBGI, RI = risk(BG)
         CGM = self.sensor.measure(self.patient)
-        self.time_hist = [self.scenario.start_time]
-        self.BG_hist = [BG]
-        self.CGM_hist = [CGM]
-        self.risk_hist = [risk]
-        self.LBGI_hist = [LBGI]
-        self.HBGI_hist = [HBGI]
-        self.CHO_hist = []
-        self.insulin_hist = []
+        self.history = History()
+        self.history.append(self._minute, BG, CGM, LBGI, HBGI, RI)
+        self.reward_window = RewardWindow(int(60 / self.sample_time))
+        self.reward_window.push(CGM)
+
+    # Read-only views of the recorded history
+    @property
+    def time_hist(self):
+        return [self.scenario.start_time + timedelta(minutes=int(m))
+                for m in self.history.column("Time")]
+
+    @property
+    def BG_hist(self):
+        return self.history.column("BG")
+
+    @property
+    def CGM_hist(self):
+        return self.history.column("CGM")
+
+    @property
+    def risk_hist(self):
+        return self.history.column("Risk")
+
+    @property
+    def LBGI_hist(self):
+        return self.history.column("LBGI")
+
+    @property
+    def HBGI_hist(self):
+        return self.history.column("HBGI")
+
+    @property
+    def CHO_hist(self):
+        return self.history.actions("CHO")
+
+    @property
+    def insulin_hist(self):
+        return self.history.actions("insulin")
+
+    def snapshot(self):
+        """
+        Capture the numeric state of the patient, sensor and scenario and the
+        current history length in an immutable EnvSnapshot. Rewinding with
+        restore is much cheaper than copy.deepcopy of the environment. A
+        snapshot pickles to about 6.5 kB, mostly the RandomState (Mersenne
+        Twister) states of the sensor noise and scenario generators.
+        """
+        return EnvSnapshot(
+            patient=self.patient.snapshot(),
+            sensor=self.sensor.snapshot(),
+            scenario=self.scenario.snapshot(),
+            history_length=len(self.history),
+        )
+
+    def restore(self, snapshot, history=None):
+        """
+        Rewind to an EnvSnapshot taken earlier on this environment. The
+        history is truncated back to its length at that point.
+
+        To continue a snapshot on another environment with the same
+        patient, sensor and scenario, e.g. in a new process, also pass the
+        HistoryView of the original environment as history.
+        """
+        if history is not None:
+            self.history = History.fromView(history)
+        n = snapshot.history_length
+        if n > len(self.history):
+            raise ValueError("Cannot restore a snapshot taken after the current history.")
+        self.patient.restore(snapshot.patient)
+        self.sensor.restore(snapshot.sensor)
+        self.scenario.restore(snapshot.scenario)
+        self._minute = int(round(self.patient.t))
+        self.history.truncate(n)
+        self.reward_window.clear()
+        self.reward_window.extend(
+            self.CGM_hist[max(n - self.reward_window.size, 0):])
 
     def reset(self):
         self.patient.reset()
@@ -143,20 +330,9 @@ class T1DSimEnv(object):
         self._reset()
         CGM = self.sensor.measure(self.patient)
         obs = Observation(CGM=CGM)
-        return Step(
-            observation=obs,
-            reward=0,
-            done=False,
-            sample_time=self.sample_time,
-            patient_name=self.patient.name,
-            meal=0,
-            patient_state=self.patient.state,
-            time=self.time,
-            bg=self.BG_hist[0],
-            lbgi=self.LBGI_hist[0],
-            hbgi=self.HBGI_hist[0],
-            risk=self.risk_hist[0],
-        )
+        return self._result(obs, 0, False, 0, self.BG_hist[0],
+                            self.LBGI_hist[0], self.HBGI_hist[0],
+                            self.risk_hist[0])
 
     def render(self, close=False):
         if close:
@@ -164,24 +340,83 @@ class T1DSimEnv(object):
             return
 
         if self.viewer is None:
+            from simglucose.simulation.rendering import Viewer
             self.viewer = Viewer(self.scenario.start_time, self.patient.name)
 
-        self.viewer.render(self.show_history())
+        self.viewer.render(self.history.view())
 
     def _close_viewer(self):
         if self.viewer is not None:
             self.viewer.close()
             self.viewer = None
 
-    def show_history(self):
-        df = pd.DataFrame()
-        df["Time"] = pd.Series(self.time_hist)
-        df["BG"] = pd.Series(self.BG_hist)
-        df["CGM"] = pd.Series(self.CGM_hist)
-        df["CHO"] = pd.Series(self.CHO_hist)
-        df["insulin"] = pd.Series(self.insulin_hist)
-        df["LBGI"] = pd.Series(self.LBGI_hist)
-        df["HBGI"] = pd.Series(self.HBGI_hist)
-        df["Risk"] = pd.Series(self.risk_hist)
-        df = df.set_index("Time")
-        return df
+    def show_history(self, as_frame=True):
+        """
+        The history as a DataFrame indexed by Time, or with as_frame=False
+        as a HistoryView of read-only arrays that share memory with the
+        environment (Time in minutes since the scenario start)
+        """
+        if not as_frame:
+            return self.history.view()
+        return self.history.to_frame(self.scenario.start_time)
+
+
+if __name__ == "__main__":
+    import time
+    from datetime import datetime
+    from simglucose.patient.t1dpatient import T1DPatient
+    from simglucose.sensor.cgm import CGMSensor
+    from simglucose.actuator.pump import InsulinPump
+    from simglucose.simulation.scenario_gen import RandomScenario
+    from simglucose.controller.base import Action as CtrlAction
+
+    def make_env(info_level="full"):
+        return T1DSimEnv(T1DPatient.withName("adolescent#001"),
+                         CGMSensor.withName("Dexcom", seed=1),
+                         InsulinPump.withName("Insulet"),
+                         RandomScenario(start_time=datetime(2018, 1, 1, 6), seed=1),
+                         info_level=info_level)
+
+    # One day of a basal schedule with a bolus at each hour
+    K = 480
+    basal = np.full(K, 0.02)
+    bolus = np.where(np.arange(K) % 20 == 0, 0.5, 0.0)
+
+    # Best of a few repeats, the integration itself dominates either way
+    t_step = t_run = np.inf
+    for _ in range(3):
+        env = make_env()
+        tic = time.time()
+        CGM = []
+        for k in range(K):
+            obs, _, _, _ = env.step(CtrlAction(basal=basal[k], bolus=bolus[k]))
+            CGM.append(obs.CGM)
+        t_step = min(t_step, time.time() - tic)
+        looped = env.show_history(as_frame=False)
+
+        env = make_env()
+        tic = time.time()
+        result = env.run(basal, bolus)
+        t_run = min(t_run, time.time() - tic)
+        ran = env.show_history(as_frame=False)
+
+    print("{} steps: step loop {:.2f} s, run {:.2f} s".format(K, t_step, t_run))
+    print("Bit-identical: observations {}, history {}".format(
+        np.array_equal(np.array(CGM), result.CGM),
+        all(np.array_equal(a, b, equal_nan=True) for a, b in zip(looped, ran))))
+
+    # Steps per second at each info level, and the cost of the Step record
+    # alone
+    action = CtrlAction(basal=0.02, bolus=0)
+    for info_level in T1DSimEnv.INFO_LEVELS:
+        env = make_env(info_level)
+        tic = time.time()
+        for _ in range(K):
+            env.step(action)
+        rate = K / (time.time() - tic)
+        n = 100000
+        tic = time.time()
+        for _ in range(n):
+            env._result(None, 0.0, False, 0.0, 140.0, 0.0, 1.0, 1.0)
+        print("info_level {:8s} {:6.0f} steps/s, Step record {:.2f} us".format(
+            info_level, rate, 1e6 * (time.time() - tic) / n))
@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Views of the recorded columns. Time is in integer minutes since the start
+# of the scenario; CHO and insulin are the actions taken after each
+# observation, NaN for the latest one.
+HistoryView = namedtuple(
+    "HistoryView",
+    ["Time", "BG", "CGM", "CHO", "insulin", "LBGI", "HBGI", "Risk"])
+
+
+class History(object):
+    """
+    Preallocated, growable column buffers for the T1DSimEnv history.
+
+    Each float column is contiguous, and the capacity doubles when full, so
+    recording a step is amortized O(1). view() returns read-only views of
+    the recorded rows without copying; to_frame() materializes the
+    DataFrame of T1DSimEnv.show_history.
+    """
+    COLUMNS = HistoryView._fields[1:]
+
+    def __init__(self, capacity=512):
+        self._time = np.empty(capacity, dtype=np.int64)
+        self._data = np.empty((len(self.COLUMNS), capacity))
+        self._n = 0
+
+    @classmethod
+    def fromView(cls, view):
+        """
+        A History holding copies of the columns of a HistoryView
+        """
+        n = len(view.Time)
+        self = cls(max(n, 1))
+        self._time[:n] = view.Time
+        for j, name in enumerate(cls.COLUMNS):
+            self._data[j, :n] = getattr(view, name)
+        self._n = n
+        return self
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def capacity(self):
+        return len(self._time)
+
+    @property
+    def nbytes(self):
+        return self._time.nbytes + self._data.nbytes
+
+    def _grow(self):
+        capacity = 2 * self.capacity
+        time = np.empty(capacity, dtype=np.int64)
+        time[:self._n] = self._time[:self._n]
+        data = np.empty((len(self.COLUMNS), capacity))
+        data[:, :self._n] = self._data[:, :self._n]
+        self._time = time
+        self._data = data
+
+    def append(self, minute, BG, CGM, LBGI, HBGI, risk):
+        """
+        Record an observation
+        """
+        if self._n == self.capacity:
+            self._grow()
+        n = self._n
+        self._time[n] = minute
+        self._data[:, n] = (BG, CGM, np.nan, np.nan, LBGI, HBGI, risk)
+        self._n = n + 1
+
+    def record_action(self, CHO, insulin):
+        """
+        Record the action taken after the latest observation
+        """
+        self._data[2, self._n - 1] = CHO
+        self._data[3, self._n - 1] = insulin
+
+    def truncate(self, n):
+        """
+        Drop everything after the first n observations, including the
+        action taken after the n-th
+        """
+        if n > self._n:
+            raise ValueError("Cannot truncate a history of {} rows to {}.".format(
+                self._n, n))
+        self._n = n
+        if n > 0:
+            self._data[2:4, n - 1] = np.nan
+
+    def clear(self):
+        self._n = 0
+
+    def column(self, name):
+        """
+        Read-only view of one column over the recorded rows
+        """
+        if name == "Time":
+            view = self._time[:self._n]
+        else:
+            view = self._data[self.COLUMNS.index(name), :self._n]
+        view.flags.writeable = False
+        return view
+
+    def actions(self, name):
+        """
+        Read-only view of CHO or insulin over the steps taken so far, i.e.
+        without the latest, pending row
+        """
+        view = self._data[self.COLUMNS.index(name), :max(self._n - 1, 0)]
+        view.flags.writeable = False
+        return view
+
+    def view(self):
+        return HistoryView(*[self.column(name) for name in HistoryView._fields])
+
+    def to_frame(self, start_time):
+        """
+        The history as a DataFrame indexed by datetime Time
+        """
+        index = pd.DatetimeIndex(
+            pd.Timestamp(start_time) + pd.to_timedelta(self._time[:self._n], unit="min"),
+            name="Time")
+        return pd.DataFrame(self._data[:, :self._n].T.copy(), index=index,
+                            columns=list(self.COLUMNS))
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+    from datetime import datetime, timedelta
+
+    days = 7
+    steps = days * 24 * 60 // 3
+    rng = np.random.RandomState(0)
+    values = rng.rand(steps, 8)
+    start = datetime(2018, 1, 1)
+
+    # Python lists, as T1DSimEnv kept them before
+    tracemalloc.start()
+    lists = [[] for _ in range(8)]
+    for k in range(steps):
+        lists[0].append(start + timedelta(minutes=3 * k))
+        for j in range(1, 8):
+            lists[j].append(float(values[k, j]))
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    history = History()
+    for k in range(steps):
+        history.append(3 * k, *values[k, 1:6])
+        history.record_action(values[k, 6], values[k, 7])
+    buffer_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print("Memory per simulated day (3 min samples): lists {:.0f} kB, "
+          "buffers {:.0f} kB".format(list_bytes / days / 1e3,
+                                     buffer_bytes / days / 1e3))
+
+    tic = time.time()
+    for _ in range(100):
+        history.view()
+    t_view = (time.time() - tic) / 100
+    tic = time.time()
+    for _ in range(10):
+        history.to_frame(start)
+    t_frame = (time.time() - tic) / 10
+    tic = time.time()
+    for _ in range(10):
+        df = pd.DataFrame()
+        df["Time"] = pd.Series(lists[0])
+        for j, name in enumerate(History.COLUMNS):
+            df[name] = pd.Series(lists[j + 1])
+        df.set_index("Time")
+    t_lists = (time.time() - tic) / 10
+    print("After {} days: view {:.3f} ms, DataFrame {:.2f} ms, DataFrame "
+          "from lists {:.2f} ms".format(days, 1e3 * t_view, 1e3 * t_frame,
+                                        1e3 * t_lists))
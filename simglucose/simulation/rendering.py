@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import numpy as np
 import logging
 from datetime import timedelta
 
@@ -11,6 +12,11 @@ class Viewer(object):
         self.start_time = start_time
         self.patient_name = patient_name
         self.fig, self.axes, self.lines = self.initialize()
+        # Plot coordinates and running (min, max) of the rows rendered so far
+        self._t0 = mdates.date2num(start_time)
+        self._x = np.empty(512)
+        self._n = 0
+        self._range = {}
         self.update()
 
     def initialize(self):
@@ -32,14 +38,8 @@ class Viewer(object):
 
         lines = [lineBG, lineCGM, lineCHO, lineIns, lineLBGI, lineHBGI, lineRI]
 
-        axes[0].set_ylim([70, 180])
-        axes[1].set_ylim([-5, 30])
-        axes[2].set_ylim([-0.5, 1])
-        axes[3].set_ylim([0, 5])
-
+        reset_limits(axes, self.start_time)
         for ax in axes:
-            ax.set_xlim(
-                [self.start_time, self.start_time + timedelta(hours=3)])
             ax.legend()
 
         # Plot zone patches
@@ -66,52 +66,72 @@ class Viewer(object):
         self.fig.canvas.flush_events()
 
     def render(self, data):
-        self.lines[0].set_xdata(data.index.values)
-        self.lines[0].set_ydata(data['BG'].values)
-
-        self.lines[1].set_xdata(data.index.values)
-        self.lines[1].set_ydata(data['CGM'].values)
+        """
+        data is the HistoryView of the environment. Only the rows added
+        since the last call are processed here; the lines are handed the
+        views themselves. When the history has shrunk (the environment was
+        restored to a snapshot), everything is recomputed and the axes
+        limits start over.
+        """
+        n = len(data.Time)
+        if n < self._n:
+            self._n = 0
+            self._range = {}
+            reset_limits(self.axes, self.start_time)
+        new = slice(self._n, n)
+        if n > len(self._x):
+            x = np.empty(max(2 * len(self._x), n))
+            x[:self._n] = self._x[:self._n]
+            self._x = x
+        self._x[new] = self._t0 + data.Time[new] / (24 * 60.0)
+        x = self._x[:n]
+        for name in ('BG', 'CGM', 'CHO', 'insulin', 'Risk'):
+            values = getattr(data, name)[new]
+            values = values[~np.isnan(values)]
+            if len(values):
+                lo, hi = self._range.get(name, (np.inf, -np.inf))
+                self._range[name] = (min(lo, values.min()), max(hi, values.max()))
+        self._n = n
+        timemax = self.start_time + timedelta(minutes=int(data.Time[-1]))
+
+        self.lines[0].set_data(x, data.BG)
+        self.lines[1].set_data(x, data.CGM)
 
         self.axes[0].draw_artist(self.axes[0].patch)
         self.axes[0].draw_artist(self.lines[0])
         self.axes[0].draw_artist(self.lines[1])
 
-        adjust_ylim(self.axes[0], min(min(data['BG']), min(data['CGM'])),
-                    max(max(data['BG']), max(data['CGM'])))
-        adjust_xlim(self.axes[0], data.index[-1])
+        adjust_ylim(self.axes[0], min(self._range['BG'][0], self._range['CGM'][0]),
+                    max(self._range['BG'][1], self._range['CGM'][1]))
+        adjust_xlim(self.axes[0], timemax)
 
-        self.lines[2].set_xdata(data.index.values)
-        self.lines[2].set_ydata(data['CHO'].values)
+        self.lines[2].set_data(x, data.CHO)
 
         self.axes[1].draw_artist(self.axes[1].patch)
         self.axes[1].draw_artist(self.lines[2])
 
-        adjust_ylim(self.axes[1], min(data['CHO']), max(data['CHO']))
-        adjust_xlim(self.axes[1], data.index[-1])
+        if 'CHO' in self._range:
+            adjust_ylim(self.axes[1], *self._range['CHO'])
+        adjust_xlim(self.axes[1], timemax)
 
-        self.lines[3].set_xdata(data.index.values)
-        self.lines[3].set_ydata(data['insulin'].values)
+        self.lines[3].set_data(x, data.insulin)
 
         self.axes[2].draw_artist(self.axes[2].patch)
         self.axes[2].draw_artist(self.lines[3])
-        adjust_ylim(self.axes[2], min(data['insulin']), max(data['insulin']))
-        adjust_xlim(self.axes[2], data.index[-1])
-
-        self.lines[4].set_xdata(data.index.values)
-        self.lines[4].set_ydata(data['LBGI'].values)
+        if 'insulin' in self._range:
+            adjust_ylim(self.axes[2], *self._range['insulin'])
+        adjust_xlim(self.axes[2], timemax)
 
-        self.lines[5].set_xdata(data.index.values)
-        self.lines[5].set_ydata(data['HBGI'].values)
-
-        self.lines[6].set_xdata(data.index.values)
-        self.lines[6].set_ydata(data['Risk'].values)
+        self.lines[4].set_data(x, data.LBGI)
+        self.lines[5].set_data(x, data.HBGI)
+        self.lines[6].set_data(x, data.Risk)
 
         self.axes[3].draw_artist(self.axes[3].patch)
         self.axes[3].draw_artist(self.lines[4])
         self.axes[3].draw_artist(self.lines[5])
         self.axes[3].draw_artist(self.lines[6])
-        adjust_ylim(self.axes[3], min(data['Risk']), max(data['Risk']))
-        adjust_xlim(self.axes[3], data.index[-1], xlabel=True)
+        adjust_ylim(self.axes[3], *self._range['Risk'])
+        adjust_xlim(self.axes[3], timemax, xlabel=True)
 
         self.update()
 
@@ -119,6 +139,15 @@ class Viewer(object):
         plt.close(self.fig)
 
 
+def reset_limits(axes, start_time):
+    axes[0].set_ylim([70, 180])
+    axes[1].set_ylim([-5, 30])
+    axes[2].set_ylim([-0.5, 1])
+    axes[3].set_ylim([0, 5])
+    for ax in axes:
+        ax.set_xlim([start_time, start_time + timedelta(hours=3)])
+
+
 def adjust_ylim(ax, ymin, ymax):
     ylim = ax.get_ylim()
     update = False
@@ -0,0 +1,197 @@
+"""
+The reward window of T1DSimEnv: the CGM readings of the last hour and their
+risk indices, kept in fixed double-write ring buffers.
+
+Every reading is written twice, at i and i + size, so the latest size
+readings are always one contiguous slice and reward functions get a
+read-only array view without copying. The window sums of LBGI, HBGI and
+risk are updated as readings enter and leave, and recomputed exactly once
+per turn of the ring so that rounding errors do not accumulate.
+"""
+from simglucose.analysis.risk import risk, risk_values
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def risk_diff(BG_last_hour):
+    """
+    Decrease of the risk index between the last two readings
+    """
+    if len(BG_last_hour) < 2:
+        return 0
+    else:
+        _, _, risk_current = risk(BG_last_hour[-1])
+        _, _, risk_prev = risk(BG_last_hour[-2])
+        return risk_prev - risk_current
+
+
+class RewardWindow(object):
+    # Rows of the risk buffer
+    LBGI, HBGI, RISK = range(3)
+
+    def __init__(self, size):
+        self.size = size
+        self._CGM = np.zeros(2 * size)
+        self._risk = np.zeros((3, 2 * size))
+        self._sums = [0.0, 0.0, 0.0]
+        self._head = 0
+        self._n = 0
+
+    def __len__(self):
+        return min(self._n, self.size)
+
+    def clear(self):
+        self._head = 0
+        self._n = 0
+        self._sums = [0.0, 0.0, 0.0]
+
+    def push(self, CGM):
+        """
+        Add a reading, dropping the oldest one once the window is full
+        """
+        size = self.size
+        h = self._head
+        values = risk(CGM)
+        sums = self._sums
+        buf = self._risk
+        full = self._n >= size
+        for row in range(3):
+            if full:
+                sums[row] -= buf[row, h]
+            buf[row, h] = buf[row, h + size] = values[row]
+            sums[row] += values[row]
+        self._CGM[h] = self._CGM[h + size] = CGM
+        self._n += 1
+        self._head = h + 1
+        if self._head == size:
+            self._head = 0
+            self._sums = buf[:, :size].sum(axis=1).tolist()
+
+    def extend(self, values):
+        for CGM in values:
+            self.push(CGM)
+
+    def _slice(self):
+        m = len(self)
+        end = self._head + self.size
+        return slice(end - m, end)
+
+    def view(self):
+        """
+        Read-only view of the readings in the window, oldest first
+        """
+        view = self._CGM[self._slice()]
+        view.flags.writeable = False
+        return view
+
+    def risk_view(self):
+        """
+        Read-only (3, n) view of LBGI, HBGI and risk of the readings in the
+        window
+        """
+        view = self._risk[:, self._slice()]
+        view.flags.writeable = False
+        return view
+
+    def risk_diff(self):
+        """
+        risk_diff of the window from the stored risk indices
+        """
+        if len(self) < 2:
+            return 0
+        end = self._head + self.size
+        return self._risk[self.RISK, end - 2] - self._risk[self.RISK, end - 1]
+
+    def risk_index(self):
+        """
+        Mean (LBGI, HBGI, risk) over the window, as risk.risk_index of the
+        readings with the window length as horizon
+        """
+        m = len(self)
+        if m == 0:
+            return (np.nan, np.nan, np.nan)
+        return tuple(s / m for s in self._sums)
+
+
+def batch_risk_diff(BG_last_hour):
+    """
+    risk_diff of each row of an (N, W) window, NaN-padded on the left for
+    rows with fewer readings
+    """
+    _, _, risk_prev = risk_values(BG_last_hour[:, -2])
+    _, _, risk_current = risk_values(BG_last_hour[:, -1])
+    diff = risk_prev - risk_current
+    diff[np.isnan(diff)] = 0
+    return diff
+
+
+class BatchRewardWindow(object):
+    """
+    The reward windows of N environments stepped in lockstep: an (N, 2 size)
+    double-write ring buffer with one head. Rows restarted by reset_rows
+    are NaN before their first reading.
+    """
+    def __init__(self, n, size):
+        self.size = size
+        self._CGM = np.full((n, 2 * size), np.nan)
+        self._head = 0
+
+    def push(self, CGM):
+        """
+        Add one reading to every row
+        """
+        h = self._head
+        self._CGM[:, h] = self._CGM[:, h + self.size] = CGM
+        self._head = (h + 1) % self.size
+
+    def reset_rows(self, rows, CGM):
+        """
+        Restart rows with CGM as their only reading
+        """
+        self._CGM[rows] = np.nan
+        last = (self._head - 1) % self.size
+        self._CGM[rows, last] = self._CGM[rows, last + self.size] = CGM
+
+    def view(self):
+        """
+        Read-only (N, size) view of the windows, oldest first
+        """
+        view = self._CGM[:, self._head:self._head + self.size]
+        view.flags.writeable = False
+        return view
+
+
+if __name__ == "__main__":
+    import time
+    from simglucose.analysis.risk import risk_index
+
+    size = 20
+    steps = 100000
+    CGM = 140 + 60 * np.sin(np.arange(steps) / 50.0) + np.random.RandomState(0).randn(steps)
+
+    # As T1DSimEnv.step did: slice the history into a list, then risk_index
+    # of one-element lists
+    hist = []
+    tic = time.time()
+    for k in range(steps):
+        hist.append(CGM[k])
+        window = hist[-size:]
+        if len(window) >= 2:
+            reward = risk_index([window[-2]], 1)[2] - risk_index([window[-1]], 1)[2]
+    t_list = (time.time() - tic) / steps
+
+    window = RewardWindow(size)
+    tic = time.time()
+    for k in range(steps):
+        window.push(CGM[k])
+        fast = window.risk_diff()
+    t_ring = (time.time() - tic) / steps
+
+    print("Reward per step: list window {:.1f} us, ring window {:.1f} us".format(
+        1e6 * t_list, 1e6 * t_ring))
+    print("Same reward: {}, window risk_index error {:.1e}".format(
+        reward == fast,
+        np.max(np.abs(np.array(window.risk_index())
+                      - np.array(risk_index(list(CGM[-size:]), size))))))
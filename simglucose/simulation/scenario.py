@@ -11,12 +11,45 @@ class Scenario(object):
     def __init__(self, start_time):
         self.start_time = start_time
 
+    @property
+    def start_time(self):
+        return self._start_time
+
+    @start_time.setter
+    def start_time(self, start_time):
+        self._start_time = start_time
+        self._clock_changed()
+
+    def _clock_changed(self):
+        """
+        Called whenever start_time is set, for subclasses that precompute
+        anything from it
+        """
+        pass
+
     def get_action(self, t):
         raise NotImplementedError
 
+    def get_action_minute(self, minute):
+        """
+        The action at an integer number of minutes after start_time. This is
+        what T1DSimEnv queries every simulated minute; subclasses override
+        it to avoid building a datetime per call.
+        """
+        return self.get_action(self.start_time + timedelta(minutes=minute))
+
     def reset(self):
         raise NotImplementedError
 
+    def snapshot(self):
+        """
+        Capture the internal state of the scenario, None if it has none
+        """
+        return None
+
+    def restore(self, snapshot):
+        pass
+
 
 class CustomScenario(Scenario):
     def __init__(self, start_time, scenario):
@@ -26,20 +59,50 @@ class CustomScenario(Scenario):
                    scenario.Action. When time is a timedelta, it is
                    interpreted as the time of start_time + time. Time in double
                    type is interpreted as time in timedelta with unit of hours
+        The meal table is built on first use and rebuilt when scenario or
+        start_time is set again, not when the list is modified in place.
         '''
-        Scenario.__init__(self, start_time=start_time)
         self.scenario = scenario
+        Scenario.__init__(self, start_time=start_time)
+
+    @property
+    def scenario(self):
+        return self._scenario
+
+    @scenario.setter
+    def scenario(self, scenario):
+        self._scenario = scenario
+        self._meals = None
+
+    def _clock_changed(self):
+        self._meals = None
+
+    def _meal_table(self):
+        '''
+        ({datetime: meal}, {minute offset: meal}), the first action listed
+        for each time
+        '''
+        if self._meals is None:
+            by_time = {}
+            for time, action in self.scenario:
+                by_time.setdefault(parseTime(time, self.start_time), action)
+            by_minute = {}
+            for t, action in by_time.items():
+                minute, rest = divmod(t - self.start_time, timedelta(minutes=1))
+                if not rest:
+                    by_minute[minute] = action
+            self._meals = (by_time, by_minute)
+        return self._meals
 
     def get_action(self, t):
         if not self.scenario:
             return Action(meal=0)
-        else:
-            times, actions = tuple(zip(*self.scenario))
-            times2compare = [parseTime(time, self.start_time) for time in times]
-            if t in times2compare:
-                idx = times2compare.index(t)
-                return Action(meal=actions[idx])
+        return Action(meal=self._meal_table()[0].get(t, 0))
+
+    def get_action_minute(self, minute):
+        if not self.scenario:
             return Action(meal=0)
+        return Action(meal=self._meal_table()[1].get(minute, 0))
 
     def reset(self):
         pass
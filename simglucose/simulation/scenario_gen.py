@@ -1,10 +1,14 @@
 from simglucose.simulation.scenario import Action, Scenario
 import numpy as np
 from scipy.stats import truncnorm
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import namedtuple
 import logging
 
 logger = logging.getLogger(__name__)
+ScenarioSnapshot = namedtuple('ScenarioSnapshot',
+                              ['meal_time', 'meal_amount', 'rand_state'])
+_US = timedelta(microseconds=1)
 
 
 class RandomScenario(Scenario):
@@ -12,11 +16,27 @@ class RandomScenario(Scenario):
         Scenario.__init__(self, start_time=start_time)
         self.seed = seed
 
+    def _clock_changed(self):
+        # Microseconds from midnight to start_time
+        if self.start_time is None:
+            self._start_us = None
+        else:
+            self._start_us = (self.start_time - datetime.combine(
+                self.start_time.date(), datetime.min.time())) // _US
+
     def get_action(self, t):
         # t must be datetime.datetime object
         delta_t = t - datetime.combine(t.date(), datetime.min.time())
-        t_sec = delta_t.total_seconds()
+        return self._action_at(delta_t.total_seconds())
 
+    def get_action_minute(self, minute):
+        # The time of day of start_time + minute, exactly as get_action
+        # computes it from the datetime
+        t_us = (self._start_us + minute * 60000000) % 86400000000
+        return self._action_at(t_us / 10**6)
+
+    def _action_at(self, t_sec):
+        # t_sec: seconds since midnight
         if t_sec < 1:
             logger.info('Creating new one day scenario ...')
             self.scenario = self.create_scenario()
@@ -63,6 +83,21 @@ class RandomScenario(Scenario):
         self.random_gen = np.random.RandomState(self.seed)
         self.scenario = self.create_scenario()
 
+    def snapshot(self):
+        name, key, pos, has_gauss, cached_gaussian = \
+            self.random_gen.get_state()
+        key = key.copy()
+        key.flags.writeable = False
+        return ScenarioSnapshot(
+            meal_time=tuple(self.scenario['meal']['time']),
+            meal_amount=tuple(self.scenario['meal']['amount']),
+            rand_state=(name, key, pos, has_gauss, cached_gaussian))
+
+    def restore(self, snapshot):
+        self.scenario = {'meal': {'time': list(snapshot.meal_time),
+                                  'amount': list(snapshot.meal_amount)}}
+        self.random_gen.set_state(snapshot.rand_state)
+
     @property
     def seed(self):
         return self._seed
@@ -0,0 +1,348 @@
+"""
+Streaming batch simulation over lightweight job specs.
+
+sim_engine.batch_sim pickles a whole SimObj per run to the workers, waits
+for every run and returns all histories at once. Here a job is a JobSpec
+of names, seeds and a controller config; persistent worker processes build
+the environment of each job locally, and results are yielded as soon as
+they complete, in completion order, with progress and ETA reporting. The
+output mode decides what comes back to the parent:
+
+    - "metrics": the glycemic metrics of the BG trace only
+    - "write": the history is written to a CSV file in the worker and only
+      its path comes back, with the metrics
+    - "keep": the history DataFrame itself, with the metrics
+
+so a large batch in the "metrics" or "write" mode never holds more than a
+few histories in the parent at once.
+
+With a cache directory, the results are also stored in a cache.ResultCache
+and jobs already in it are not simulated again. Running jobs also
+checkpoint there (see sim_engine.SimObj), so after a crash the same batch
+resumes the unfinished jobs where their last checkpoint left them.
+"""
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.sim_engine import SimObj
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.controller.pid_ctrller import PIDController
+from simglucose.simulation.cache import ResultCache, cell_key, library_fingerprint
+from simglucose.analysis.risk import glycemic_metrics
+from simglucose.registry import PATIENTS
+from simglucose import seeding
+from multiprocessing import Pool
+from collections import namedtuple
+from datetime import datetime, timedelta
+import time
+import os
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+OUTPUTS = ("metrics", "write", "keep")
+
+# Controllers a JobSpec can name
+CONTROLLERS = {
+    "BBController": BBController,
+    "PIDController": PIDController,
+}
+
+# One simulation:
+#   - patient: name in vpatient_params.csv
+#   - seed: seed of the RandomScenario, and of the CGM noise unless
+#     cgm_seed is given
+#   - controller: (name in CONTROLLERS, keyword arguments)
+#   - duration: simulated time, a timedelta
+JobSpec = namedtuple(
+    "JobSpec",
+    ["patient", "seed", "controller", "duration", "start_time", "sensor",
+     "pump", "cgm_seed"],
+    defaults=(("BBController", {}), timedelta(days=1),
+              datetime(2018, 1, 1, 0, 0, 0), "Dexcom", "Insulet", None))
+
+# The outcome of the job at index of the submitted jobs. history is the
+# DataFrame in the "keep" mode and path the CSV file in the "write" mode,
+# None otherwise. cached is True when the result was read from the cache.
+JobResult = namedtuple(
+    "JobResult", ["index", "spec", "metrics", "history", "path", "cached"],
+    defaults=(False,))
+
+# Progress of a batch; total and eta are None when the number of jobs is
+# unknown
+Progress = namedtuple("Progress", ["done", "total", "elapsed", "eta"])
+
+SchedulerConfig = namedtuple("SchedulerConfig",
+                             ["output", "path", "cache", "checkpoint_every"])
+
+# Settings of the batch in a worker process, see _init_worker
+_config = None
+_cache = None
+
+
+def _init_worker(config):
+    global _config, _cache
+    _config = config
+    _cache = None if config.cache is None else ResultCache(config.cache)
+    # Load the parameter table once per process
+    len(PATIENTS)
+
+
+def build_sim(spec):
+    """
+    The SimObj of a JobSpec
+    """
+    name, kwargs = spec.controller
+    try:
+        controller = CONTROLLERS[name](**kwargs)
+    except KeyError:
+        raise KeyError("Unknown controller {}, expected one of {}.".format(
+            name, sorted(CONTROLLERS)))
+    cgm_seed = spec.seed if spec.cgm_seed is None else spec.cgm_seed
+    env = T1DSimEnv(T1DPatient.withName(spec.patient),
+                    CGMSensor.withName(spec.sensor, seed=cgm_seed),
+                    InsulinPump.withName(spec.pump),
+                    RandomScenario(start_time=spec.start_time, seed=spec.seed))
+    return SimObj(env, controller, spec.duration, animate=False)
+
+
+def _result(config, index, spec, metrics, history, cached=False):
+    """
+    The JobResult of a simulated History for the output mode of config
+    """
+    frame = None
+    path = None
+    if config.output == "keep":
+        frame = history.to_frame(spec.start_time)
+    elif config.output == "write":
+        path = os.path.join(config.path, "{}_seed{}_{}.csv".format(
+            spec.patient, spec.seed, index))
+        history.to_frame(spec.start_time).to_csv(path)
+    return JobResult(index, spec, metrics, frame, path, cached)
+
+
+def run_job(task):
+    """
+    Simulate one (index, JobSpec, cache key) task and return its JobResult
+    """
+    index, spec, key = task
+    sim = build_sim(spec)
+    if _cache is not None:
+        sim.checkpoint_file = os.path.join(_cache.path, key + ".ckpt")
+        sim.checkpoint_every = _config.checkpoint_every
+    sim.simulate()
+    env = sim.env
+    metrics = glycemic_metrics(env.history.column("BG"), env.sample_time)
+    metrics = {name: float(value) for name, value in metrics.items()}
+    if _cache is not None:
+        _cache.save_history(key, env.history)
+        try:
+            os.remove(sim.checkpoint_file)
+        except FileNotFoundError:
+            # Another scheduler on the same cache ran this cell too
+            pass
+    return _result(_config, index, spec, metrics, env.history)
+
+
+def print_progress(progress):
+    """
+    Default progress report, one line on stderr
+    """
+    if progress.total is None:
+        line = "{} jobs done, {:.0f} s elapsed".format(progress.done, progress.elapsed)
+    else:
+        line = "{}/{} jobs done, {:.0f} s elapsed, ETA {:.0f} s".format(
+            progress.done, progress.total, progress.elapsed, progress.eta)
+    end = "\n" if progress.done == progress.total else "\r"
+    sys.stderr.write(line + end)
+    sys.stderr.flush()
+
+
+class Scheduler(object):
+    def __init__(self, output="metrics", path=None, processes=None, cache=None,
+                 checkpoint_every=timedelta(hours=6)):
+        """
+        Scheduler constructor.
+        Inputs:
+            - output: one of OUTPUTS, see the module docstring
+            - path: directory of the CSV files in the "write" mode
+            - processes: worker processes, os.cpu_count() by default; 1 runs
+              the jobs in this process. The workers persist until close.
+            - cache: directory of a ResultCache, None for no caching
+            - checkpoint_every: simulated time between the checkpoints of
+              running jobs, with a cache
+        """
+        if output not in OUTPUTS:
+            raise ValueError("output must be one of {}, got {}.".format(OUTPUTS, output))
+        if output == "write":
+            if path is None:
+                raise ValueError("The write output needs a path.")
+            os.makedirs(path, exist_ok=True)
+        self.config = SchedulerConfig(output, path, cache, checkpoint_every)
+        self.cache = None if cache is None else ResultCache(cache)
+        if processes is None:
+            processes = os.cpu_count()
+        self.processes = processes
+        self._pool = None
+        if processes > 1:
+            self._pool = Pool(processes, initializer=_init_worker,
+                              initargs=(self.config,))
+
+    def imap(self, jobs, chunksize=1, progress=None, interval=1.0):
+        """
+        Run jobs, an iterable of JobSpec, and yield their JobResults as
+        they complete. progress is True for print_progress or a callable
+        taking a Progress, called at most every interval seconds and once
+        at the end.
+        """
+        if progress is True:
+            progress = print_progress
+        cache = self.cache
+        hits = []
+        duplicates = {}
+        if cache is None:
+            total = len(jobs) if hasattr(jobs, "__len__") else None
+            tasks = ((index, spec, None) for index, spec in enumerate(jobs))
+        else:
+            # Cached jobs are answered first, from the cache. Jobs with the
+            # same key are simulated once, since they would share a
+            # checkpoint file, and answered from the first one's result.
+            fingerprint = library_fingerprint()
+            tasks = []
+            for index, spec in enumerate(jobs):
+                key = cell_key(spec, fingerprint)
+                if key in cache:
+                    hits.append((index, spec, key))
+                elif key in duplicates:
+                    duplicates[key].append((index, spec))
+                else:
+                    duplicates[key] = []
+                    tasks.append((index, spec, key))
+            total = len(hits) + len(tasks) + sum(len(d) for d in duplicates.values())
+            logger.info("{} of {} jobs cached".format(len(hits), total))
+        if self._pool is None:
+            _init_worker(self.config)
+            results = map(run_job, tasks)
+        else:
+            results = self._pool.imap_unordered(run_job, tasks, chunksize=chunksize)
+
+        tic = time.time()
+        last = tic
+        done = 0
+        for result in self._stream(hits, tasks, duplicates, results):
+            done += 1
+            now = time.time()
+            if progress is not None and (now - last >= interval or done == total):
+                last = now
+                elapsed = now - tic
+                eta = None if total is None else elapsed / done * (total - done)
+                progress(Progress(done, total, elapsed, eta))
+            yield result
+        logger.info("{} jobs took {} sec.".format(done, time.time() - tic))
+
+    def _cached(self, index, spec, key):
+        history = None
+        if self.config.output != "metrics":
+            history = self.cache.history(key)
+        return _result(self.config, index, spec, self.cache.metrics(key), history,
+                       cached=True)
+
+    def _stream(self, hits, tasks, duplicates, results):
+        cache = self.cache
+        for index, spec, key in hits:
+            yield self._cached(index, spec, key)
+        if cache is not None:
+            keys = {index: key for index, _, key in tasks}
+        for result in results:
+            if cache is None:
+                yield result
+                continue
+            key = keys[result.index]
+            cache.add(key, result.spec, result.metrics)
+            yield result
+            for index, spec in duplicates[key]:
+                yield self._cached(index, spec, key)
+
+    def run(self, jobs, chunksize=1, progress=None):
+        """
+        Run jobs and return their JobResults in the order of jobs
+        """
+        results = list(self.imap(jobs, chunksize, progress))
+        results.sort(key=lambda result: result.index)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def grid(patients, seeds, **kwargs):
+    """
+    The JobSpecs of every patient with every scenario seed, sharing kwargs
+    """
+    return [JobSpec(patient, seed, **kwargs) for patient in patients for seed in seeds]
+
+
+def seeded_grid(patients, replicates, seed, **kwargs):
+    """
+    The JobSpecs of every patient with replicates independent scenario and
+    sensor seeds: replicate j of patient i draws them from
+    seeding.cell_seeds(seed, i, j), whatever the worker or order it runs in
+    """
+    root = seeding.as_sequence(seed)
+    jobs = []
+    for i, patient in enumerate(patients):
+        for j in range(replicates):
+            cell = seeding.cell_seeds(root, i, j)
+            jobs.append(JobSpec(patient, cell.scenario, cgm_seed=cell.sensor, **kwargs))
+    return jobs
+
+
+if __name__ == "__main__":
+    import pickle
+    import shutil
+    import tempfile
+    import tracemalloc
+    import pandas as pd
+
+    patients = PATIENTS.names[:3]
+    jobs = grid(patients, range(4), duration=timedelta(hours=12))
+    print("{} jobs of 12 hours, {} bytes pickled per job".format(
+        len(jobs), len(pickle.dumps((0, jobs[0])))))
+
+    for output in ("keep", "metrics"):
+        tracemalloc.start()
+        with Scheduler(output=output) as scheduler:
+            tic = time.time()
+            kept = [r for r in scheduler.imap(jobs, progress=True)]
+            toc = time.time()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{:>7}: {:.1f} s, parent peak {:.0f} kB".format(
+            output, toc - tic, peak / 1e3))
+
+    cache = tempfile.mkdtemp()
+    for attempt in ("cold", "warm"):
+        with Scheduler(output="metrics", cache=cache) as scheduler:
+            tic = time.time()
+            cached = scheduler.run(jobs)
+            toc = time.time()
+        print("{} cache: {:.2f} s, {} of {} jobs from the cache, same metrics: {}".format(
+            attempt, toc - tic, sum(r.cached for r in cached), len(jobs),
+            [r.metrics for r in cached] == [r.metrics for r in sorted(kept, key=lambda r: r.index)]))
+    shutil.rmtree(cache)
+
+    table = pd.DataFrame([dict(patient=r.spec.patient, seed=r.spec.seed, **r.metrics)
+                          for r in sorted(kept, key=lambda r: r.index)])
+    print(table.groupby("patient")[["70<=BG<=180", "Risk Index"]].mean().round(2))
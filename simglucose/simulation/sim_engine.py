@@ -1,4 +1,9 @@
+from simglucose.simulation.history import HistoryView
+from collections import namedtuple
+from datetime import timedelta
+import numpy as np
 import logging
+import pickle
 import time
 import os
 
@@ -11,6 +16,38 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Everything needed to continue a simulation in a new process: the
+# EnvSnapshot, the controller snapshot, the HistoryView of the environment,
+# the last (observation, reward, done, info) passed to the controller, and
+# whether the simulation had finished.
+SimCheckpoint = namedtuple(
+    "SimCheckpoint", ["env", "controller", "history", "step", "finished"])
+
+
+def save_checkpoint(filename, checkpoint):
+    """
+    Write a SimCheckpoint atomically: a crash while writing leaves the
+    previous checkpoint in place
+    """
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_checkpoint(filename):
+    """
+    The SimCheckpoint in filename, None if there is none
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
 
 class SimObj(object):
     def __init__(self,
@@ -18,23 +55,75 @@ class SimObj(object):
                  controller,
                  sim_time,
                  animate=True,
-                 path=None):
+                 path=None,
+                 checkpoint_file=None,
+                 checkpoint_every=timedelta(hours=6)):
+        """
+        With a checkpoint_file, simulate saves a SimCheckpoint there every
+        checkpoint_every of simulated time and when it finishes, and
+        starts by resuming from the checkpoint in that file if there is
+        one. A finished checkpoint is only restored, not simulated again.
+        """
         self.env = env
         self.controller = controller
         self.sim_time = sim_time
         self.animate = animate
         self._ctrller_kwargs = None
         self.path = path
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_every = checkpoint_every
+
+    def checkpoint(self, step, finished=False):
+        """
+        The SimCheckpoint of the simulation after step, the last
+        (observation, reward, done, info) of the environment
+        """
+        history = HistoryView(*[np.array(column) for column in self.env.history.view()])
+        return SimCheckpoint(env=self.env.snapshot(),
+                             controller=self.controller.snapshot(),
+                             history=history,
+                             step=tuple(step),
+                             finished=finished)
+
+    def restore(self, checkpoint):
+        """
+        Continue from a SimCheckpoint of a simulation of the same patient,
+        sensor, scenario and controller
+        """
+        self.env.restore(checkpoint.env, history=checkpoint.history)
+        self.controller.restore(checkpoint.controller)
 
     def simulate(self):
-        self.controller.reset()
-        obs, reward, done, info = self.env.reset()
+        checkpoint = None
+        if self.checkpoint_file is not None:
+            checkpoint = load_checkpoint(self.checkpoint_file)
+        if checkpoint is None:
+            self.controller.reset()
+            obs, reward, done, info = self.env.reset()
+        else:
+            self.restore(checkpoint)
+            logger.info('Resuming {} at minute {}.'.format(
+                self.checkpoint_file, self.env.minute))
+            if checkpoint.finished:
+                return
+            obs, reward, done, info = checkpoint.step
         tic = time.time()
-        while self.env.time < self.env.scenario.start_time + self.sim_time:
+        # Compare integer minutes; datetimes are only built for the results
+        end = self.sim_time / timedelta(minutes=1)
+        every = self.checkpoint_every / timedelta(minutes=1)
+        next_checkpoint = self.env.minute + every
+        while self.env.minute < end:
             if self.animate:
                 self.env.render()
             action = self.controller.policy(obs, reward, done, **info)
             obs, reward, done, info = self.env.step(action)
+            if self.checkpoint_file is not None and self.env.minute >= next_checkpoint:
+                save_checkpoint(self.checkpoint_file,
+                                self.checkpoint((obs, reward, done, info)))
+                next_checkpoint += every
+        if self.checkpoint_file is not None:
+            save_checkpoint(self.checkpoint_file,
+                            self.checkpoint((obs, reward, done, info), finished=True))
         toc = time.time()
         logger.info('Simulation took {} seconds.'.format(toc - tic))
 
@@ -62,7 +151,26 @@ def sim(sim_object):
     return sim_object.results()
 
 
-def batch_sim(sim_instances, parallel=False):
+def batch_sim(sim_instances, parallel=False, checkpoint_dir=None,
+              checkpoint_every=timedelta(hours=6)):
+    """
+    Simulate SimObj instances and return all their histories. For large
+    batches of bundled patients, scheduler.Scheduler streams results from
+    lightweight job specs instead.
+
+    With a checkpoint_dir, simulation i checkpoints to
+    "<checkpoint_dir>/<i>_<patient name>.ckpt" every checkpoint_every of
+    simulated time. Calling batch_sim again with the same instances and
+    checkpoint_dir, e.g. after the process died, resumes the unfinished
+    simulations and only restores the finished ones.
+    """
+    if checkpoint_dir is not None:
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        for i, s in enumerate(sim_instances):
+            s.checkpoint_file = os.path.join(
+                checkpoint_dir, "{}_{}.ckpt".format(i, s.env.patient.name))
+            s.checkpoint_every = checkpoint_every
     tic = time.time()
     if parallel and pathos:
         with Pool() as p:
@@ -7,9 +7,12 @@ from simglucose.patient.t1dpatient import T1DPatient
 from simglucose.simulation.scenario_gen import RandomScenario
 from simglucose.simulation.scenario import CustomScenario
 from simglucose.analysis.report import report
+from simglucose.registry import PATIENTS, SENSORS, PUMPS
+from simglucose import seeding
+from simglucose.registry import (PATIENT_PARA_FILE, SENSOR_PARA_FILE,
+                                 INSULIN_PUMP_PARA_FILE)
 import pandas as pd
 import copy
-import pkg_resources
 import logging
 import os
 from datetime import datetime
@@ -18,20 +21,9 @@ import platform
 
 logger = logging.getLogger(__name__)
 
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/vpatient_params.csv"
-)
-SENSOR_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/sensor_params.csv"
-)
-INSULIN_PUMP_PARA_FILE = pkg_resources.resource_filename(
-    "simglucose", "params/pump_params.csv"
-)
-
 
 def pick_patients():
-    patient_params = pd.read_csv(PATIENT_PARA_FILE)
-    patient_names = list(patient_params["Name"].values)
+    patient_names = PATIENTS.names
     while True:
         select1 = input(
             "Select virtual patients:\n"
@@ -103,9 +95,8 @@ def pick_patients():
 
 
 def pick_cgm_sensor():
-    sensor_params = pd.read_csv(SENSOR_PARA_FILE)
-    sensor_names = list(sensor_params["Name"].values)
-    total_sensor_num = len(sensor_params.index)
+    sensor_names = SENSORS.names
+    total_sensor_num = len(sensor_names)
     while True:
         print("Select the CGM sensor:")
         for i in range(total_sensor_num):
@@ -146,8 +137,7 @@ def pick_cgm_seed():
 
 
 def pick_insulin_pump():
-    pump_params = pd.read_csv(INSULIN_PUMP_PARA_FILE)
-    pump_names = list(pump_params["Name"].values)
+    pump_names = PUMPS.names
     while True:
         print("Select the insulin pump:")
         for i, pump in enumerate(pump_names):
@@ -320,6 +310,9 @@ def simulate(
     save_path=None,
     animate=None,
     parallel=None,
+    checkpoint_dir=None,
+    checkpoint_every=timedelta(hours=6),
+    independent_cgm_noise=False,
 ):
     """
     Main user interface.
@@ -334,6 +327,15 @@ def simulate(
     save_path  - a string representing the directory to save simulation results.
     animate    - switch for animation. True/False.
     parallel   - switch for parallel computing. True/False.
+    checkpoint_dir   - a directory to checkpoint the simulations to, every
+                       checkpoint_every of simulated time. Running simulate
+                       again with the same arguments resumes from there;
+                       see sim_engine.batch_sim.
+    independent_cgm_noise - by default every patient's sensor noise is the
+                       same stream, seeded with cgm_seed, so the patients
+                       see identical noise sequences. True gives patient i
+                       its own stream, seeded from
+                       seeding.cell_seeds(cgm_seed, i).
     """
     if animate is None:
         animate = pick_animate()
@@ -376,14 +378,18 @@ def simulate(
 
     cgm_sensor = CGMSensor.withName(cgm_name, seed=cgm_seed)
 
-    def local_build_env(pname):
+    def local_build_env(i, pname):
         patient = T1DPatient.withName(pname)
+        sensor = cgm_sensor
+        if independent_cgm_noise:
+            seed = None if cgm_seed is None else seeding.cell_seeds(cgm_seed, i).sensor
+            sensor = CGMSensor.withName(cgm_name, seed=seed)
         insulin_pump = InsulinPump.withName(insulin_pump_name)
         scen = copy.deepcopy(scenario)
-        env = T1DSimEnv(patient, cgm_sensor, insulin_pump, scen)
+        env = T1DSimEnv(patient, sensor, insulin_pump, scen)
         return env
 
-    envs = [local_build_env(p) for p in patient_names]
+    envs = [local_build_env(i, p) for i, p in enumerate(patient_names)]
 
     ctrllers = [copy.deepcopy(controller) for _ in range(len(envs))]
     sim_instances = [
@@ -391,7 +397,9 @@ def simulate(
         for (e, c) in zip(envs, ctrllers)
     ]
 
-    results = batch_sim(sim_instances, parallel=parallel)
+    results = batch_sim(sim_instances, parallel=parallel,
+                        checkpoint_dir=checkpoint_dir,
+                        checkpoint_every=checkpoint_every)
 
     df = pd.concat(results, keys=[s.env.patient.name for s in sim_instances])
     results, ri_per_hour, zone_stats, figs, axes = report(df, cgm_sensor, save_path)
@@ -0,0 +1,263 @@
+"""
+N environments of the gym T1DSimEnv stepped in lockstep.
+
+The patients are one BatchT1DPatient, the sensors one BatchCGMSensor and
+the reward windows one BatchRewardWindow, so a step is a handful of array
+operations per simulated minute whatever N is. Each environment runs its
+own episodes: when one ends it is reset on its own, with a new patient
+(when several are given), start hour, scenario and seeds, as the gym
+wrapper does on reset.
+
+The rows of the BatchT1DPatient share the dopri5 step sizes, so an
+environment is not bit-identical to a single gym environment with the
+same seeds. Its BG drifts from it by up to a few 1e-4 mg/dL over a day,
+more with larger n; see BatchT1DPatient.
+"""
+from simglucose.patient.batch_t1dpatient import BatchT1DPatient
+from simglucose.patient.params import PARAM_FIELDS
+from simglucose.sensor.cgm import BatchCGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.simulation.reward import BatchRewardWindow, batch_risk_diff
+from simglucose.registry import PATIENTS
+from simglucose import seeding
+from datetime import datetime
+import numpy as np
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VectorT1DSimEnv(object):
+    SENSOR_HARDWARE = "Dexcom"
+    INSULIN_PUMP_HARDWARE = "Insulet"
+    # Minutes of scenario meals looked up at a time per environment
+    MEAL_CHUNK = 1440
+
+    def __init__(self, n, patient_name=None, custom_scenario=None,
+                 reward_fun=None, seed=None, max_episode_steps=None):
+        """
+        VectorT1DSimEnv constructor.
+        Inputs:
+            - n: number of environments
+            - patient_name, custom_scenario: as for the gym T1DSimEnv; a
+              list is sampled from at every episode. Custom scenarios are
+              copied for each episode.
+            - reward_fun: maps the (n, W) read-only array of the CGM
+              readings of the last hour (oldest first, NaN before the start
+              of the episode) to (n,) rewards; the vectorized risk_diff by
+              default
+            - seed: seeds the episode generators of all environments, see
+              seed
+            - max_episode_steps: truncate episodes after as many steps
+        """
+        if patient_name is None:
+            patient_name = ["adolescent#001"]
+        self.n = n
+        self.patient_name = patient_name
+        self.custom_scenario = custom_scenario
+        self.reward_fun = batch_risk_diff if reward_fun is None else reward_fun
+        self.max_episode_steps = max_episode_steps
+
+        names = patient_name if isinstance(patient_name, list) else [patient_name]
+        self._patients = {}
+        for name in names:
+            params = PATIENTS.byName(name)
+            self._patients[name] = (
+                params[list(PARAM_FIELDS)].to_numpy(dtype=float),
+                params.iloc[2:15].to_numpy(dtype=float))
+        param_matrix, default_state = self._patients[names[0]]
+        self.patient = BatchT1DPatient.fromArrays(
+            np.tile(param_matrix, (n, 1)), np.tile(default_state, (n, 1)),
+            names=[names[0]] * n)
+        self.pump = InsulinPump.withName(self.INSULIN_PUMP_HARDWARE)
+        self.sensor = BatchCGMSensor.withName(self.SENSOR_HARDWARE, [None] * n)
+        self.sample_time = self.sensor.sample_time
+        self.reward_window = BatchRewardWindow(n, int(60 / self.sample_time))
+
+        self.scenarios = [None] * n
+        self._meals = np.zeros((n, self.MEAL_CHUNK))
+        self._meal_start = np.zeros(n, dtype=int)
+        self._t0 = np.zeros(n)
+        self._steps = np.zeros(n, dtype=int)
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Seed environment i with seeding.child(seed, i), or with each of a
+        sequence of n seeds or SeedSequences. Episode k of an environment
+        draws from seeding.cell_seeds(its seed, k).
+        """
+        if isinstance(seed, (list, tuple)):
+            if len(seed) != self.n:
+                raise ValueError("Expected {} seeds, got {}.".format(self.n, len(seed)))
+            self._seeds = [seeding.as_sequence(s) for s in seed]
+        else:
+            root = seeding.as_sequence(seed)
+            self._seeds = [seeding.child(root, i) for i in range(self.n)]
+        self._episodes = np.zeros(self.n, dtype=int)
+
+    @property
+    def minutes(self):
+        """(n,) minutes since the start of each episode"""
+        return np.rint(self.patient.t - self._t0).astype(int)
+
+    @property
+    def patient_names(self):
+        return list(self.patient.names)
+
+    def _fill_meals(self, rows, start):
+        for i, m in zip(rows, start):
+            scenario = self.scenarios[i]
+            self._meals[i] = [scenario.get_action_minute(k).meal
+                              for k in range(m, m + self.MEAL_CHUNK)]
+        self._meal_start[rows] = start
+
+    def _new_episodes(self, rows):
+        """
+        Start new episodes in rows; return their first CGM readings
+        """
+        patient_seeds = []
+        sensor_seeds = []
+        for i in rows:
+            cell = seeding.cell_seeds(self._seeds[i], int(self._episodes[i]))
+            self._episodes[i] += 1
+            rng = cell.rng
+            sensor_seed, scenario_seed, patient_seed = cell.sensor, cell.scenario, cell.patient
+            hour = int(rng.integers(0, 24))
+            start_time = datetime(2018, 1, 1, hour, 0, 0)
+
+            if isinstance(self.patient_name, list):
+                name = self.patient_name[rng.integers(len(self.patient_name))]
+            else:
+                name = self.patient_name
+            if self.patient.names[i] != name:
+                param_matrix, default_state = self._patients[name]
+                self.patient.set_patients([i], param_matrix, default_state, [name])
+
+            if isinstance(self.custom_scenario, list):
+                scenario = copy.deepcopy(
+                    self.custom_scenario[rng.integers(len(self.custom_scenario))])
+                scenario.reset()
+            elif self.custom_scenario is not None:
+                scenario = copy.deepcopy(self.custom_scenario)
+                scenario.reset()
+            else:
+                scenario = RandomScenario(start_time=start_time, seed=scenario_seed)
+            self.scenarios[i] = scenario
+            patient_seeds.append(patient_seed)
+            sensor_seeds.append(sensor_seed)
+
+        self.patient.reset_rows(rows, seeds=patient_seeds)
+        self.sensor.reset_rows(rows, sensor_seeds)
+        self._t0[rows] = self.patient.t
+        self._steps[rows] = 0
+        self._fill_meals(rows, np.zeros(len(rows), dtype=int))
+        CGM = self.sensor.measure(self.patient, rows)
+        self.reward_window.reset_rows(rows, CGM)
+        return CGM
+
+    def reset(self):
+        """
+        Start new episodes in all environments; return the (n,) CGM
+        observations
+        """
+        return self._new_episodes(np.arange(self.n))
+
+    def step(self, basal, bolus=0):
+        """
+        Apply (n,) basal rates (U/min), and optional boluses, for one sample
+        time. Return (observation, reward, done, info) with (n,) arrays.
+
+        Environments whose episode ends (BG < 10 or > 600 mg/dL, or
+        max_episode_steps) are reset: their observation is the first one
+        of the new episode and info["terminal_observation"] holds the last
+        one of the old episode (NaN for the others).
+        """
+        insulin = (self.pump.basal(np.broadcast_to(np.asarray(basal, dtype=float), (self.n,)))
+                   + self.pump.bolus(np.broadcast_to(np.asarray(bolus, dtype=float), (self.n,))))
+        index = np.arange(self.n)
+        CHO = 0.0
+        insulin_avg = 0.0
+        BG = 0.0
+        CGM = 0.0
+        for _ in range(int(self.sample_time)):
+            column = self.minutes - self._meal_start
+            ahead = np.flatnonzero(column >= self.MEAL_CHUNK)
+            if len(ahead):
+                self._fill_meals(ahead, self._meal_start[ahead] + self.MEAL_CHUNK)
+                column = self.minutes - self._meal_start
+            tmp_CHO = self._meals[index, column]
+
+            self.patient.step(tmp_CHO, insulin)
+            tmp_BG = self.patient.observation.Gsub
+            tmp_CGM = self.sensor.measure(self.patient)
+
+            # Compute moving average as the sample measurements
+            CHO += tmp_CHO / self.sample_time
+            insulin_avg += insulin / self.sample_time
+            BG += tmp_BG / self.sample_time
+            CGM += tmp_CGM / self.sample_time
+        self._steps += 1
+
+        self.reward_window.push(CGM)
+        reward = self.reward_fun(self.reward_window.view())
+        terminated = (BG < 10) | (BG > 600)
+        truncated = np.zeros(self.n, dtype=bool)
+        if self.max_episode_steps is not None:
+            truncated = ~terminated & (self._steps >= self.max_episode_steps)
+        done = terminated | truncated
+
+        obs = CGM.copy()
+        info = {
+            "bg": BG,
+            "meal": CHO,
+            "insulin": insulin_avg,
+            "TimeLimit.truncated": truncated,
+            "terminal_observation": np.where(done, CGM, np.nan),
+        }
+        rows = np.flatnonzero(done)
+        if len(rows):
+            logger.info("Resetting environments {}".format(rows))
+            obs[rows] = self._new_episodes(rows)
+        return obs, reward, done, info
+
+
+if __name__ == "__main__":
+    import time
+    from simglucose.patient.t1dpatient import T1DPatient
+    from simglucose.sensor.cgm import CGMSensor
+    from simglucose.simulation.env import T1DSimEnv
+    from simglucose.controller.base import Action
+
+    names = ["adolescent#001", "adult#001", "child#001"]
+    steps = 160  # 8 hours
+    for n in (10, 50):
+        rng = np.random.default_rng(0)
+        # Independent environments, one Python env per episode as the gym
+        # wrapper builds them
+        tic = time.time()
+        envs = []
+        for i in range(n):
+            start_time = datetime(2018, 1, 1, int(rng.integers(0, 24)))
+            envs.append(T1DSimEnv(
+                T1DPatient.withName(names[i % 3], random_init_bg=True, seed=i),
+                CGMSensor.withName("Dexcom", seed=i),
+                InsulinPump.withName("Insulet"),
+                RandomScenario(start_time=start_time, seed=i),
+                info_level="none"))
+        for _ in range(steps):
+            for env in envs:
+                env.step(Action(basal=0.02, bolus=0))
+        t_loop = time.time() - tic
+
+        tic = time.time()
+        venv = VectorT1DSimEnv(n, patient_name=names, seed=0)
+        venv.reset()
+        for _ in range(steps):
+            obs, reward, done, info = venv.step(np.full(n, 0.02))
+        t_vec = time.time() - tic
+        print("{:3d} envs x {} steps: loop {:.1f} s ({:.0f} steps/s), vector "
+              "{:.1f} s ({:.0f} steps/s)".format(
+                  n, steps, t_loop, n * steps / t_loop, t_vec, n * steps / t_vec))
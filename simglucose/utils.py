@@ -1,22 +1,21 @@
-import pkg_resources
+from simglucose.registry import PATIENTS, QUESTS
+from simglucose.registry import CONTROL_QUEST, PATIENT_PARA_FILE
 import pandas as pd
 
-CONTROL_QUEST = pkg_resources.resource_filename('simglucose',
-                                                'params/Quest.csv')
-PATIENT_PARA_FILE = pkg_resources.resource_filename(
-    'simglucose', 'params/vpatient_params.csv')
-
 
 def fetch_patient_params(patient_name: str):
-    all_params = pd.read_csv(PATIENT_PARA_FILE)
-    patient_params = lookup_patient_meta_data(all_params, patient_name)
-    return patient_params
+    return _lookup(PATIENTS, patient_name)
 
 
 def fetch_patient_quest(patient_name: str):
-    all_quests = pd.read_csv(CONTROL_QUEST)
-    quest = lookup_patient_meta_data(all_quests, patient_name)
-    return quest
+    return _lookup(QUESTS, patient_name)
+
+
+def _lookup(table, patient_name: str) -> dict:
+    params = {}
+    if patient_name in table:
+        params = table.byName(patient_name).to_dict()
+    return params
 
 
 def lookup_patient_meta_data(df: pd.DataFrame, patient_name: str) -> dict:
@@ -0,0 +1,28 @@
+import numpy as np
+
+from simglucose.patient.batch_t1dpatient import BatchT1DPatient
+from simglucose.patient.t1dpatient import Action, T1DPatient
+from simglucose.registry import PATIENTS
+
+NAMES = PATIENTS.names[::3]
+
+
+def test_tolerances_are_per_row():
+    batch = BatchT1DPatient.withNames(NAMES)
+    integrator = batch._odesolver._integrator
+    assert np.isclose(integrator.rtol, BatchT1DPatient.RTOL / np.sqrt(len(NAMES)))
+    assert np.isclose(integrator.atol, BatchT1DPatient.ATOL / np.sqrt(len(NAMES)))
+
+
+def test_batch_matches_single_patients():
+    batch = BatchT1DPatient.withNames(NAMES)
+    basal = batch.params[:, 1] * batch.params[:, 0] / 6000
+    while batch.t < 240:
+        batch.step(80 if batch.t == 60 else 0, basal)
+
+    for j, name in enumerate(NAMES):
+        patient = T1DPatient.withName(name)
+        while patient.t < 240:
+            patient.step(Action(CHO=80 if patient.t == 60 else 0, insulin=basal[j]))
+        np.testing.assert_allclose(batch.state[j], patient.state, rtol=1e-5, atol=1e-6)
+        assert abs(batch.observation.Gsub[j] - patient.observation.Gsub) < 1e-3
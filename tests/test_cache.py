@@ -0,0 +1,85 @@
+from datetime import timedelta
+import os
+import numpy as np
+import pytest
+
+from simglucose.simulation import cache as cache_module
+from simglucose.simulation.cache import ResultCache, cell_key, library_fingerprint
+from simglucose.simulation.history import History
+from simglucose.simulation.scheduler import JobSpec, Scheduler
+
+SPEC = JobSpec("adult#001", 1, duration=timedelta(hours=1))
+
+
+def test_cell_key_is_stable_and_content_addressed():
+    assert cell_key(SPEC) == cell_key(JobSpec("adult#001", 1, duration=timedelta(hours=1)))
+    assert cell_key(SPEC) != cell_key(SPEC._replace(seed=2))
+    assert cell_key(SPEC) != cell_key(SPEC._replace(controller=("BBController", {"target": 120})))
+    assert cell_key(SPEC, "a") != cell_key(SPEC, "b")
+
+
+def test_library_fingerprint_is_deterministic(monkeypatch):
+    first = library_fingerprint()
+    monkeypatch.setattr(cache_module, "_fingerprint", None)
+    assert library_fingerprint() == first
+
+
+def make_history(n=5):
+    history = History(2)
+    for k in range(n):
+        history.append(3 * k, 100.0 + k, 101.0 + k, 0.1, 0.2, 0.3)
+        history.record_action(0.0, 0.01)
+    return history
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    history = make_history()
+    cache.save_history("k", history)
+    cache.add("k", SPEC, {"mean BG": 102.0})
+
+    reopened = ResultCache(str(tmp_path))
+    assert "k" in reopened and len(reopened) == 1
+    assert reopened.metrics("k") == {"mean BG": 102.0}
+    loaded = reopened.history("k")
+    for name in ("Time", "BG", "CGM", "CHO", "insulin", "LBGI", "HBGI", "Risk"):
+        np.testing.assert_array_equal(loaded.column(name), history.column(name))
+    frame = reopened.frame()
+    assert list(frame.key) == ["k"] and frame.patient[0] == "adult#001"
+    assert not [f for f in os.listdir(str(tmp_path)) if ".tmp" in f]
+
+
+def test_corrupt_index_line_is_skipped(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.save_history("k", make_history())
+    cache.add("k", SPEC, {"mean BG": 102.0})
+    with open(os.path.join(str(tmp_path), ResultCache.INDEX), "a") as f:
+        f.write('{"key": "half')
+    assert list(ResultCache(str(tmp_path))._index) == ["k"]
+
+
+def test_scheduler_reads_back_from_cache(tmp_path):
+    jobs = [SPEC, SPEC._replace(patient="child#001")]
+    with Scheduler("keep", processes=1, cache=str(tmp_path)) as scheduler:
+        first = scheduler.run(jobs)
+    with Scheduler("keep", processes=1, cache=str(tmp_path)) as scheduler:
+        second = scheduler.run(jobs)
+    assert [r.cached for r in first] == [False, False]
+    assert [r.cached for r in second] == [True, True]
+    for a, b in zip(first, second):
+        assert a.metrics == b.metrics
+        assert a.history.equals(b.history)
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith(".ckpt")]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_duplicate_jobs_are_simulated_once(tmp_path, processes):
+    jobs = [SPEC, SPEC, SPEC._replace(seed=2), SPEC]
+    with Scheduler("keep", processes=processes, cache=str(tmp_path)) as scheduler:
+        results = scheduler.run(jobs)
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert sum(not r.cached for r in results) == 2
+    assert results[0].metrics == results[1].metrics == results[3].metrics
+    assert results[0].history.equals(results[3].history)
+    assert len(ResultCache(str(tmp_path))) == 2
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith(".ckpt")]
@@ -0,0 +1,63 @@
+from datetime import datetime
+import numpy as np
+import pytest
+
+from simglucose.actuator.pump import InsulinPump
+from simglucose.controller.base import Action
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.scenario_gen import RandomScenario
+
+BOLUS = np.zeros(160)
+BOLUS[20] = 3.0
+
+
+def make_env(**kwargs):
+    env = T1DSimEnv(T1DPatient.withName("adolescent#003", **kwargs),
+                    CGMSensor.withName("Dexcom", seed=1),
+                    InsulinPump.withName("Insulet"),
+                    RandomScenario(start_time=datetime(2018, 1, 1, 6), seed=42),
+                    info_level="none")
+    env.reset()
+    return env
+
+
+def step_loop(env):
+    for bolus in BOLUS:
+        env.step(Action(basal=0.02, bolus=bolus))
+    return env.show_history(as_frame=False)
+
+
+def tolerance(kwargs):
+    # The default dopri5 runs one solver span per input change, and
+    # agrees with the step loop to solver tolerance; stepped solvers
+    # give the same numbers
+    return 1e-2 if not kwargs else 0
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"integrator": "BDF"}])
+def test_run_matches_step_loop(kwargs):
+    expected = step_loop(make_env(**kwargs))
+    env = make_env(**kwargs)
+    result = env.run(0.02, BOLUS)
+    history = env.show_history(as_frame=False)
+    assert result.CHO.sum() > 0
+    assert env.minute == 480
+    for name in ("Time", "CHO", "insulin"):
+        np.testing.assert_array_equal(getattr(history, name), getattr(expected, name))
+    np.testing.assert_allclose(history.BG, expected.BG, rtol=0, atol=tolerance(kwargs))
+    np.testing.assert_allclose(history.CGM, expected.CGM, rtol=0, atol=tolerance(kwargs))
+    np.testing.assert_array_equal(result.CGM, history.CGM[1:])
+
+
+def test_step_after_run_continues():
+    expected = make_env()
+    step_loop(expected)
+    expected.step(Action(basal=0.02, bolus=0))
+    env = make_env()
+    env.run(0.02, BOLUS)
+    env.step(Action(basal=0.02, bolus=0))
+    assert env.patient.t == expected.patient.t
+    assert env.history.column("BG")[-1] == pytest.approx(
+        expected.history.column("BG")[-1], abs=1e-2)
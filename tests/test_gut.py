@@ -0,0 +1,41 @@
+import os
+import numpy as np
+
+from simglucose.patient.gut import GutTraceCache
+from simglucose.patient.t1dpatient import T1DPatient
+
+MEALS = np.zeros(120)
+MEALS[10] = 40.0
+
+
+def get(cache):
+    patient = T1DPatient.withName("adult#001")
+    return cache.get(patient._model_params, patient.init_state[:3], MEALS)
+
+
+def test_traces_are_shared_through_cache_dir(tmp_path):
+    trace = get(GutTraceCache(cache_dir=str(tmp_path)))
+    files = os.listdir(str(tmp_path))
+    assert len(files) == 1 and files[0].startswith("gut_") and "tmp" not in files[0]
+
+    other = GutTraceCache(cache_dir=str(tmp_path))
+    loaded = get(other)
+    assert other.misses == 1
+    for name in trace._fields:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(trace, name))
+
+
+def test_unreadable_file_is_a_miss(tmp_path):
+    trace = get(GutTraceCache(cache_dir=str(tmp_path)))
+    filename = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    # A file cut short, as a reader racing a non-atomic writer would see
+    with open(filename, "rb") as f:
+        data = f.read()
+    with open(filename, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    recomputed = get(GutTraceCache(cache_dir=str(tmp_path)))
+    np.testing.assert_array_equal(recomputed.gut, trace.gut)
+    # The broken file was replaced by a good one
+    np.testing.assert_array_equal(get(GutTraceCache(cache_dir=str(tmp_path))).gut, trace.gut)
+    assert os.listdir(str(tmp_path)) == [os.path.basename(filename)]
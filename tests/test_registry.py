@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from simglucose.analysis.sensitivity import perturbed_params
+from simglucose.registry import PATIENTS, SENSORS
+
+
+def test_rows_match_the_csv():
+    frame = pd.read_csv(PATIENTS.filename)
+    assert PATIENTS.byName("adult#001").equals(frame.iloc[10])
+    assert PATIENTS.byID(11).equals(frame.iloc[10])
+    sensor = SENSORS.byName("Dexcom")
+    assert sensor.Name == "Dexcom" and sensor.sample_time == 3
+    with pytest.raises(KeyError):
+        PATIENTS.byName("nobody")
+    with pytest.raises(KeyError):
+        PATIENTS.byID(0)
+
+
+def test_rows_are_read_only():
+    params = PATIENTS.byName("adult#001")
+    BW = params.BW
+    with pytest.raises(ValueError):
+        params["BW"] = 1.0
+    with pytest.raises(ValueError):
+        params.iloc[2] = 1.0
+    assert PATIENTS.byName("adult#001").BW == BW
+
+    copy = params.copy()
+    copy["BW"] = 1.0
+    assert PATIENTS.byName("adult#001").BW == BW
+
+
+def test_perturbed_params_leaves_the_table_alone():
+    kabs = PATIENTS.byName("adult#001").kabs
+    assert perturbed_params("adult#001", "kabs", 2).kabs == 2 * kabs
+    assert perturbed_params("adult#001", "kp2", 1.1, rebalance=True).kp2 != \
+        PATIENTS.byName("adult#001").kp2
+    assert PATIENTS.byName("adult#001").kabs == kabs
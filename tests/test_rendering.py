@@ -0,0 +1,52 @@
+from datetime import datetime
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+
+from simglucose.actuator.pump import InsulinPump
+from simglucose.controller.base import Action
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.simulation.scenario import CustomScenario
+
+
+def make_env():
+    start = datetime(2018, 1, 1)
+    return T1DSimEnv(T1DPatient.withName("adult#001"),
+                     CGMSensor.withName("Dexcom", seed=1),
+                     InsulinPump.withName("Insulet"),
+                     CustomScenario(start, [(1, 80)]))
+
+
+def run(env, steps, bolus=0):
+    for k in range(steps):
+        env.step(Action(basal=0.02, bolus=bolus if k == 0 else 0))
+    env.render()
+
+
+def test_render_after_restore_matches_fresh_viewer():
+    env = make_env()
+    env.reset()
+    run(env, 5)
+    snapshot = env.snapshot()
+    # A large bolus and the meal widen the plotted ranges
+    run(env, 20, bolus=20)
+    env.restore(snapshot)
+    env.render()
+    viewer = env.viewer
+    assert viewer._n == len(env.history) == 6
+
+    fresh = make_env()
+    fresh.reset()
+    run(fresh, 5)
+    assert viewer._range == fresh.viewer._range
+    for ax, expected in zip(viewer.axes, fresh.viewer.axes):
+        assert ax.get_ylim() == expected.get_ylim()
+        assert ax.get_xlim() == expected.get_xlim()
+    for line, expected in zip(viewer.lines, fresh.viewer.lines):
+        np.testing.assert_array_equal(line.get_xdata(), expected.get_xdata())
+        np.testing.assert_array_equal(line.get_ydata(), expected.get_ydata())
+    env.render(close=True)
+    fresh.render(close=True)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+import os
+import pytest
+
+from simglucose.simulation.scheduler import (JobSpec, Scheduler, build_sim, grid,
+                                             seeded_grid)
+
+JOBS = grid(["adult#001", "child#001"], [1, 2], duration=timedelta(hours=1))
+
+
+def test_run_returns_results_in_job_order():
+    with Scheduler(processes=1) as scheduler:
+        results = scheduler.run(JOBS)
+    assert [r.index for r in results] == list(range(len(JOBS)))
+    assert [r.spec for r in results] == JOBS
+    assert all(r.history is None and r.path is None for r in results)
+    # The metrics are those of the true BG, which only the patient sets
+    # before the first meal
+    assert results[0].metrics == results[1].metrics
+    assert results[0].metrics != results[2].metrics
+
+
+def test_workers_match_in_process():
+    with Scheduler(processes=1) as scheduler:
+        serial = scheduler.run(JOBS)
+    with Scheduler(processes=2) as scheduler:
+        parallel = scheduler.run(JOBS)
+    assert [r.metrics for r in parallel] == [r.metrics for r in serial]
+
+
+def test_output_modes(tmp_path):
+    with Scheduler(output="keep", processes=1) as scheduler:
+        kept = scheduler.run(JOBS[:1])[0]
+    assert len(kept.history) == 21
+    with Scheduler(output="write", path=str(tmp_path), processes=1) as scheduler:
+        written = scheduler.run(JOBS[:1])[0]
+    assert written.history is None
+    assert os.path.exists(written.path)
+    assert written.metrics == kept.metrics
+
+
+def test_progress_is_reported_at_the_end():
+    calls = []
+    with Scheduler(processes=1) as scheduler:
+        list(scheduler.imap(JOBS, progress=calls.append, interval=1e9))
+    assert len(calls) == 1
+    assert calls[0].done == calls[0].total == len(JOBS)
+    assert calls[0].eta == 0
+
+
+def test_invalid_jobs_and_outputs():
+    with pytest.raises(ValueError):
+        Scheduler(output="plot")
+    with pytest.raises(ValueError):
+        Scheduler(output="write")
+    with pytest.raises(KeyError):
+        build_sim(JobSpec("adult#001", 1, controller=("MPC", {})))
+
+
+def test_seeded_grid_is_independent_of_order():
+    jobs = seeded_grid(["adult#001", "child#001"], 3, seed=7)
+    assert jobs == seeded_grid(["adult#001", "child#001"], 3, seed=7)
+    assert len({(j.seed, j.cgm_seed) for j in jobs}) == len(jobs)
+    # Adding patients does not change the seeds of the first ones
+    more = seeded_grid(["adult#001", "child#001", "adolescent#001"], 3, seed=7)
+    assert more[:len(jobs)] == jobs
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from simglucose import seeding
+from simglucose.simulation.vector_env import VectorT1DSimEnv
+from simglucose.simulation.async_vector_env import AsyncVectorT1DSimEnv
+
+
+def test_child_matches_spawn():
+    root = np.random.SeedSequence(12345)
+    spawned = root.spawn(4)[3].spawn(8)[7]
+    assert np.array_equal(seeding.child(root, 3, 7).generate_state(4),
+                          spawned.generate_state(4))
+    assert np.array_equal(seeding.child(seeding.child(12345, 3), 7).generate_state(4),
+                          spawned.generate_state(4))
+
+
+def test_cell_seeds_are_deterministic_and_independent():
+    a = seeding.cell_seeds(1, 2, 3)
+    b = seeding.cell_seeds(1, 2, 3)
+    assert a[:3] == b[:3]
+    assert a.rng.integers(1 << 30) == b.rng.integers(1 << 30)
+    assert len(set(a[:3])) == 3
+    assert all(0 <= s < 2**31 for s in a[:3])
+
+    cells = seeding.batch_seeds(0, 1000)
+    assert len({c[:3] for c in cells}) == 1000
+    assert cells[5][:3] == seeding.cell_seeds(0, 5)[:3]
+
+
+def run(env, steps=5):
+    observations = [env.reset()]
+    for _ in range(steps):
+        observations.append(env.step(np.full(env.n, 0.02))[0])
+    return np.array(observations)
+
+
+def test_vector_env_episodes_are_reproducible():
+    names = ["adult#001", "child#001"]
+    expected = run(VectorT1DSimEnv(4, patient_name=names, seed=3))
+    assert np.array_equal(run(VectorT1DSimEnv(4, patient_name=names, seed=3)), expected)
+    assert not np.array_equal(run(VectorT1DSimEnv(4, patient_name=names, seed=4)), expected)
+
+    # Environment i draws the same episodes whatever the number of workers;
+    # the rows of a worker share the adaptive steps of one integration, so
+    # the trajectories only agree to the solver tolerance
+    for workers in (1, 2):
+        with AsyncVectorT1DSimEnv(4, num_workers=workers, patient_name=names,
+                                  seed=3) as env:
+            np.testing.assert_allclose(run(env), expected, rtol=1e-8)
+
+
+def test_per_environment_seeds():
+    names = ["adult#001", "child#001"]
+    seeds = [11, 12, 13, 14]
+    expected = run(VectorT1DSimEnv(4, patient_name=names, seed=seeds))
+    assert not np.allclose(expected, run(VectorT1DSimEnv(4, patient_name=names, seed=11)))
+    with AsyncVectorT1DSimEnv(4, num_workers=2, patient_name=names, seed=seeds) as env:
+        np.testing.assert_allclose(run(env), expected, rtol=1e-8)
+        env.seed(seeds[::-1])
+        reseeded = run(env)
+    np.testing.assert_allclose(
+        reseeded, run(VectorT1DSimEnv(4, patient_name=names, seed=seeds[::-1])), rtol=1e-8)
+
+    with pytest.raises(ValueError):
+        VectorT1DSimEnv(4, seed=[1, 2])
+    with pytest.raises(ValueError):
+        AsyncVectorT1DSimEnv(4, num_workers=2, seed=[1, 2])
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+import os
+import pytest
+
+from simglucose.simulation import sim_engine
+from simglucose.simulation.sim_engine import (SimObj, batch_sim, load_checkpoint,
+                                              save_checkpoint)
+from simglucose.simulation.env import T1DSimEnv
+from simglucose.patient.t1dpatient import T1DPatient
+from simglucose.sensor.cgm import CGMSensor
+from simglucose.actuator.pump import InsulinPump
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.base import Controller, Action
+from simglucose.controller.basal_bolus_ctrller import BBController
+from simglucose.controller.pid_ctrller import PIDController
+
+PID = dict(P=-1e-4, I=-1e-7, D=-1e-3)
+
+
+def make_sim(controller, hours=6, **kwargs):
+    env = T1DSimEnv(T1DPatient.withName("adult#001"),
+                    CGMSensor.withName("Dexcom", seed=3),
+                    InsulinPump.withName("Insulet"),
+                    RandomScenario(start_time=datetime(2018, 1, 1), seed=5))
+    return SimObj(env, controller, timedelta(hours=hours), animate=False, **kwargs)
+
+
+class CountingController(Controller):
+    """A stateful controller without snapshot and restore"""
+    def __init__(self):
+        self.calls = 0
+
+    def policy(self, observation, reward, done, **info):
+        self.calls += 1
+        return Action(basal=0.01, bolus=0)
+
+    def reset(self):
+        self.calls = 0
+
+
+def test_stateful_controller_must_implement_snapshot(tmp_path):
+    sim = make_sim(CountingController(), hours=1,
+                   checkpoint_file=str(tmp_path / "a.ckpt"))
+    with pytest.raises(NotImplementedError):
+        sim.simulate()
+    with pytest.raises(NotImplementedError):
+        CountingController().restore(None)
+
+
+def test_stateless_and_pid_snapshots():
+    assert BBController().snapshot() is None
+    BBController().restore(None)
+
+    pid = PIDController(**PID)
+    pid.integrated_state, pid.prev_state = 12.0, 150.0
+    snapshot = pid.snapshot()
+    other = PIDController(**PID)
+    other.restore(snapshot)
+    assert (other.integrated_state, other.prev_state) == (12.0, 150.0)
+
+
+class CrashingPID(PIDController):
+    """Dies after a number of policy calls, as a killed process would"""
+    def __init__(self, calls, **kwargs):
+        PIDController.__init__(self, **kwargs)
+        self.calls = calls
+
+    def policy(self, *args, **kwargs):
+        self.calls -= 1
+        if self.calls < 0:
+            raise KeyboardInterrupt
+        return PIDController.policy(self, *args, **kwargs)
+
+
+def reference_results():
+    sim = make_sim(PIDController(**PID))
+    sim.simulate()
+    return sim.results()
+
+
+def test_interrupt_and_resume_matches_uninterrupted(tmp_path):
+    expected = reference_results()
+    checkpoint = str(tmp_path / "sim.ckpt")
+
+    sim = make_sim(CrashingPID(90, **PID), checkpoint_file=checkpoint,
+                   checkpoint_every=timedelta(hours=2))
+    with pytest.raises(KeyboardInterrupt):
+        sim.simulate()
+    saved = load_checkpoint(checkpoint)
+    assert not saved.finished and saved.history.Time[-1] == 240
+
+    sim = make_sim(PIDController(**PID), checkpoint_file=checkpoint,
+                   checkpoint_every=timedelta(hours=2))
+    sim.simulate()
+    resumed = sim.results()
+    assert resumed.index.equals(expected.index)
+    assert (resumed - expected).abs().max().max() == 0
+    assert load_checkpoint(checkpoint).finished
+
+
+def test_finished_checkpoint_is_only_restored(tmp_path):
+    checkpoint = str(tmp_path / "sim.ckpt")
+    sim = make_sim(PIDController(**PID), checkpoint_file=checkpoint)
+    sim.simulate()
+    expected = sim.results()
+
+    # Any policy call would raise
+    sim = make_sim(CrashingPID(0, **PID), checkpoint_file=checkpoint)
+    sim.simulate()
+    assert sim.results().equals(expected)
+
+
+def test_save_checkpoint_replaces_atomically(tmp_path, monkeypatch):
+    filename = str(tmp_path / "sim.ckpt")
+    save_checkpoint(filename, "first")
+    save_checkpoint(filename, "second")
+    assert load_checkpoint(filename) == "second"
+
+    def fail(obj, f, protocol=None):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(sim_engine.pickle, "dump", fail)
+    with pytest.raises(OSError):
+        save_checkpoint(filename, "third")
+    monkeypatch.undo()
+    assert load_checkpoint(filename) == "second"
+    assert os.listdir(str(tmp_path)) == ["sim.ckpt"]
+    assert load_checkpoint(str(tmp_path / "missing.ckpt")) is None
+
+
+def test_batch_sim_resumes_from_checkpoint_dir(tmp_path):
+    checkpoints = str(tmp_path / "checkpoints")
+    results = str(tmp_path / "results")
+    sims = [make_sim(PIDController(**PID), hours=2, path=results) for _ in range(2)]
+    first = batch_sim(sims, checkpoint_dir=checkpoints)
+    assert sorted(os.listdir(checkpoints)) == ["0_adult#001.ckpt", "1_adult#001.ckpt"]
+
+    sims = [make_sim(CrashingPID(0, **PID), hours=2, path=results) for _ in range(2)]
+    second = batch_sim(sims, checkpoint_dir=checkpoints)
+    assert all(a.equals(b) for a, b in zip(first, second))
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from simglucose.patient.steady_state import steady_state
+from simglucose.patient.t1dpatient import Action, T1DPatient
+from simglucose.registry import PATIENTS
+
+
+def residual(params, state, basal):
+    dxdt = T1DPatient.model(0, state, Action(CHO=0, insulin=basal), params,
+                            state[0] + state[1], 0)
+    return np.max(np.abs(dxdt) / np.maximum(np.abs(state), 1))
+
+
+def test_returned_states_are_equilibria():
+    held = 0
+    for name in PATIENTS.names:
+        params = T1DPatient.withName(name)._model_params
+        for BG in np.linspace(20, 600, 30):
+            try:
+                state, basal = steady_state(params, BG)
+            except ValueError:
+                continue
+            held += 1
+            assert basal >= 0
+            assert state[3] / params.Vg == pytest.approx(BG)
+            assert residual(params, state, basal) < 1e-10
+    assert held > 600
+
+
+def test_no_equilibrium_raises():
+    params = T1DPatient.withName("adolescent#008")._model_params
+    with pytest.raises(ValueError):
+        steady_state(params, 250)
+    with pytest.raises(ValueError):
+        T1DPatient.withName("adolescent#008", init_state=250)
+
+    # An explicit basal starts there anyway, off equilibrium
+    patient = T1DPatient.withName("adolescent#008", init_state=250, init_basal=0)
+    assert patient.observation.Gsub == pytest.approx(250)
+    assert residual(params, patient.state, 0) > 1e-3
+
+
+def test_patient_holds_the_requested_bg():
+    patient = T1DPatient.withName("adolescent#008", init_state=180)
+    for _ in range(60):
+        patient.step(Action(CHO=0, insulin=patient.init_basal))
+    assert patient.observation.Gsub == pytest.approx(180, abs=1e-6)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from simglucose.patient.gut import compute_gut_trace
+from simglucose.patient.t1dpatient import Action, T1DPatient
+
+MINUTES = 240
+INSULIN = np.full(MINUTES, 0.02)
+INSULIN[30] += 3.0
+CHO = np.zeros(MINUTES)
+CHO[20] = 50.0
+
+
+def step_loop(patient):
+    BG = []
+    for k in range(MINUTES):
+        patient.step(Action(CHO=CHO[k], insulin=INSULIN[k]))
+        BG.append(patient.state[3] / patient._model_params.Vg)
+    return np.array(BG)
+
+
+def gut_trace(patient):
+    return compute_gut_trace(patient._model_params, patient.init_state[:3], CHO)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"integrator": "BDF"}, {"event_driven": True},
+                                    {"gut_trace": gut_trace}])
+def test_advance_matches_step_loop(kwargs):
+    if "gut_trace" in kwargs:
+        kwargs = {"gut_trace": gut_trace(T1DPatient.withName("adult#001"))}
+    expected = step_loop(T1DPatient.withName("adult#001", **kwargs))
+    patient = T1DPatient.withName("adult#001", **kwargs)
+    trajectory = patient.advance(MINUTES, INSULIN, CHO)
+    assert patient.t == MINUTES
+    assert np.array_equal(trajectory.t, np.arange(1, MINUTES + 1))
+    if kwargs:
+        # The configured solver is stepped as by step
+        assert np.array_equal(trajectory.BG, expected)
+    else:
+        np.testing.assert_allclose(trajectory.BG, expected, rtol=1e-5)
+
+
+def test_advance_reports_times_between_steps():
+    patient = T1DPatient.withName("adult#001")
+    trajectory = patient.advance(10, 0.02, times=[0, 2.5, 10])
+    assert np.array_equal(trajectory.t, [0, 2.5, 10])
+    assert trajectory.Gsub[0] == T1DPatient.withName("adult#001").observation.Gsub
+
+    with pytest.raises(ValueError):
+        T1DPatient.withName("adult#001", integrator="BDF").advance(10, 0.02, times=[2.5])
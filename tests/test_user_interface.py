@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+
+import simglucose.simulation.user_interface as user_interface
+from simglucose.simulation.scenario_gen import RandomScenario
+from simglucose.controller.basal_bolus_ctrller import BBController
+
+# CGM readings of the first 15 minutes for cgm_seed=3, produced by the
+# simulate of the original release
+BASELINE_CGM = {
+    "adult#001": [160.93755752241984, 159.53392571697856, 158.96379398530323,
+                  158.63749731013326, 158.35844195943366, 157.93003419754285],
+    "child#001": [163.58221792247454, 162.1785861171619, 161.60845439257488,
+                  161.28215779114697, 161.00310281447193, 160.57469628897132],
+}
+
+
+def run_simulate(monkeypatch, tmp_path, **kwargs):
+    # The report figures are not under test
+    monkeypatch.setattr(user_interface, "report",
+                        lambda df, sensor, path: (df, None, None, None, None))
+    return user_interface.simulate(
+        sim_time=timedelta(hours=1),
+        scenario=RandomScenario(start_time=datetime(2018, 1, 1), seed=1),
+        controller=BBController(),
+        patient_names=["adult#001", "child#001"],
+        cgm_name="Dexcom",
+        cgm_seed=3,
+        insulin_pump_name="Insulet",
+        start_time=datetime(2018, 1, 1),
+        save_path=str(tmp_path),
+        animate=False,
+        parallel=False,
+        **kwargs)
+
+
+def noise(df, name):
+    return (df.loc[name].CGM - df.loc[name].BG).values
+
+
+def test_default_cgm_matches_baseline(monkeypatch, tmp_path):
+    df = run_simulate(monkeypatch, tmp_path)
+    for name, expected in BASELINE_CGM.items():
+        np.testing.assert_allclose(df.loc[name].CGM.values[:6], expected, rtol=0, atol=1e-9)
+    # Every patient sees the noise stream of cgm_seed, up to the averaging
+    # of CGM over each sample time
+    np.testing.assert_allclose(noise(df, "adult#001"), noise(df, "child#001"), atol=1e-3)
+
+
+def test_independent_cgm_noise(monkeypatch, tmp_path):
+    df = run_simulate(monkeypatch, tmp_path, independent_cgm_noise=True)
+    assert not np.allclose(noise(df, "adult#001"), noise(df, "child#001"))
+    again = run_simulate(monkeypatch, tmp_path, independent_cgm_noise=True)
+    np.testing.assert_array_equal(df.CGM.values, again.CGM.values)